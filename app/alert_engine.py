@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Voice alert engine shared by the camera processes.
+
+    python alert_engine.py
+
+ - every sound in violation_sounds is decoded once at startup
+   (pygame.mixer.Sound holds the PCM in memory), nothing is read from
+   disk per alert
+ - one long-lived mixer thread plays one alert at a time on one channel,
+   so front and inner alerts never talk over each other
+ - alerts are queued by priority: a SAFETY alert (eyes_closed, red_light,
+   ...) stops a playing lower-priority one and goes first; alerts still
+   queued after ALERT_MAX_AGE are dropped as stale
+ - the same alert asked for again within ALERT_DEDUPE_WINDOW (by either
+   camera) is played once
+
+Camera processes send alert names as datagrams to ALERT_SOCKET (play_alert
+in local_functions_new). Whoever holds the flock on ALERT_SOCKET.lock owns
+the engine: normally this script, started by run_all; if it is not
+running, the first camera process that raises an alert hosts the engine
+itself and the other one sends to it. A hosting camera decodes the sounds
+on a background thread, and alerts raised until they are loaded are dropped.
+"""
+
+import os
+import sys
+import time
+import heapq
+import fcntl
+import signal
+import socket
+import threading
+
+# ----------------- CONFIG -----------------
+ALERT_SOCKET = os.getenv("ALERT_SOCKET", "/tmp/adas_alerts.sock")
+ALERT_DEDUPE_WINDOW = float(os.getenv("ALERT_DEDUPE_WINDOW", "3"))   # sec
+ALERT_MAX_AGE = float(os.getenv("ALERT_MAX_AGE", "4"))               # sec an alert may wait in the queue
+MIXER_POLL = 0.05          # sec between checks of the playing channel
+# ------------------------------------------
+
+SAFETY, WARNING, INFO = 0, 1, 2
+
+SAFETY_ALERTS = {
+    "eyes_closed", "inattentive_driving", "mobile_usage", "camera_obstructed",
+    "lane_departure", "red_light", "stop", "do_not_enter", "railway_crossing",
+    "ped_crossing", "ped_zebra_cross", "person", "warning",
+}
+INFO_ALERTS = {
+    "green_light", "yellow_light", "traffic_light", "main_road", "roundabout", "no_parking",
+    "car", "truck", "bus", "motorbike", "bicycle",
+}
+
+
+def priority(name):
+    """SAFETY, WARNING or INFO; speed limit signs are informational."""
+    if name in SAFETY_ALERTS:
+        return SAFETY
+    if name in INFO_ALERTS or name.startswith("speed_limit_"):
+        return INFO
+    return WARNING
+
+
+class AlertEngine:
+    def __init__(self, sounds, dedupe_window=ALERT_DEDUPE_WINDOW, max_age=ALERT_MAX_AGE):
+        self.paths = dict(sounds)
+        self.dedupe_window = dedupe_window
+        self.max_age = max_age
+        self.sounds = {}
+        self.channel = None
+        self.queue = []            # heap of (priority, seq, name, queued_at)
+        self.seq = 0
+        self.last = {}             # name -> time it was last accepted
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+        self.counters = {"played": 0, "deduped": 0, "preempted": 0, "expired": 0, "unknown": 0}
+
+    def load(self):
+        """Init the mixer and decode every sound into memory."""
+        import pygame
+        pygame.mixer.init()
+        pygame.mixer.set_num_channels(1)
+        self.channel = pygame.mixer.Channel(0)
+        t0 = time.monotonic()
+        for name, path in self.paths.items():
+            try:
+                self.sounds[name] = pygame.mixer.Sound(path)
+            except (pygame.error, OSError) as e:
+                print(f"[ALERT] Can't load {name} ({path}): {e}")
+        print(f"[ALERT] {len(self.sounds)} sounds decoded in {time.monotonic() - t0:.1f}s")
+
+    def play(self, name):
+        """Queue an alert. False if unknown or a duplicate within the window."""
+        if name not in self.paths:
+            self.counters["unknown"] += 1
+            return False
+        now = time.monotonic()
+        with self.cond:
+            if now - self.last.get(name, -self.dedupe_window) < self.dedupe_window:
+                self.counters["deduped"] += 1
+                return False
+            self.last[name] = now
+            self.seq += 1
+            heapq.heappush(self.queue, (priority(name), self.seq, name, now))
+            self.cond.notify()
+        return True
+
+    def _next(self, playing):
+        """Pop the alert to start now, or None. Caller holds cond."""
+        while self.queue and time.monotonic() - self.queue[0][3] > self.max_age:
+            heapq.heappop(self.queue)
+            self.counters["expired"] += 1
+        if not self.queue:
+            return None
+        if playing is not None and self.channel.get_busy() and self.queue[0][0] >= playing:
+            return None
+        return heapq.heappop(self.queue)
+
+    def mixer_loop(self):
+        playing = None   # priority of the alert on the channel
+        while not self.stop_event.is_set():
+            with self.cond:
+                item = self._next(playing)
+                if item is None:
+                    busy = self.channel.get_busy()
+                    if not busy:
+                        playing = None
+                    # while a sound plays, wake up to see it finish; idle, wait for play()
+                    self.cond.wait(MIXER_POLL if busy or self.queue else 1.0)
+                    continue
+            prio, _, name, _ = item
+            sound = self.sounds.get(name)
+            if sound is None:
+                continue
+            if playing is not None and self.channel.get_busy():
+                self.channel.stop()
+                self.counters["preempted"] += 1
+            self.channel.play(sound)
+            playing = prio
+            self.counters["played"] += 1
+
+    def serve(self, sock):
+        """Queue alert names received on a bound datagram socket."""
+        sock.settimeout(1.0)
+        while not self.stop_event.is_set():
+            try:
+                data = sock.recv(256)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.play(data.decode(errors="replace").strip())
+
+    def start(self, sock=None):
+        threading.Thread(target=self.mixer_loop, daemon=True).start()
+        if sock is not None:
+            threading.Thread(target=self.serve, args=(sock,), daemon=True).start()
+
+    def stop(self, *_):
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify()
+
+
+def _claim_socket(path, blocking):
+    """(lock file, bound socket) if this process may own the engine, else None."""
+    lock = open(path + ".lock", "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        lock.close()
+        return None
+    # the lock holder is the only one binding, so a leftover socket file is stale
+    if os.path.exists(path):
+        os.remove(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    return lock, sock
+
+
+class AlertClient:
+    """
+    Sends alerts to the engine. If no engine is listening, tries to host
+    one in this process (see module docstring).
+    """
+
+    def __init__(self, sounds, path=ALERT_SOCKET):
+        self.sounds = sounds
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.engine = None
+        self._owner = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def _host(self):
+        """Claim the engine socket; the engine itself starts on a background thread."""
+        with self._lock:
+            if self._owner is not None:
+                return
+            try:
+                claimed = _claim_socket(self.path, blocking=False)
+            except OSError as e:
+                print(f"[ALERT] Can't host alert engine: {e}")
+                return
+            if claimed is None:
+                return   # another process owns (or is starting) the engine
+            self._owner = claimed
+            threading.Thread(target=self._start_engine, args=(claimed[1],), daemon=True).start()
+            print(f"[ALERT] No alert engine running, hosting it in this process ({self.path})")
+
+    def _start_engine(self, sock):
+        # decoding every sound takes seconds: never on the camera thread
+        engine = AlertEngine(self.sounds)
+        engine.load()
+        # alerts sent to the socket while loading are stale by now
+        sock.setblocking(False)
+        try:
+            while True:
+                sock.recv(256)
+        except (BlockingIOError, OSError):
+            pass
+        engine.start(sock)
+        self.engine = engine
+
+    def send(self, name):
+        if self.engine is not None:
+            return self.engine.play(name)
+        if self._owner is None:
+            try:
+                self.sock.sendto(name.encode(), self.path)
+                return True
+            except (FileNotFoundError, ConnectionRefusedError):
+                self._host()
+            except (BlockingIOError, OSError):
+                pass
+        self.dropped += 1   # no engine, or ours is still loading
+        return False
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_alerts(sounds):
+    """Process-wide alert client."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AlertClient(sounds)
+    return _client
+
+
+def main():
+    from local_functions_new import violation_sounds
+    lock, sock = _claim_socket(ALERT_SOCKET, blocking=True)
+    engine = AlertEngine(violation_sounds)
+    signal.signal(signal.SIGINT, engine.stop)
+    signal.signal(signal.SIGTERM, engine.stop)
+    engine.load()
+    engine.start(sock)
+    print(f"[ALERT] Listening on {ALERT_SOCKET}")
+    try:
+        while not engine.stop_event.wait(1.0):
+            pass
+    finally:
+        sock.close()
+        if os.path.exists(ALERT_SOCKET):
+            os.remove(ALERT_SOCKET)
+        lock.close()
+    print(f"[ALERT] {engine.counters}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Preallocated, timestamped ring of audio samples.
+
+The PortAudio callback writes int16 blocks with the wall-clock time of each
+block's first sample (from time_info.inputBufferAdcTime); readers take
+exactly [t_start, t_end] out of it, so every video segment gets the audio
+of its own time range instead of "whatever was buffered".
+
+Single writer, lock-free: write() fills the samples first and only then
+advances the published sample counter, and readers check after copying
+that the writer has not lapped them. Nothing is allocated per callback.
+
+Everything, counters included, lives in one flat buffer, so a ring can sit
+in shared memory (create_shared / attach_shared) and be written by the
+audio service and read by any number of other processes.
+"""
+
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+MAGIC = 0x41444153415231  # "ADASAR1"
+HEADER_LEN = 8
+H_MAGIC, H_RATE, H_CAPACITY, H_ANCHORS, H_WRITTEN, H_BLOCKS = range(6)
+
+
+def _layout(capacity, n_anchors):
+    """(offset, count, dtype) of header, anchor_pos, anchor_time, data."""
+    parts, off = [], 0
+    for count, dtype in ((HEADER_LEN, np.int64), (n_anchors, np.int64),
+                         (n_anchors, np.float64), (capacity, np.int16)):
+        parts.append((off, count, dtype))
+        off += count * np.dtype(dtype).itemsize
+    return parts, off
+
+
+class AudioRing:
+    def __init__(self, sample_rate, seconds, blocksize=1024, buffer=None):
+        capacity = int(sample_rate * seconds)
+        # one (first sample index, wall-clock time) anchor per written block
+        n_anchors = capacity // max(1, blocksize // 4) + 2
+        parts, size = _layout(capacity, n_anchors)
+        if buffer is None:
+            buffer = bytearray(size)
+        self.header, self.anchor_pos, self.anchor_time, self.data = (
+            np.ndarray((count,), dtype=dtype, buffer=buffer, offset=off) for off, count, dtype in parts)
+        if self.header[H_MAGIC] != MAGIC:
+            self.header[1:] = [sample_rate, capacity, n_anchors, 0, 0, 0, 0]
+            self.header[H_MAGIC] = MAGIC   # last: readers attach only once it is there
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self.n_anchors = n_anchors
+
+    @staticmethod
+    def nbytes(sample_rate, seconds, blocksize=1024):
+        capacity = int(sample_rate * seconds)
+        return _layout(capacity, capacity // max(1, blocksize // 4) + 2)[1]
+
+    # samples written so far (published counter) / blocks written so far
+    @property
+    def written(self):
+        return int(self.header[H_WRITTEN])
+
+    @property
+    def blocks(self):
+        return int(self.header[H_BLOCKS])
+
+    # ---------------- writer (audio callback) ----------------
+
+    def write(self, samples, t_first=None):
+        """Append one block; t_first is the wall-clock time of samples[0]."""
+        n = len(samples)
+        if n == 0:
+            return
+        if n > self.capacity:
+            skip = n - self.capacity
+            samples = samples[skip:]
+            if t_first is not None:
+                t_first += skip / self.sample_rate
+            n = self.capacity
+        if t_first is None:
+            t_first = time.time() - n / self.sample_rate
+        written, blocks = self.written, self.blocks
+        start = written % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = samples[:first]
+        if first < n:
+            self.data[:n - first] = samples[first:]
+        a = blocks % self.n_anchors
+        self.anchor_pos[a] = written
+        self.anchor_time[a] = t_first
+        self.header[H_BLOCKS] = blocks + 1
+        self.header[H_WRITTEN] = written + n   # publish last
+
+    @staticmethod
+    def callback_time(time_info, frames, sample_rate):
+        """Wall-clock time of the first sample of a PortAudio input block."""
+        try:
+            latency = time_info.currentTime - time_info.inputBufferAdcTime
+        except AttributeError:
+            latency = 0.0
+        if not 0.0 <= latency < 1.0:
+            # backends that report no ADC time: assume the block just finished
+            latency = frames / sample_rate
+        return time.time() - latency
+
+    # ---------------- readers ----------------
+
+    def _index_at(self, t, blocks, written):
+        """Sample index recorded at wall-clock time t (may lie outside the ring)."""
+        count = min(blocks, self.n_anchors)
+        if count == 0:
+            return written
+        first = blocks - count
+        order = np.arange(first, blocks) % self.n_anchors
+        times = self.anchor_time[order]
+        i = int(np.searchsorted(times, t, side="right")) - 1
+        i = max(i, 0)
+        a = order[i]
+        return int(self.anchor_pos[a] + round((t - self.anchor_time[a]) * self.sample_rate))
+
+    def slice(self, t_start, t_end, pad=True):
+        """
+        Samples recorded in [t_start, t_end]. With pad, parts the ring does not
+        hold (too old, or not recorded yet) are silence, so the result is
+        always exactly (t_end - t_start) * sample_rate long.
+        """
+        written, blocks = self.written, self.blocks
+        want0 = self._index_at(t_start, blocks, written)
+        want1 = want0 + int(round((t_end - t_start) * self.sample_rate))
+        oldest = max(0, written - self.capacity)
+        lo, hi = max(want0, oldest), min(want1, written)
+
+        out = np.zeros(max(0, want1 - want0) if pad else max(0, hi - lo), dtype=self.data.dtype)
+        if hi > lo:
+            dst = lo - want0 if pad else 0
+            s = lo % self.capacity
+            first = min(hi - lo, self.capacity - s)
+            out[dst:dst + first] = self.data[s:s + first]
+            if first < hi - lo:
+                out[dst + first:dst + hi - lo] = self.data[:hi - lo - first]
+            # samples the writer overwrote while we were copying are dropped
+            lapped = self.written - self.capacity - lo
+            if lapped > 0:
+                out[dst:dst + min(lapped, hi - lo)] = 0
+        return out
+
+    def latest(self, seconds):
+        """The last `seconds` of audio."""
+        end = self.written
+        n = min(int(seconds * self.sample_rate), end, self.capacity)
+        idx = (np.arange(end - n, end)) % self.capacity
+        return self.data[idx]
+
+    def read_from(self, pos):
+        """
+        Samples written since sample index pos, for streaming consumers.
+        Returns (samples, new_pos); if pos fell out of the ring, what is
+        left of it is skipped.
+        """
+        end = self.written
+        pos = max(pos, end - self.capacity)
+        idx = np.arange(pos, end) % self.capacity
+        return self.data[idx], end
+
+
+# ---------------- shared memory ----------------
+
+def create_shared(name, sample_rate, seconds, blocksize=1024):
+    """Writer side: (AudioRing, SharedMemory) in a fresh block called name."""
+    size = AudioRing.nbytes(sample_rate, seconds, blocksize)
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        # left behind by a crashed run
+        stale = shared_memory.SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    return AudioRing(sample_rate, seconds, blocksize, buffer=shm.buf), shm
+
+
+def attach_shared(name):
+    """Reader side: AudioRing over the writer's block, None while it is missing or not initialised yet."""
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except (FileNotFoundError, ValueError):   # ValueError: created, not sized yet
+        return None
+    # the writer owns the block; don't let this process' tracker unlink it on exit
+    resource_tracker.unregister(shm._name, "shared_memory")
+    # the writer writes MAGIC after the rest of the header
+    ready = False
+    if shm.size >= HEADER_LEN * 8:
+        header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        sample_rate, capacity, n_anchors = (int(header[i]) for i in (H_RATE, H_CAPACITY, H_ANCHORS))
+        parts, size = _layout(capacity, n_anchors)
+        ready = header[H_MAGIC] == MAGIC and capacity > 0 and shm.size >= size
+        del header
+    if not ready:
+        shm.close()
+        return None
+    ring = AudioRing.__new__(AudioRing)
+    ring.header, ring.anchor_pos, ring.anchor_time, ring.data = (
+        np.ndarray((count,), dtype=dtype, buffer=shm.buf, offset=off) for off, count, dtype in parts)
+    ring.sample_rate, ring.capacity, ring.n_anchors = sample_rate, capacity, n_anchors
+    ring.shm = shm  # keep the mapping alive as long as the ring
+    return ring
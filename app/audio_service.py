@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+One audio service per microphone: capture once, share with everyone.
+
+    python audio_service.py --device hw:0,0
+
+ - the PortAudio callback writes int16 blocks into a timestamped AudioRing
+   in shared memory (shm_name(device)); camera processes attach to it and
+   cut exact [start, end] slices for their segments, without a capture of
+   their own
+ - one ffmpeg encodes the stream continuously into AUDIO_SEGMENT_TIME AAC
+   segments under AUDIO_DIR/<name>/, indexed in segment_index (kind 'audio')
+ - live raw PCM (s16le, mono, AUDIO_SR) is served on a Unix socket
+   (socket_path(device)) to streaming consumers such as recoder_uploader's
+   ffmpeg (`-f s16le -i unix:<path>`) or the live stream
+
+However many consumers there are, the mic is opened once and encoded once.
+"""
+
+import os
+import re
+import sys
+import socket
+import signal
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+
+from audio_ring import create_shared
+from segment_index import get_index, PARENT_DIR
+from segment_watcher import SegmentWatcher
+
+# ----------------- CONFIG -----------------
+AUDIO_SR = 44100
+AUDIO_BLOCK = 1024
+AUDIO_RING_SECONDS = int(os.getenv("AUDIO_RING_SECONDS", "240"))
+AUDIO_BITRATE = "64k"
+AUDIO_SEGMENT_TIME = 60
+AUDIO_SEGMENT_NAME_FORMAT = "%Y-%m-%d_%H-%M-%S"
+AUDIO_DIR = os.getenv("AUDIO_DIR", os.path.join(PARENT_DIR, "record", "audio"))
+AUDIO_SOCKET_DIR = os.getenv("AUDIO_SOCKET_DIR", "/tmp")
+TAP_INTERVAL = 0.02        # sec between pushes to the encoder and socket clients
+CLIENT_SEND_TIMEOUT = 1.0  # a client slower than this is dropped
+# ------------------------------------------
+
+
+def service_name(device):
+    """File-system safe name of a capture device ("hw:0,0" -> "hw_0_0")."""
+    return re.sub(r"[^A-Za-z0-9]+", "_", str(device)).strip("_") or "default"
+
+
+def shm_name(device):
+    return f"adas_audio_{service_name(device)}"
+
+
+def socket_path(device):
+    return os.path.join(AUDIO_SOCKET_DIR, f"adas_audio_{service_name(device)}.sock")
+
+
+class AudioService:
+    def __init__(self, device):
+        self.device = device
+        self.name = service_name(device)
+        self.ring, self.shm = create_shared(shm_name(device), AUDIO_SR, AUDIO_RING_SECONDS, AUDIO_BLOCK)
+        self.outdir = os.path.join(AUDIO_DIR, self.name)
+        os.makedirs(self.outdir, exist_ok=True)
+        self.index = get_index()
+        self.clients = []
+        self.clients_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.encoder = None
+        self.counters = {"blocks": 0, "overflows": 0, "clients_dropped": 0}
+
+    # ---------------- capture ----------------
+
+    def _callback(self, indata, frames, time_info, status):
+        if status.input_overflow:
+            self.counters["overflows"] += 1
+        self.ring.write(indata[:, 0], self.ring.callback_time(time_info, frames, AUDIO_SR))
+        self.counters["blocks"] += 1
+
+    def capture(self):
+        import sounddevice as sd
+        try:
+            device = int(self.device)
+        except ValueError:
+            device = self.device
+        with sd.InputStream(samplerate=AUDIO_SR, channels=1, dtype="int16", blocksize=AUDIO_BLOCK,
+                            device=device, callback=self._callback):
+            print(f"[AUDIO] Capturing {self.device} -> shm {shm_name(self.device)}")
+            while not self.stop_event.is_set():
+                sd.sleep(200)
+
+    # ---------------- encode ----------------
+
+    def _start_encoder(self):
+        outpattern = os.path.join(self.outdir, f"{AUDIO_SEGMENT_NAME_FORMAT}.aac")
+        self.encoder = subprocess.Popen([
+            "ffmpeg", "-loglevel", "error",
+            # raw PCM needs no probing; probing would delay (and misname) the first segment
+            "-probesize", "32", "-analyzeduration", "0",
+            "-f", "s16le", "-ar", str(AUDIO_SR), "-ac", "1", "-i", "pipe:0",
+            "-c:a", "aac", "-b:a", AUDIO_BITRATE,
+            "-f", "segment", "-strftime", "1", "-segment_time", str(AUDIO_SEGMENT_TIME),
+            "-segment_format", "adts", outpattern
+        ], stdin=subprocess.PIPE)
+
+    def _segment_done(self, path, name):
+        try:
+            start = datetime.strptime(os.path.splitext(os.path.basename(path))[0],
+                                      AUDIO_SEGMENT_NAME_FORMAT).timestamp()
+        except ValueError:
+            start = os.path.getmtime(path) - AUDIO_SEGMENT_TIME
+        self.index.add(path, name, start, start + AUDIO_SEGMENT_TIME, kind="audio")
+
+    # ---------------- serve ----------------
+
+    def _accept_loop(self, server):
+        while not self.stop_event.is_set():
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                break
+            conn.settimeout(CLIENT_SEND_TIMEOUT)
+            with self.clients_lock:
+                self.clients.append(conn)
+            print(f"[AUDIO] {self.name}: client connected ({len(self.clients)} total)")
+
+    def _tap_loop(self):
+        """Push new samples to the encoder and every socket client."""
+        pos = self.ring.written
+        while not self.stop_event.wait(TAP_INTERVAL):
+            samples, pos = self.ring.read_from(pos)
+            if not len(samples):
+                continue
+            data = samples.tobytes()
+            try:
+                self.encoder.stdin.write(data)
+                self.encoder.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                print(f"[AUDIO] {self.name}: encoder exited ({self.encoder.poll()}), restarting")
+                self._start_encoder()
+            with self.clients_lock:
+                for conn in list(self.clients):
+                    try:
+                        conn.sendall(data)
+                    except OSError:
+                        self.clients.remove(conn)
+                        conn.close()
+                        self.counters["clients_dropped"] += 1
+
+    def run(self):
+        path = socket_path(self.device)
+        if os.path.exists(path):
+            os.remove(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen(8)
+
+        watcher = SegmentWatcher([(self.outdir, self.name)], self._segment_done, suffix=".aac")
+        watcher.reconcile(lambda p: self.index.get(p) is not None)
+        self._start_encoder()
+        threading.Thread(target=watcher.run, args=(self.stop_event,), daemon=True).start()
+        threading.Thread(target=self._accept_loop, args=(server,), daemon=True).start()
+        tap = threading.Thread(target=self._tap_loop, daemon=True)
+        tap.start()
+        print(f"[AUDIO] {self.name}: segments in {self.outdir}, live PCM on {path}")
+        try:
+            self.capture()
+        finally:
+            self.stop_event.set()
+            tap.join(timeout=2)
+            server.close()
+            if os.path.exists(path):
+                os.remove(path)
+            with self.clients_lock:
+                for conn in self.clients:
+                    conn.close()
+            if self.encoder and self.encoder.poll() is None:
+                self.encoder.stdin.close()
+                self.encoder.wait(timeout=5)
+            self.ring = None
+            self.shm.close()
+            self.shm.unlink()
+
+    def stop(self, *_):
+        self.stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared microphone capture service")
+    parser.add_argument("--device", default=os.getenv("AUDIO_DEVICE", "default"))
+    args = parser.parse_args()
+    service = AudioService(args.device)
+    signal.signal(signal.SIGINT, service.stop)
+    signal.signal(signal.SIGTERM, service.stop)
+    service.run()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
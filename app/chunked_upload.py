@@ -0,0 +1,182 @@
+"""
+Resumable chunked upload.
+
+Protocol (all under <base> = {API_BASE}/video/upload/sessions):
+
+    POST <base>                     {fileName, size, sha256, chunkSize, ...meta}
+                                    -> {uploadId, offset}
+    GET  <base>/<id>                -> {uploadId, offset, size, complete}
+    PUT  <base>/<id>/chunks         body = chunk bytes
+                                    headers: Upload-Offset, X-Chunk-SHA256
+                                    -> {offset}   (409 + {offset} if out of sync,
+                                                   416 if the chunk doesn't fit the file,
+                                                   422 on checksum mismatch)
+    POST <base>/<id>/complete       -> server verifies whole-file sha256
+
+Progress is persisted next to the file (<file>.upload.json) after every
+acknowledged chunk, so a retry or a process restart continues from the
+last acknowledged offset instead of from zero.
+"""
+
+import os
+import json
+import time
+import hashlib
+
+from http_client import get_client
+
+CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+CHUNK_CHECKSUM_RETRIES = 2
+STATE_SUFFIX = ".upload.json"
+
+
+class UploadError(Exception):
+    pass
+
+
+class SessionMismatch(UploadError):
+    """The server's session doesn't match the local file; start a new one."""
+
+
+def file_sha256(path, block=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def state_path(path):
+    return f"{path}{STATE_SUFFIX}"
+
+
+def load_state(path):
+    try:
+        with open(state_path(path), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_state(path, state):
+    """Atomic write, so a crash never leaves a half-written state file."""
+    tmp = state_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_path(path))
+
+
+def clear_state(path):
+    try:
+        os.remove(state_path(path))
+    except FileNotFoundError:
+        pass
+
+
+class ChunkedUploader:
+    def __init__(self, base_url, headers=None, chunk_size=CHUNK_SIZE, endpoint="video_upload",
+                 bandwidth=None):
+        self.base_url = base_url.rstrip("/")
+        self.bandwidth = bandwidth  # optional pacing: throttle(n) / report(n, seconds)
+        self.headers = dict(headers or {})
+        self.chunk_size = chunk_size
+        self.endpoint = endpoint
+        self.client = get_client()
+
+    # ---------------- session handling ----------------
+
+    def _create_session(self, path, size, sha256, meta):
+        body = dict(meta, fileName=os.path.basename(path), size=size,
+                    sha256=sha256, chunkSize=self.chunk_size)
+        resp = self.client.post_json(self.endpoint, self.base_url, body, headers=self.headers)
+        if resp.status_code >= 400:
+            raise UploadError(f"create session: HTTP {resp.status_code}: {resp.text[:200]}")
+        data = resp.json()
+        return {"uploadId": data["uploadId"], "size": size, "sha256": sha256,
+                "chunkSize": self.chunk_size, "offset": int(data.get("offset", 0)), "meta": meta}
+
+    def _server_offset(self, upload_id):
+        """Server's acknowledged offset, or None if the session is gone."""
+        resp = self.client.request(self.endpoint, "GET", f"{self.base_url}/{upload_id}",
+                                   headers=self.headers)
+        if resp.status_code == 404:
+            return None
+        if resp.status_code >= 400:
+            raise UploadError(f"session status: HTTP {resp.status_code}")
+        return int(resp.json()["offset"])
+
+    def _resume_or_create(self, path, meta):
+        size = os.path.getsize(path)
+        state = load_state(path)
+        if state and state.get("size") == size:
+            offset = self._server_offset(state["uploadId"])
+            if offset is not None:
+                state["offset"] = offset
+                return state
+            print(f"[UPLOAD] Session {state['uploadId']} expired, restarting {path}")
+        state = self._create_session(path, size, file_sha256(path), meta)
+        save_state(path, state)
+        return state
+
+    # ---------------- chunks ----------------
+
+    def _put_chunk(self, upload_id, offset, chunk):
+        headers = dict(self.headers)
+        headers.update({
+            "Content-Type": "application/octet-stream",
+            "Upload-Offset": str(offset),
+            "X-Chunk-SHA256": hashlib.sha256(chunk).hexdigest(),
+        })
+        url = f"{self.base_url}/{upload_id}/chunks"
+        for _ in range(CHUNK_CHECKSUM_RETRIES + 1):
+            if self.bandwidth is not None:
+                self.bandwidth.throttle(len(chunk))
+            t0 = time.monotonic()
+            resp = self.client.request(self.endpoint, "PUT", url, data=chunk, headers=headers)
+            if self.bandwidth is not None and resp.status_code < 400:
+                self.bandwidth.report(len(chunk), time.monotonic() - t0)
+            if resp.status_code == 422:
+                continue  # corrupted in transit, resend the same chunk
+            if resp.status_code == 409:
+                return int(resp.json()["offset"])  # server is elsewhere, follow it
+            if resp.status_code == 416:
+                # range error, not corruption: resending can't help, ask where the server is
+                server_offset = self._server_offset(upload_id)
+                if server_offset is None or server_offset == offset:
+                    raise SessionMismatch(f"chunk @{offset}: HTTP 416: {resp.text[:200]}")
+                return server_offset
+            if resp.status_code >= 400:
+                raise UploadError(f"chunk @{offset}: HTTP {resp.status_code}: {resp.text[:200]}")
+            return int(resp.json()["offset"])
+        raise UploadError(f"chunk @{offset}: checksum mismatch after {CHUNK_CHECKSUM_RETRIES + 1} tries")
+
+    def upload(self, path, meta=None):
+        """
+        Upload path, resuming any persisted progress. Returns the server's
+        JSON for the completed upload. Raises on failure with progress saved.
+        """
+        state = self._resume_or_create(path, meta or {})
+        upload_id, size = state["uploadId"], state["size"]
+        if state["offset"]:
+            print(f"[UPLOAD] Resuming {os.path.basename(path)} at {state['offset']}/{size}")
+
+        with open(path, "rb") as f:
+            while state["offset"] < size:
+                f.seek(state["offset"])
+                chunk = f.read(self.chunk_size)
+                try:
+                    state["offset"] = self._put_chunk(upload_id, state["offset"], chunk)
+                except SessionMismatch:
+                    clear_state(path)
+                    raise
+                save_state(path, state)
+
+        resp = self.client.request(self.endpoint, "POST", f"{self.base_url}/{upload_id}/complete",
+                                   headers=self.headers)
+        if resp.status_code >= 400:
+            if resp.status_code in (404, 422):
+                # session lost or whole-file hash mismatch: start over next time
+                clear_state(path)
+            raise UploadError(f"complete: HTTP {resp.status_code}: {resp.text[:200]}")
+        clear_state(path)
+        return resp.json()
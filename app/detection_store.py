@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Searchable store of what the models detected, without decoding video.
+
+Every camera-loop segment gets <segment>.det.npz next to it, one row per
+detection, column by column:
+
+    t      float64   wall-clock time of the frame
+    frame  int32     frame number within the segment
+    cls    int16     index into classes
+    conf   float16
+    box    int16[n, 4]  x1, y1, x2, y2
+    classes           class names of this segment
+
+Per-frame flags (lane_departure, fast_lane) are rows too, with an empty
+box. A per-class summary of each segment goes into segment_index's
+detections table, so a query only opens the segments that contain the
+class in the time range:
+
+    from detection_store import get_store
+    get_store().find("mobile_usage", t0=time.time() - 7 * 86400)
+
+    python detection_store.py mobile_usage --since 7d --camera INSIDE
+    python detection_store.py eyes_closed --since 1d --clips     # cut event clips
+
+find() returns hits, episodes() merges hits close in time into spans that
+event_clips / review tools can cut directly.
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime
+from collections import namedtuple
+
+import numpy as np
+
+from segment_index import get_index
+
+STORE_SUFFIX = ".det.npz"
+EPISODE_GAP = 2.0     # sec between hits that still belong to one episode
+
+Hit = namedtuple("Hit", "ts camera cls conf box path frame")
+Episode = namedtuple("Episode", "camera cls start end hits max_conf")
+
+
+def store_path(video_path):
+    return os.path.splitext(str(video_path))[0] + STORE_SUFFIX
+
+
+def to_columns(entries):
+    """detections.DetectionTrack entries -> dict of numpy columns."""
+    classes, codes = [], {}
+    t, frame, cls, conf, box = [], [], [], [], []
+    for e in entries:
+        rows = [(d[0], d[1], d[2:6]) for d in e["d"]]
+        rows += [(flag, 1.0, (0, 0, 0, 0)) for flag in e.get("flags", ())]
+        for name, score, xyxy in rows:
+            code = codes.get(name)
+            if code is None:
+                code = codes[name] = len(classes)
+                classes.append(name)
+            t.append(e["t"])
+            frame.append(e["i"])
+            cls.append(code)
+            conf.append(score)
+            box.append(xyxy)
+    return {
+        "t": np.asarray(t, dtype=np.float64),
+        "frame": np.asarray(frame, dtype=np.int32),
+        "cls": np.asarray(cls, dtype=np.int16),
+        "conf": np.asarray(conf, dtype=np.float16),
+        "box": np.asarray(box, dtype=np.int16).reshape(-1, 4),
+        "classes": np.asarray(classes, dtype=str),
+    }
+
+
+def summarize(cols):
+    """[(class, first_ts, last_ts, count, max_conf)] for the segment_index summary."""
+    out = []
+    for code, name in enumerate(cols["classes"]):
+        mask = cols["cls"] == code
+        ts = cols["t"][mask]
+        out.append((str(name), float(ts.min()), float(ts.max()), int(mask.sum()),
+                    float(cols["conf"][mask].max())))
+    return out
+
+
+class DetectionStore:
+    def __init__(self, index=None):
+        self.index = index or get_index()
+
+    def add_segment(self, video_path, camera, entries):
+        """Write the columns of one segment and index its summary."""
+        cols = to_columns(entries)
+        path = store_path(video_path)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **cols)
+        os.replace(tmp, path)
+        self.index.add_detections(video_path, camera, summarize(cols))
+        return path
+
+    @staticmethod
+    def load(video_path):
+        """Columns of one segment, or None if it has none."""
+        try:
+            with np.load(store_path(video_path)) as z:
+                return {k: z[k] for k in z.files}
+        except FileNotFoundError:
+            return None
+
+    def find(self, cls=None, t0=None, t1=None, camera=None, min_conf=0.0):
+        """Every detection of cls (any class if None) in [t0, t1], oldest first."""
+        hits = []
+        # one summary row per (segment, class): open each segment once
+        segments = {}
+        for row in self.index.detection_segments(cls, t0, t1, camera, min_conf):
+            segments.setdefault(row["path"], row["camera"])
+        for path, seg_camera in segments.items():
+            cols = self.load(path)
+            if cols is None:
+                continue
+            classes = cols["classes"]
+            mask = cols["conf"] >= min_conf
+            if cls is not None:
+                codes = np.flatnonzero(classes == cls)
+                if not len(codes):
+                    continue
+                mask &= cols["cls"] == codes[0]
+            if t0 is not None:
+                mask &= cols["t"] >= t0
+            if t1 is not None:
+                mask &= cols["t"] <= t1
+            for k in np.flatnonzero(mask):
+                hits.append(Hit(float(cols["t"][k]), seg_camera, str(classes[cols["cls"][k]]),
+                                float(cols["conf"][k]), tuple(int(v) for v in cols["box"][k]),
+                                path, int(cols["frame"][k])))
+        hits.sort(key=lambda h: h.ts)
+        return hits
+
+    def episodes(self, cls=None, t0=None, t1=None, camera=None, min_conf=0.0, gap=EPISODE_GAP):
+        """Hits merged per (camera, class) into spans with less than gap seconds between hits."""
+        open_, out = {}, []
+        for h in self.find(cls, t0, t1, camera, min_conf):
+            key = (h.camera, h.cls)
+            ep = open_.get(key)
+            if ep is not None and h.ts - ep.end <= gap:
+                open_[key] = ep._replace(end=h.ts, hits=ep.hits + 1, max_conf=max(ep.max_conf, h.conf))
+            else:
+                if ep is not None:
+                    out.append(ep)
+                open_[key] = Episode(h.camera, h.cls, h.ts, h.ts, 1, h.conf)
+        out.extend(open_.values())
+        out.sort(key=lambda e: e.start)
+        return out
+
+
+def cut_episode(index, ep, clip_dir=None):
+    """Stream-copy an episode (with the usual pre/post roll) out of its segments into a clip."""
+    from event_clips import ClipBuilder, CLIP_DIR, CLIP_PRE_ROLL, CLIP_POST_ROLL
+    t0, t1 = ep.start - CLIP_PRE_ROLL, ep.end + CLIP_POST_ROLL
+    rows = index.covering(ep.camera, t0, t1)
+    if not rows:
+        return None
+    clip_dir = clip_dir or CLIP_DIR
+    os.makedirs(clip_dir, exist_ok=True)
+    output = os.path.join(clip_dir, f"{ep.camera}_{ep.cls}_{datetime.fromtimestamp(ep.start):%Y%m%d_%H%M%S}.mp4")
+    ClipBuilder.cut(rows, t0, t1, output)
+    index.add(output, ep.camera, max(t0, rows[0]["start_ts"]), min(t1, rows[-1]["end_ts"]), kind="clip")
+    return output
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide shared store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DetectionStore()
+    return _store
+
+
+def _parse_since(value):
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if value[-1] in units:
+        return time.time() - float(value[:-1]) * units[value[-1]]
+    return time.time() - float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search recorded detections")
+    parser.add_argument("cls", nargs="?", help="class name (all classes if omitted)")
+    parser.add_argument("--since", default="1d", help="e.g. 30m, 12h, 7d")
+    parser.add_argument("--camera", help="OUTSIDE or INSIDE")
+    parser.add_argument("--min-conf", type=float, default=0.0)
+    parser.add_argument("--hits", action="store_true", help="list every detection, not episodes")
+    parser.add_argument("--clips", action="store_true", help="cut an event clip per episode")
+    args = parser.parse_args()
+
+    store = get_store()
+    t0 = _parse_since(args.since)
+    if args.hits:
+        for h in store.find(args.cls, t0, None, args.camera, args.min_conf):
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(h.ts))} {h.camera} "
+                  f"{h.cls} {h.conf:.2f} {h.box} {os.path.basename(h.path)}#{h.frame}")
+        return
+    for ep in store.episodes(args.cls, t0, None, args.camera, args.min_conf):
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ep.start))} {ep.camera} {ep.cls} "
+              f"{ep.end - ep.start:.1f}s {ep.hits} hits max {ep.max_conf:.2f}")
+        if args.clips:
+            print(f"  -> {cut_episode(store.index, ep)}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
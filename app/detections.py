@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Detection metadata kept beside the footage instead of drawn into it.
+
+The camera loops no longer call cv2.rectangle / putText: recorded frames
+stay clean, and what the models saw goes to a sidecar next to each
+segment, <segment>.det.jsonl, one line per analysed frame:
+
+    {"i": 41, "t": 1718000000.123,
+     "d": [["car", 0.91, x1, y1, x2, y2, 12.4], ["person", 0.55, x1, y1, x2, y2]],
+     "lanes": [["left_solid_white", 0.8, x1, y1, x2, y2]],
+     "flags": ["lane_departure"]}
+
+    i      frame number within the segment video
+    t      wall-clock time the frame was analysed
+    d      detections: class, confidence, box, and for vehicles in the ego
+           lane their estimated distance in metres (ranging.py)
+    lanes  lane lines (front camera)
+    flags  per-frame results such as lane_departure / fast_lane
+
+Overlays are drawn only when someone looks: the preview thread (on its
+downscaled copy) and review export:
+
+    python detections.py render Front_20240101_120000-20240101_120100.mp4 [out.mp4]
+"""
+
+import os
+import sys
+import json
+import zlib
+
+SIDECAR_SUFFIX = ".det.jsonl"
+
+
+def sidecar_path(video_path):
+    return os.path.splitext(str(video_path))[0] + SIDECAR_SUFFIX
+
+
+class DetectionTrack:
+    """Per-segment recorder for one camera loop."""
+
+    def __init__(self):
+        self.frames = 0      # frames appended to the segment so far
+        self.entries = []
+        self.last = None     # most recent entry, for overlays on frames in between
+
+    def frame(self):
+        """Count one recorded frame; returns its number within the segment."""
+        self.frames += 1
+        return self.frames - 1
+
+    def add(self, i, t, dets, lanes=None, flags=None):
+        entry = {"i": i, "t": round(t, 3), "d": dets}
+        if lanes:
+            entry["lanes"] = lanes
+        if flags:
+            entry["flags"] = flags
+        self.entries.append(entry)
+        self.last = entry
+        return entry
+
+    def take(self, kept=None):
+        """
+        Entries of the finished segment; starts the next one. kept is the
+        number of frames the segment video really has (the frame buffer is
+        bounded and may have dropped its oldest frames).
+        """
+        entries, dropped = self.entries, 0
+        if kept is not None and kept < self.frames:
+            dropped = self.frames - kept
+            entries = [dict(e, i=e["i"] - dropped) for e in entries if e["i"] >= dropped]
+        self.frames, self.entries = 0, []
+        return entries
+
+
+def write_sidecar(video_path, entries):
+    path = sidecar_path(video_path)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, separators=(",", ":")))
+            f.write("\n")
+    os.replace(tmp, path)
+    return path
+
+
+def read_sidecar(video_path):
+    """Entries of a segment, [] if it has no sidecar."""
+    try:
+        with open(sidecar_path(video_path)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+# ---------------- rendering (on demand only) ----------------
+
+def colour(name):
+    """Stable BGR colour per class name."""
+    n = zlib.crc32(name.encode())
+    return (64 + n % 192, 64 + (n >> 8) % 192, 64 + (n >> 16) % 192)
+
+
+def draw(frame, entry, scale=(1.0, 1.0)):
+    """Draw one entry onto frame in place; scale maps recorded boxes to frame size."""
+    import cv2
+    if not entry:
+        return frame
+    sx, sy = scale
+    for row in entry.get("lanes", ()):
+        name, conf, x1, y1, x2, y2 = row[:6]
+        cv2.rectangle(frame, (int(x1 * sx), int(y1 * sy)), (int(x2 * sx), int(y2 * sy)), colour(name), 1)
+    for row in entry.get("d", ()):
+        name, conf, x1, y1, x2, y2 = row[:6]
+        p1, p2 = (int(x1 * sx), int(y1 * sy)), (int(x2 * sx), int(y2 * sy))
+        c = (0, 255, 0) if len(row) > 6 else colour(name)
+        cv2.rectangle(frame, p1, p2, c, 2)
+        cv2.putText(frame, f"{name} {conf:.2f}", p1, cv2.FONT_HERSHEY_SIMPLEX, 0.6, c, 2)
+        if len(row) > 6:
+            cv2.putText(frame, f"{row[6]:.1f}m", (p1[0], p2[1] + 18), cv2.FONT_HERSHEY_COMPLEX, 0.6, (0, 0, 255), 2)
+    y = 70
+    for flag in entry.get("flags", ()):
+        cv2.putText(frame, flag, (30, y), cv2.FONT_HERSHEY_COMPLEX, 0.6, (0, 0, 255), 2)
+        y += 25
+    return frame
+
+
+def render(video_path, out_path=None):
+    """Review export: a copy of the segment with its overlays drawn in."""
+    import cv2
+    out_path = out_path or os.path.splitext(str(video_path))[0] + "_overlay.mp4"
+    by_frame = {e["i"]: e for e in read_sidecar(video_path)}
+    cap = cv2.VideoCapture(str(video_path))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+    i, current = 0, None
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        current = by_frame.get(i, current)   # hold the last result between analysed frames
+        writer.write(draw(frame, current))
+        i += 1
+    cap.release()
+    writer.release()
+    return out_path
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] != "render":
+        print(f"usage: {sys.argv[0]} render <segment.mp4> [out.mp4]")
+        sys.exit(2)
+    print(render(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None))
+
+
+if __name__ == "__main__":
+    main()
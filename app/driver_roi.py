@@ -0,0 +1,93 @@
+"""
+Driver region tracking for the inner camera.
+
+The driver sits in a stable part of the cabin image, so the inner model
+does not need the full 1280x720 frame every time:
+
+  - a full-frame pass (model at its normal size) finds the driver: the
+    union of all detections, grown by MARGIN, is the region of interest
+  - the frames in between run the model on that crop only, at ROI_IMGSZ
+    (320 instead of 640: about a quarter of the compute, and the driver
+    is still seen at a higher resolution than in the full frame)
+  - the region follows the detections with exponential smoothing
+  - a full-frame pass runs again every FULL_FRAME_EVERY frames, and at
+    once when a crop pass finds no driver (or only low-confidence boxes)
+    REACQUIRE_AFTER times in a row
+
+Boxes from crop passes are mapped back to full-frame coordinates, so
+callers (votes, sidecar, overlays) don't see the difference.
+"""
+
+import os
+
+import numpy as np
+
+# ----------------- CONFIG -----------------
+ROI_IMGSZ = int(os.getenv("INNER_ROI_IMGSZ", "320"))
+FULL_FRAME_EVERY = int(os.getenv("INNER_FULL_FRAME_EVERY", "30"))   # frames
+MARGIN = 0.35            # share of the region added on every side
+MIN_SIZE = 0.3           # min region width / height, share of the frame
+SMOOTHING = 0.3          # weight of the newest region
+REACQUIRE_CONF = 0.4     # a crop pass below this best score counts as a miss
+REACQUIRE_AFTER = 3      # misses in a row before a full-frame pass
+# ------------------------------------------
+
+
+class DriverROI:
+    def __init__(self, width, height, driver_classes=None):
+        self.width = width
+        self.height = height
+        self.driver_classes = driver_classes   # None: every class marks the driver
+        self.roi = None                        # float [x0, y0, x1, y1]
+        self.since_full = 0
+        self.misses = 0
+        self.counters = {"full": 0, "crop": 0, "reacquired": 0}
+
+    def region(self):
+        """(x0, y0, x1, y1) to run the model on, or None for a full-frame pass."""
+        if self.roi is None or self.since_full >= FULL_FRAME_EVERY or self.misses >= REACQUIRE_AFTER:
+            return None
+        x0, y0, x1, y1 = self.roi
+        return int(x0), int(y0), int(x1), int(y1)
+
+    def infer(self, model, frame, **kwargs):
+        """
+        Run model on the full frame or the crop. Returns (result, region,
+        offset); boxes of result are in region coordinates, add offset.
+        """
+        region = self.region()
+        if region is None:
+            self.counters["full"] += 1
+            return model.predict(frame, verbose=False, **kwargs)[0], None, (0, 0)
+        x0, y0, x1, y1 = region
+        crop = np.ascontiguousarray(frame[y0:y1, x0:x1])
+        self.counters["crop"] += 1
+        return model.predict(crop, imgsz=ROI_IMGSZ, verbose=False, **kwargs)[0], region, (x0, y0)
+
+    def update(self, boxes, classes, scores, full):
+        """Detections of the pass just run, in full-frame coordinates."""
+        self.since_full = 0 if full else self.since_full + 1
+        keep = [i for i, c in enumerate(classes) if self.driver_classes is None or c in self.driver_classes]
+        best = max((scores[i] for i in keep), default=0.0)
+        if not keep or best < REACQUIRE_CONF:
+            if full:
+                self.roi = None          # nobody there; keep looking at the full frame
+            else:
+                self.misses += 1
+                if self.misses == REACQUIRE_AFTER:
+                    self.counters["reacquired"] += 1
+            return
+        self.misses = 0
+        b = np.asarray([boxes[i] for i in keep], dtype=float)
+        x0, y0 = b[:, 0].min(), b[:, 1].min()
+        x1, y1 = b[:, 2].max(), b[:, 3].max()
+        w = max(x1 - x0, MIN_SIZE * self.width)
+        h = max(y1 - y0, MIN_SIZE * self.height)
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        w, h = w * (1 + 2 * MARGIN), h * (1 + 2 * MARGIN)
+        new = np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+        if self.roi is not None and not full:
+            new = SMOOTHING * new + (1 - SMOOTHING) * self.roi
+        new[[0, 2]] = np.clip(new[[0, 2]], 0, self.width)
+        new[[1, 3]] = np.clip(new[[1, 3]], 0, self.height)
+        self.roi = new
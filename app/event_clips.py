@@ -0,0 +1,174 @@
+"""
+Event clips cut from already-encoded segments.
+
+For an event at t the clip covers [t - CLIP_PRE_ROLL, t + CLIP_POST_ROLL].
+It is built by stream-copying the covering segments (found through
+segment_index) with ffmpeg's concat demuxer and inpoint/outpoint, so there
+is no re-encode and a clip costs roughly a file copy.
+
+Stream-copy cuts land on keyframes, so every encoder feeding the index must
+emit a keyframe each KEYFRAME_INTERVAL seconds (keyframe_args()). Recorder
+segments are written as fragmented MP4, one fragment per GOP
+(FRAGMENTED_MP4_OPTS), so the segment still being recorded is readable up to
+its last GOP and a clip is ready about KEYFRAME_INTERVAL after the post-roll
+ends. Camera-loop segments are only encoded once they end, so their clips
+wait for that (at most CLIP_WAIT_MAX).
+"""
+
+import os
+import time
+import heapq
+import itertools
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+from segment_index import get_index, PARENT_DIR
+from gps_track import get_track, write_gps_sidecar
+
+# ----------------- CONFIG -----------------
+KEYFRAME_INTERVAL = 1      # sec, GOP length of every encoder
+CLIP_PRE_ROLL = int(os.getenv("CLIP_PRE_ROLL", "10"))
+CLIP_POST_ROLL = int(os.getenv("CLIP_POST_ROLL", "10"))
+CLIP_DIR = os.getenv("CLIP_DIR", os.path.join(PARENT_DIR, "record", "clips"))
+CLIP_WAIT_MAX = 180        # sec to wait for covering segments, then cut what exists
+CLIP_POLL = 0.5            # sec between readiness checks
+FFMPEG_TIMEOUT = 30
+
+FRAGMENTED_MP4_OPTS = "movflags=+frag_keyframe+empty_moov+default_base_moof:flush_packets=1"
+# ------------------------------------------
+
+
+def keyframe_args(fps):
+    """x264 options for a fixed GOP of KEYFRAME_INTERVAL seconds (no scene-cut keyframes)."""
+    gop = max(1, int(round(fps * KEYFRAME_INTERVAL)))
+    return ["-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+            "-force_key_frames", f"expr:gte(t,n_forced*{KEYFRAME_INTERVAL})"]
+
+
+class ClipRequest:
+    __slots__ = ("camera", "label", "event_ts", "t0", "t1", "due", "deadline")
+
+    def __init__(self, camera, label, event_ts, t0, t1):
+        self.camera = camera
+        self.label = label
+        self.event_ts = event_ts
+        self.t0 = t0
+        self.t1 = t1
+        self.due = t1 + KEYFRAME_INTERVAL
+        self.deadline = t1 + CLIP_WAIT_MAX
+
+
+class ClipBuilder:
+    """
+    Background clip cutter. request() is cheap and non-blocking; overlapping
+    requests for the same camera are merged into one longer clip.
+    on_ready(path, camera, t0, t1, label) is called for every finished clip.
+    """
+
+    def __init__(self, index=None, clip_dir=CLIP_DIR, pre_roll=CLIP_PRE_ROLL,
+                 post_roll=CLIP_POST_ROLL, on_ready=None):
+        self.index = index or get_index()
+        self.clip_dir = clip_dir
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.on_ready = on_ready
+        os.makedirs(clip_dir, exist_ok=True)
+
+        self._heap = []       # (due, seq, request)
+        self._pending = {}    # camera -> latest not-yet-cut request
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def request(self, event_ts, camera, label="event"):
+        t0, t1 = event_ts - self.pre_roll, event_ts + self.post_roll
+        with self._cond:
+            req = self._pending.get(camera)
+            if req is not None and t0 <= req.t1:
+                # overlaps the clip still waiting for its post-roll: extend it
+                req.t1 = max(req.t1, t1)
+                req.due = req.t1 + KEYFRAME_INTERVAL
+                req.deadline = req.t1 + CLIP_WAIT_MAX
+            else:
+                req = self._pending[camera] = ClipRequest(camera, label, event_ts, t0, t1)
+            heapq.heappush(self._heap, (req.due, next(self._seq), req))
+            self._cond.notify()
+
+    # ---------------- worker ----------------
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._cond.wait(timeout)
+                due, _, req = heapq.heappop(self._heap)
+                if due != req.due:
+                    continue  # superseded by an extension
+            try:
+                self._try_build(req)
+            except Exception as e:
+                print(f"[CLIP] Failed {req.camera} {req.label}: {e}")
+
+    def _try_build(self, req):
+        rows = self.index.covering(req.camera, req.t0, req.t1)
+        if not self._ready(rows, req.t1) and time.time() < req.deadline:
+            with self._cond:
+                req.due = time.time() + CLIP_POLL
+                heapq.heappush(self._heap, (req.due, next(self._seq), req))
+            return
+        with self._cond:
+            # from here on new events start a new clip
+            if self._pending.get(req.camera) is req:
+                del self._pending[req.camera]
+        if not rows:
+            print(f"[CLIP] No footage for {req.camera} {req.label} at {req.event_ts:.0f}")
+            return
+        name = f"{req.camera}_{req.label}_{datetime.fromtimestamp(req.event_ts):%Y%m%d_%H%M%S}.mp4"
+        output = os.path.join(self.clip_dir, name)
+        t_start = time.time()
+        self.cut(rows, req.t0, req.t1, output)
+        self.index.add(output, req.camera, max(req.t0, rows[0]["start_ts"]),
+                       min(req.t1, rows[-1]["end_ts"]), kind="clip")
+        track = get_track()
+        if track is not None:
+            write_gps_sidecar(output, track, req.t0, req.t1, req.event_ts)
+        print(f"[CLIP] {name} ready in {time.time() - t_start:.2f}s "
+              f"({time.time() - req.t1:.2f}s after post-roll)")
+        if self.on_ready:
+            self.on_ready(output, req.camera, req.t0, req.t1, req.label)
+
+    @staticmethod
+    def _ready(rows, t1):
+        """Footage up to t1 is on disk: last covering file is finished, or it is
+        still being written and t1 is at least one GOP behind the live edge."""
+        if not rows or rows[-1]["end_ts"] < t1:
+            return False
+        last = rows[-1]
+        return bool(last["complete"]) or time.time() >= t1 + KEYFRAME_INTERVAL
+
+    @staticmethod
+    def cut(rows, t0, t1, output):
+        """Stream-copy [t0, t1] out of the given segments into output."""
+        lines = []
+        for row in rows:
+            lines.append(f"file '{os.path.abspath(row['path'])}'")
+            if t0 > row["start_ts"]:
+                lines.append(f"inpoint {t0 - row['start_ts']:.3f}")
+            if t1 < row["end_ts"]:
+                lines.append(f"outpoint {t1 - row['start_ts']:.3f}")
+        fd, list_path = tempfile.mkstemp(suffix=".txt", prefix="clip_")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write("\n".join(lines) + "\n")
+            subprocess.run([
+                "ffmpeg", "-y", "-loglevel", "error", "-xerror",
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-c", "copy", "-avoid_negative_ts", "make_zero",
+                output
+            ], check=True, timeout=FFMPEG_TIMEOUT, stdout=subprocess.DEVNULL)
+        finally:
+            os.remove(list_path)
+        return output
@@ -0,0 +1,119 @@
+"""
+Cheap per-frame image-quality gate, run before any model.
+
+Statistics come from a QUALITY_SIZE grayscale copy of the frame, so they
+cost well under a millisecond:
+
+    mean / std      brightness and contrast
+    lap_var         Laplacian variance: texture / focus
+    dark, bright    share of pixels below DARK_LEVEL / above BRIGHT_LEVEL
+    lights          share of pixels above LIGHT_LEVEL: head-, tail- and street lights
+    diff            mean absolute difference to the previous frame
+
+Per frame the verdict is one of
+
+    ok
+    blackout    almost everything dark (lens covered tight, sensor dead);
+                with dark_scene (front camera: an unlit road at night is
+                just as dark) also no texture and no lights in view
+    obstructed  no texture and no contrast (hand, cloth, dirt, fog)
+    glare       a large share of the image saturated
+    frozen      the exact same image for FROZEN_TIME (camera stuck)
+
+and anything but ok is not worth running a model on (usable=False).
+blackout / obstructed / frozen kept up for OBSTRUCTED_TIME make the
+camera obstructed (the camera_obstructed alert and event), i.e. within a
+second instead of after 10 s without a driver detection.
+"""
+
+import os
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# ----------------- CONFIG -----------------
+QUALITY_SIZE = (80, 45)
+DARK_LEVEL = 20
+BRIGHT_LEVEL = 250
+BLACKOUT_DARK = 0.95         # share of dark pixels
+BLACKOUT_MEAN = 15
+LIGHT_LEVEL = 120
+NIGHT_LIGHTS = 0.002         # share of light pixels that makes a dark frame a night scene
+OBSTRUCTED_LAP = float(os.getenv("QUALITY_OBSTRUCTED_LAP", "8"))
+OBSTRUCTED_STD = 10
+GLARE_BRIGHT = 0.35          # share of saturated pixels
+FROZEN_DIFF = 0.05
+FROZEN_TIME = 2.0            # sec
+OBSTRUCTED_TIME = 0.5        # sec
+# ------------------------------------------
+
+Quality = namedtuple("Quality", "status usable obstructed stats")
+
+
+class QualityGate:
+    def __init__(self, name, dark_scene=False):
+        self.name = name
+        self.dark_scene = dark_scene   # the view itself may be dark (road at night)
+        self.prev = None
+        self.bad_since = None      # first frame of the current blackout / obstructed / frozen run
+        self.same_since = None
+        self.obstructed = False
+        self.counters = {"frames": 0, "ok": 0, "blackout": 0, "obstructed": 0, "glare": 0, "frozen": 0}
+
+    def stats(self, frame):
+        small = cv2.resize(frame, QUALITY_SIZE, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        hist = np.bincount(small.reshape(-1), minlength=256)
+        n = small.size
+        st = {
+            "mean": float(small.mean()),
+            "std": float(small.std()),
+            "lap_var": float(cv2.Laplacian(small, cv2.CV_32F).var()),
+            "dark": float(hist[:DARK_LEVEL].sum() / n),
+            "bright": float(hist[BRIGHT_LEVEL:].sum() / n),
+            "lights": float(hist[LIGHT_LEVEL:].sum() / n),
+            "diff": float(np.abs(small.astype(np.int16) - self.prev).mean()) if self.prev is not None else None,
+        }
+        self.prev = small.astype(np.int16)
+        return st
+
+    def _night_scene(self, st):
+        """A dark frame that still shows texture or lights: the road at night, not a covered lens."""
+        return self.dark_scene and (st["lap_var"] >= OBSTRUCTED_LAP or st["lights"] >= NIGHT_LIGHTS)
+
+    def check(self, frame, t):
+        self.counters["frames"] += 1
+        st = self.stats(frame)
+        if st["diff"] is not None and st["diff"] < FROZEN_DIFF:
+            self.same_since = self.same_since or t
+        else:
+            self.same_since = None
+
+        dark = st["dark"] >= BLACKOUT_DARK and st["mean"] < BLACKOUT_MEAN
+        night = dark and self._night_scene(st)   # too dark for the contrast rule as well
+        if dark and not night:
+            status = "blackout"
+        elif not night and st["lap_var"] < OBSTRUCTED_LAP and st["std"] < OBSTRUCTED_STD:
+            status = "obstructed"
+        elif st["bright"] >= GLARE_BRIGHT:
+            status = "glare"
+        elif self.same_since is not None and t - self.same_since >= FROZEN_TIME:
+            status = "frozen"
+        else:
+            status = "ok"
+        self.counters[status] += 1
+
+        if status in ("blackout", "obstructed", "frozen"):
+            self.bad_since = self.bad_since or t
+            if not self.obstructed and t - self.bad_since >= OBSTRUCTED_TIME:
+                self.obstructed = True
+                print(f"[QUALITY] {self.name}: camera {status} (mean {st['mean']:.0f}, std {st['std']:.1f}, lap {st['lap_var']:.1f}, bright {st['bright']:.2f})")
+        else:
+            if self.obstructed and status == "ok":
+                print(f"[QUALITY] {self.name}: camera clear again")
+            if status == "ok":
+                self.obstructed = False
+            self.bad_since = None
+        return Quality(status, status == "ok", self.obstructed, st)
@@ -0,0 +1,195 @@
+"""
+Raw camera frames shared between processes through POSIX shared memory.
+
+recoder_uploader runs one ffmpeg per camera that decodes the camera once and
+writes both the recorded segments and raw BGR frames on stdout. A FrameRing
+copies those frames into a small ring of slots in shared memory; inference
+processes attach with SharedFrameCapture, which reads like cv2.VideoCapture.
+No v4l2loopback device, no second decode.
+
+Layout of the block:
+
+    header   int64[8]      magic, width, height, channels, slots, latest seq, fps * 1000, 0
+    slot_seq int64[slots]  seq of the frame in each slot (-1 while being written)
+    slot_ts  float64[slots] wall-clock capture time of each slot
+    frames   uint8[slots, height, width, channels]
+
+There is one writer per block. Readers copy the latest slot and check its
+seq afterwards (seqlock), so they never block the writer and never return
+a half-written frame.
+"""
+
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+MAGIC = 0x41444153465231  # "ADASFR1"
+HEADER_LEN = 8
+H_MAGIC, H_WIDTH, H_HEIGHT, H_CHANNELS, H_SLOTS, H_LATEST, H_FPS = range(7)
+DEFAULT_SLOTS = 3
+READ_TIMEOUT = 2.0   # sec without a new frame -> read() returns (False, None)
+READ_POLL = 0.002
+
+
+def _views(buf, width, height, channels, slots):
+    header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=buf)
+    off = header.nbytes
+    slot_seq = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=off)
+    off += slot_seq.nbytes
+    slot_ts = np.ndarray((slots,), dtype=np.float64, buffer=buf, offset=off)
+    off += slot_ts.nbytes
+    frames = np.ndarray((slots, height, width, channels), dtype=np.uint8, buffer=buf, offset=off)
+    return header, slot_seq, slot_ts, frames
+
+
+def _block_size(width, height, channels, slots):
+    return 8 * HEADER_LEN + 16 * slots + slots * width * height * channels
+
+
+class FrameRing:
+    """Writer side: owns the shared memory block."""
+
+    def __init__(self, name, width, height, channels=3, fps=30, slots=DEFAULT_SLOTS):
+        size = _block_size(width, height, channels, slots)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left behind by a crashed run
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = name
+        self.frame_bytes = width * height * channels
+        self.header, self.slot_seq, self.slot_ts, self.frames = _views(self.shm.buf, width, height, channels, slots)
+        self.slot_seq[:] = -1
+        self.header[1:] = [width, height, channels, slots, -1, int(fps * 1000), 0]
+        self.header[H_MAGIC] = MAGIC   # last: readers attach only once it is there
+        self.seq = -1
+
+    def begin(self):
+        """Writable flat uint8 view of the next slot."""
+        slot = (self.seq + 1) % len(self.slot_seq)
+        self.slot_seq[slot] = -1
+        return self.frames[slot].reshape(-1)
+
+    def commit(self, ts=None):
+        """Publish the slot filled since begin()."""
+        self.seq += 1
+        slot = self.seq % len(self.slot_seq)
+        self.slot_ts[slot] = time.time() if ts is None else ts
+        self.slot_seq[slot] = self.seq
+        self.header[H_LATEST] = self.seq
+
+    def pump(self, stream, stop_event=None):
+        """Fill the ring from a raw video byte stream (e.g. ffmpeg stdout) until EOF."""
+        while stop_event is None or not stop_event.is_set():
+            view = memoryview(self.begin())
+            got = 0
+            while got < self.frame_bytes:
+                n = stream.readinto(view[got:])
+                if not n:
+                    return
+                got += n
+            self.commit()
+
+    def close(self):
+        del self.header, self.slot_seq, self.slot_ts, self.frames
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedFrameCapture:
+    """
+    Reader side, a drop-in for the parts of cv2.VideoCapture the camera loops
+    use: isOpened(), read(), get(CAP_PROP_FRAME_WIDTH / HEIGHT / FPS), release().
+    read() returns the newest frame not returned yet, so a slow reader skips
+    frames instead of falling behind.
+    """
+
+    def __init__(self, name, timeout=READ_TIMEOUT, wait_for_writer=30.0):
+        self.name = name
+        self.timeout = timeout
+        self.shm = None
+        self.width = self.height = self.channels = 0
+        self.fps = 0.0
+        self.last_ts = None
+        if not self._attach(wait_for_writer):
+            print(f"[FRAMES] No shared frames '{name}' (is recoder_uploader running?)")
+
+    def _open(self):
+        """The writer's block, or None while it is missing or not initialised yet."""
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+        except (FileNotFoundError, ValueError):   # ValueError: created, not sized yet
+            return None
+        # the writer owns the block; don't let this process' tracker unlink it on exit
+        resource_tracker.unregister(shm._name, "shared_memory")
+        # the writer writes MAGIC after the rest of the header
+        if shm.size < HEADER_LEN * 8 or np.ndarray((1,), dtype=np.int64, buffer=shm.buf)[H_MAGIC] != MAGIC:
+            shm.close()
+            return None
+        return shm
+
+    def _attach(self, wait):
+        deadline = time.time() + wait
+        while True:
+            shm = self._open()
+            if shm is not None:
+                self.shm = shm
+                break
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.5)
+        header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=self.shm.buf)
+        self.width, self.height, self.channels, slots = (int(header[i]) for i in
+                                                         (H_WIDTH, H_HEIGHT, H_CHANNELS, H_SLOTS))
+        self.fps = header[H_FPS] / 1000.0
+        self.header, self.slot_seq, self.slot_ts, self.frames = _views(
+            self.shm.buf, self.width, self.height, self.channels, slots)
+        self.last_seq = -1
+        return True
+
+    def isOpened(self):
+        return self.shm is not None
+
+    def read(self):
+        if self.shm is None and not self._attach(0):
+            return False, None
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            seq = int(self.header[H_LATEST])
+            if seq > self.last_seq:
+                slot = seq % len(self.slot_seq)
+                frame = self.frames[slot].copy()
+                ts = float(self.slot_ts[slot])
+                if self.slot_seq[slot] == seq:   # not overwritten while copying
+                    self.last_seq, self.last_ts = seq, ts
+                    return True, frame
+                continue
+            if seq < self.last_seq:
+                self.last_seq = -1   # writer restarted
+                continue
+            time.sleep(READ_POLL)
+        # no frames: the writer may have restarted with a new block
+        self.release()
+        self._attach(0)
+        return False, None
+
+    def get(self, prop):
+        import cv2
+        return {cv2.CAP_PROP_FRAME_WIDTH: self.width,
+                cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+                cv2.CAP_PROP_FPS: self.fps}.get(prop, 0)
+
+    def set(self, prop, value):
+        return False  # format is fixed by the capturing ffmpeg
+
+    def release(self):
+        if self.shm is not None:
+            del self.header, self.slot_seq, self.slot_ts, self.frames
+            self.shm.close()
+            self.shm = None
@@ -1,3 +1,4 @@
+import os
 import cv2
 import time
 import json
@@ -14,38 +15,41 @@ from local_functions_new import (
     LANE_MODEL, 
     CAMERA_TYPE,
     AUDIO_DEVICE_FRONT,
+    FRAME_SOURCE,
+    FRAME_SHM_FRONT,
     VIDEO_SEGMENT_LEN,
-    REF_IMAGES,
     EVENT_CHOICE,
-    get_width, 
-    getColours,
     save_upload_in_background,
     save_event_in_background,
     play_alert, 
-    is_lane_departure_and_fast_lane, 
+    check_to_fast_lane,
     audio_record_loop
 )
 from collections import deque
+from frame_share import SharedFrameCapture
+from preview import make_preview
+from detections import DetectionTrack
+from tracker import Tracker, LOW_CONF
+from ranging import Ranger, lead_vehicle, too_close, own_speed
+from lane_tracker import LaneTracker, lane_lines
+from frame_quality import QualityGate
+from motion_gate import MotionGate
+from telemetry import get_telemetry
 
 # Detect platform and set camera source
 CAMERA_INDEX = 6
 os_name = platform.system()
 is_windows = os_name == 'Windows'
 COOLDOWN_THRESHOLD = 30
+ANALYSE_EVERY = 2                                       # votes / distance / sidecar every 2nd frame
+DETECT_EVERY = int(os.getenv("FRONT_DETECT_EVERY", "4"))  # detector keyframes; tracker in between
+LANE_RATE = float(os.getenv("LANE_RATE", "3"))             # lane model runs per second; tracked in between
+IDLE_RATE = float(os.getenv("FRONT_IDLE_RATE", "1"))       # heartbeat runs per second while parked
 
 VIOLATION_CLASSES = {
     'lane_departure', 'fast_lane', 'follow_distance', 'shoulder_stop', 'red_light', 'stop'
 }
 
-# Define known measurements for distance estimation
-known_distance = {"truck": 7, "car": 7}  # meters
-known_width = {"truck": 2.45, "car": 1.8}  # meters
-
-# UI elements
-GREEN = (0, 255, 0)
-RED = (0, 0, 255)
-fonts = cv2.FONT_HERSHEY_COMPLEX
-
 # Load YOLO models
 model_lane = YOLO(MODEL_PATH + LANE_MODEL)
 front_model = YOLO(MODEL_PATH + FRONT_MODEL)
@@ -56,31 +60,14 @@ buffer_len = 10
 class_buffer = {cls: deque([0] * buffer_len, maxlen=buffer_len) for cls in object_class}
 cooldown_class = {cls: 0 for cls in object_class}
 
-# Load reference images and compute scale factors for distance estimation
-ref_image_truck = cv2.imread(REF_IMAGES + "truck.jpg")
-ref_image_car = cv2.imread(REF_IMAGES + "car.jpg")
-
-ref_image_width = {
-    "truck": ref_image_truck.shape[1],
-    "car": ref_image_car.shape[1],
-}
-
-object_width_in_ref = {
-    "truck": get_width(ref_image_truck, front_model, "truck"),
-    "car": get_width(ref_image_car, front_model, "car"),
-}
-
-normalized_width_ref = {
-    cls: object_width_in_ref[cls] / ref_image_width[cls] for cls in known_distance
-}
-
-scale_factor = {
-    cls: known_distance[cls] * normalized_width_ref[cls] for cls in known_distance
-}
-
 # Initialize video capture
 
-if is_windows:
+if FRAME_SOURCE == "shm":
+    # kadrlar recoder_uploader ffmpeg'idan: qayta decode yo‘q, v4l2loopback yo‘q
+    cap = SharedFrameCapture(FRAME_SHM_FRONT)
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+elif is_windows:
     cap = cv2.VideoCapture(CAMERA_INDEX, cv2.CAP_DSHOW)
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
@@ -99,7 +86,6 @@ else:
         frame_width = cap.width
         frame_height = cap.height
 
-middle_x = frame_width // 2
 departure_threshold = frame_width // 15
 
 frame_id = 0
@@ -120,13 +106,25 @@ segment_end = segment_start + timedelta(seconds=VIDEO_SEGMENT_LEN)
 # ---------------- START AUDIO ------------------
 import threading
 threading.Thread(target=audio_record_loop, args=(AUDIO_DEVICE_FRONT,), daemon=True).start()
+get_telemetry()   # CAN reader up before the first event, so payloads only read its snapshot
+
+preview = make_preview("front", "ADAS View")
+track = DetectionTrack()
+tracker = Tracker(high_conf=0.4)   # same score a detection needed to count before
+ranger = Ranger(frame_width, frame_height)   # distance / TTC from camera calibration (FRONT_CAM_*)
+lane_tracker = LaneTracker(frame_width, frame_height, departure_threshold)
+last_lane_run = 0.0
+lanes = []
+quality_gate = QualityGate("front", dark_scene=True)
+motion_gate = MotionGate("front", IDLE_RATE)
+obstructed_alerted = 0
 
 print("[INFO] Front camera started...")
 
 # Main loop
 while True:
     # -------- Read frame --------
-    if CAMERA_TYPE == "usb":
+    if FRAME_SOURCE == "shm" or CAMERA_TYPE == "usb":
         ret, frame = cap.read()
         if not ret:
             continue
@@ -137,48 +135,72 @@ while True:
     
     frame_id += 1
     frame_buffer.append(frame)
+    frame_no = track.frame()
 
-    # Reset class detection buffer
-    for cls in object_class:
-        class_buffer[cls].append(0)
-    if frame_id % 2 == 0:
-        results = front_model.predict(frame, verbose=False)
-        result = results[0]
-        class_names = result.names
-        for box in result.boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            cls_id = int(box.cls[0])
-            class_name = class_names[cls_id]
-
-            conf = float(box.conf[0])
-            if conf < 0.4:
-                continue
+    analyse = False
+    if frame_id % ANALYSE_EVERY == 0:
+        now = time.time()
+        # cheap image check first: no model on a covered / black / glared frame (frame_quality.py)
+        quality = quality_gate.check(frame, now)
+        if quality.obstructed and now - obstructed_alerted >= COOLDOWN_THRESHOLD:
+            obstructed_alerted = now
+            play_alert("camera_obstructed")
+            enqueue_event(EVENT_CHOICE["camera_obstructed"], camera_type="OUTSIDE")
+        if not quality.usable:
+            track.add(frame_no, now, [], flags=[quality.status])
+        # parked with nothing moving in view: heartbeat runs only (motion_gate.py)
+        analyse = quality.usable and motion_gate.due(now, quality.stats["diff"])
+    if analyse:
+        # one vote slot per model run, so the share of votes means the same at any run rate
+        for cls in object_class:
+            class_buffer[cls].append(0)
+        keyframe = frame_id % DETECT_EVERY == 0 or motion_gate.idle
+        if keyframe:
+            # detector only on keyframes (low conf: weak boxes keep tracks alive, tracker.py)
+            result = front_model.predict(frame, conf=LOW_CONF, verbose=False)[0]
+            boxes = result.boxes
+            tracks = tracker.update(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(),
+                                    [result.names[int(c)] for c in boxes.cls], now)
+        else:
+            tracks = tracker.predict(now)
+        # distance of every vehicle in the ego lane; follow distance by time headway / TTC
+        ranges = ranger.update(tracks, now, own_speed())
+        following = too_close(lead_vehicle(ranges))
+        if following:
+            class_buffer["follow_distance"][-1] = 1
+        distance_by_id = {r.track_id: r.distance for r in ranges if r.in_lane}
+        dets = []
+        # only confirmed tracks vote, so a one-frame false positive never does
+        for trk in tracks:
+            x1, y1, x2, y2 = map(int, trk.box)
+            class_name = trk.cls
+            conf = trk.score
 
             if class_name in VIOLATION_CLASSES:
                 class_buffer[class_name][-1] = 1
 
-            # Estimate distance if object is centered
-            if x1 < middle_x < x2 and class_name in ["car", "truck"]:
-                obj_width_in_frame = x2 - x1
-                normalized_width = obj_width_in_frame / frame_width
-                if normalized_width > 0:
-                    distance = scale_factor[class_name] / normalized_width
-                    cv2.putText(frame, f"Distance = {distance:.2f}m", (50, 50), fonts, 0.6, RED, 2)
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (GREEN), 2)
-                    cv2.putText(frame, f'{class_name} {conf:.2f}', (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (GREEN), 2)
-                    if distance < 3:
-                        class_buffer["follow_distance"][-1] = 1
-            else:
-                colour = getColours(cls_id)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), colour, 2)
-                cv2.putText(frame, f'{class_name} {conf:.2f}', (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, 0.7, colour, 2)
+            # boxes are not drawn into the frame: they go to the segment's sidecar (detections.py)
+            det = [class_name, round(conf, 2), x1, y1, x2, y2]
+            if trk.id in distance_by_id:
+                det.append(round(distance_by_id[trk.id], 2))
+            dets.append(det)
 
-        # Lane departure detection
-        frame, lane_departure, fast_lane = is_lane_departure_and_fast_lane(model_lane, frame, departure_threshold, middle_x, frame_height)
+        # Lane departure detection: lane model at LANE_RATE, decisions from the tracked lines
+        if now - last_lane_run >= 1.0 / LANE_RATE:
+            lanes = lane_lines(model_lane, frame)
+            lane_state = lane_tracker.update(lanes, now)
+            last_lane_run = now
+        else:
+            lane_state = lane_tracker.predict(now)
+        lane_departure = lane_state.departure
+        fast_lane = check_to_fast_lane(lane_state.lines)
         if lane_departure:
             class_buffer["lane_departure"][-1] = 1
         if fast_lane:
             class_buffer["fast_lane"][-1] = 1    
+        track.add(frame_no, now, dets, lanes,
+                  [f for f, on in (("lane_departure", lane_departure), ("fast_lane", fast_lane),
+                                   ("follow_distance", following)) if on])
         # Alert logic
         currenttime = time.time()
         for cls, buf in class_buffer.items():
@@ -197,7 +219,7 @@ while True:
         if detected_classes:
             for event in detected_classes:
                 # save_event_in_background(EVENT_CHOICE[event])
-                enqueue_event(EVENT_CHOICE[event])
+                enqueue_event(EVENT_CHOICE[event], camera_type="OUTSIDE")
             detected_classes.clear()
 
     # endtime = time.time()
@@ -215,10 +237,10 @@ while True:
         fname = f"{start_time_str}-{end_time_str}"
         duration_sec = (segment_end - segment_start).total_seconds()
         output_file = f"{LOCAL_PATH}Front_{fname}.mp4"
-        audio_file = f"{LOCAL_PATH}Inner_{fname}.wav"
         # duration_sec = time.time() - starttime
         FPS = len(frame_buffer)/duration_sec
         print("Real FPS",FPS)
+        print("[MOTION]", motion_gate.summary(time.time()))
         # save_upload_in_background(buffer=list(frame_buffer), 
         #                           output_file=output_file, 
         #                           fps=FPS, 
@@ -226,7 +248,7 @@ while True:
         #                           end_time=end_time,
         #                           format="P720",
         #                           camera_type="OUTSIDE",
-        #                           audio_file=audio_file)
+        #                           with_audio=True)
         enqueue_video(
                         buffer=list(frame_buffer),
                         output_file=output_file,
@@ -235,22 +257,20 @@ while True:
                         end_time=end_time,
                         format="P720",
                         camera_type="OUTSIDE",
-                        audio_file=audio_file
+                        with_audio=True,  # audio ring'dan pipe orqali, vaqtinchalik WAV yo‘q
+                        detections=track.take(len(frame_buffer))
                     )
         frame_buffer.clear()
         segment_start = segment_end
         segment_end = segment_start + timedelta(seconds=VIDEO_SEGMENT_LEN)
         # starttime = time.time()
 
-    # Display result
-    try:
-        cv2.namedWindow('ADAS View', cv2.WINDOW_NORMAL)
-        cv2.resizeWindow('ADAS View', 960,540)
-        cv2.imshow("ADAS View", frame)
-        if cv2.waitKey(1) == ord("q"):
+    # Display result (DISPLAY_MODE, preview.py)
+    if preview is not None:
+        preview.publish(frame, track.last)
+        if preview.quit.is_set():
             break
-    except cv2.error as e:
-        print("cv2.imshow error (no GUI):", e)
 
 cap.release()
-cv2.destroyAllWindows()
+if preview is not None:
+    preview.close()
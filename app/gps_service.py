@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+One GPS service per receiver: read once, share the track with everyone.
+
+    python gps_service.py [--port /dev/ttyUSB1]
+    python gps_service.py --port drive.nmea [--speed 10]    # recorded NMEA
+    python gps_service.py --show                           # print the live track
+
+The receiver's NMEA sentences (RMC, GGA, VTG) are merged into one fix per
+epoch (gps_track.NmeaParser) and appended to a GpsTrack in shared memory
+(gps_track.GPS_SHM). Camera processes, the event worker and clip cutting
+attach to it with gps_track.get_track() and interpolate at the exact
+time they need, without opening the port themselves.
+
+--port may also be
+ - a regular file of recorded NMEA: replayed in real time (or --speed
+   times faster, 0 = as fast as it can be read), stamped with the replay
+   clock like live data
+ - a pty (e.g. the slave end `socat -d -d pty,raw,echo=0 -` prints), for
+   feeding sentences by hand or from another program
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+
+from gps_track import NmeaParser, create_shared, attach_shared, compass
+
+# ----------------- CONFIG -----------------
+GPS_PORT = os.getenv("GPS_PORT", "/dev/ttyUSB1")
+GPS_BAUD = int(os.getenv("GPS_BAUD", "115200"))
+REOPEN_DELAY = 2           # sec
+# ------------------------------------------
+
+
+def _epoch_seconds(line):
+    """hhmmss.ss of an RMC / GGA sentence in seconds of the day, else None."""
+    f = line.split(",")
+    if len(f) > 1 and f[0][3:6] in ("RMC", "GGA") and len(f[1]) >= 6:
+        try:
+            return int(f[1][0:2]) * 3600 + int(f[1][2:4]) * 60 + float(f[1][4:])
+        except ValueError:
+            return None
+    return None
+
+
+def replay_lines(path, speed=1.0):
+    """Lines of a recorded NMEA file, paced by the receiver's epoch times."""
+    last = None
+    with open(path, errors="replace") as f:
+        for line in f:
+            sec = _epoch_seconds(line)
+            if sec is not None and speed > 0:
+                if last is not None and sec > last:
+                    time.sleep((sec - last) / speed)
+                last = sec
+            yield line
+
+
+def device_lines(port, baud=GPS_BAUD):
+    """Lines from the receiver (or a pty standing in for it); reopens on errors."""
+    while True:
+        try:
+            if os.path.realpath(port).startswith("/dev/pts/"):
+                src = open(port, "rb", buffering=0)
+            else:
+                import serial
+                src = serial.Serial(port, baud, timeout=1)
+        except OSError as e:
+            print(f"[GPS] Can't open {port}: {e}")
+            time.sleep(REOPEN_DELAY)
+            continue
+        try:
+            for raw in iter(src.readline, b""):
+                yield raw.decode("ascii", errors="replace")
+            print(f"[GPS] {port} closed")
+        except OSError as e:
+            print(f"[GPS] {port} read failed: {e}")
+        finally:
+            src.close()
+        time.sleep(REOPEN_DELAY)
+
+
+class GpsService:
+    def __init__(self, port=GPS_PORT, replay_speed=1.0):
+        self.port = port
+        self.replay_speed = replay_speed
+        self.track, self.shm = create_shared()
+        self.parser = NmeaParser()
+
+    def lines(self):
+        if os.path.isfile(self.port):
+            return replay_lines(self.port, self.replay_speed)
+        return device_lines(self.port)
+
+    def run(self):
+        print(f"[GPS] Reading {self.port}")
+        for line in self.lines():
+            fix = self.parser.feed(line)
+            if fix is not None:
+                self.track.add(fix)
+        fix = self.parser.flush()
+        if fix is not None:
+            self.track.add(fix)
+        print(f"[GPS] End of {self.port}: {self.parser.counters}")
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def show():
+    track = attach_shared()
+    if track is None:
+        print("[GPS] No GPS service running")
+        sys.exit(1)
+    while True:
+        fix = track.at(time.time())
+        if fix is None:
+            print("[GPS] no fix")
+        else:
+            print(f"[GPS] {fix.lat:.6f} {fix.lon:.6f}  {fix.speed * 2.23694:5.1f} mph  "
+                  f"{compass(fix.course):>3}  sats {fix.sats:.0f}  hdop {fix.hdop}")
+        time.sleep(1)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", default=GPS_PORT)
+    ap.add_argument("--speed", type=float, default=1.0, help="replay speed for NMEA files (0 = no pacing)")
+    ap.add_argument("--show", action="store_true")
+    args = ap.parse_args()
+    if args.show:
+        show()
+        return
+
+    service = GpsService(args.port, args.speed)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        service.run()
+        # a finished replay keeps its track available until stopped
+        signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""
+Timestamped GPS track: a preallocated ring of fixes with interpolation.
+
+gps_service.py owns the receiver and appends one Fix per NMEA epoch
+(RMC, GGA and VTG of the same fix merged by NmeaParser); everyone else
+attaches to the ring in shared memory and asks
+
+    track.at(t)           position / speed / course at wall-clock time t
+    track.latest()        newest fix
+    track.between(t0, t1) the fixes recorded in [t0, t1]
+
+Event clips get the fixes of their time range in <clip>.gps.json.
+
+at(t) is a binary search over the ring (O(log n), no copy) and a linear
+interpolation between the two fixes around t; course along the shorter
+arc. A t up to MAX_EXTRAPOLATE past the newest fix is dead-reckoned from
+its speed and course, so an event raised now gets where the truck is now
+and not where it was at the last fix. Fixes more than MAX_GAP apart are
+not interpolated (the nearer one is used), and without a fix within
+MAX_GAP of t the answer is None.
+
+Same single-writer / lock-free layout as audio_ring.py: the writer fills
+the row first and then publishes the counter; readers check that the
+rows they used were not overwritten meanwhile.
+"""
+
+import os
+import json
+import math
+import time
+import bisect
+from collections import namedtuple
+from datetime import datetime, timezone
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+# ----------------- CONFIG -----------------
+GPS_SHM = "adas_gps"
+GPS_CAPACITY = 4 * 3600    # fixes (4 h at 1 Hz, 24 min at 10 Hz)
+MAX_GAP = 5.0              # sec between fixes still interpolated
+MAX_EXTRAPOLATE = 2.0      # sec past the newest fix dead-reckoned
+FIX_LATENCY = 0.1          # sec from the fix epoch to its first sentence on the wire
+GPS_SIDECAR_SUFFIX = ".gps.json"
+REATTACH_CHECK = 5.0       # sec; a track that stopped advancing is attached again
+# ------------------------------------------
+
+MAGIC = 0x41444153475031  # "ADASGP1"
+HEADER_LEN = 4
+H_MAGIC, H_CAPACITY, H_WRITTEN = range(3)
+
+FIELDS = ("t", "lat", "lon", "speed", "course", "alt", "hdop", "quality", "sats")
+T, LAT, LON, SPEED, COURSE = range(5)
+# t: wall-clock sec; speed: m/s; course: deg true; alt: m; unknown values are NaN
+Fix = namedtuple("Fix", FIELDS)
+
+KNOTS = 0.514444           # m/s
+EARTH_RADIUS = 6371000.0   # m
+COMPASS = ("N", "NE", "E", "SE", "S", "SW", "W", "NW")
+
+
+def compass(course):
+    """Course in degrees -> "N" / "NE" / ... ; "N/A" if unknown."""
+    if course is None or math.isnan(course):
+        return "N/A"
+    return COMPASS[int((course % 360 + 22.5) // 45) % 8]
+
+
+def _layout(capacity):
+    header = HEADER_LEN * 8
+    return header, header + capacity * len(FIELDS) * 8
+
+
+class _Times:
+    """Fix times in ring order, as a sequence for bisect (no copy)."""
+
+    def __init__(self, rows, first, count):
+        self.rows, self.first, self.count = rows, first, count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.rows[(self.first + i) % len(self.rows), T]
+
+
+class GpsTrack:
+    def __init__(self, capacity=GPS_CAPACITY, buffer=None):
+        header_size, size = _layout(capacity)
+        if buffer is None:
+            buffer = bytearray(size)
+        self.header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=buffer)
+        self.rows = np.ndarray((capacity, len(FIELDS)), dtype=np.float64, buffer=buffer, offset=header_size)
+        if self.header[H_MAGIC] != MAGIC:
+            self.header[1:] = [capacity, 0, 0]
+            self.header[H_MAGIC] = MAGIC   # last: readers attach only once it is there
+        self.capacity = capacity
+
+    @staticmethod
+    def nbytes(capacity=GPS_CAPACITY):
+        return _layout(capacity)[1]
+
+    @property
+    def written(self):
+        return int(self.header[H_WRITTEN])
+
+    # ---------------- writer ----------------
+
+    def add(self, fix):
+        """Append one fix; fixes must come in time order."""
+        written = self.written
+        self.rows[written % self.capacity] = [np.nan if v is None else v for v in fix]
+        self.header[H_WRITTEN] = written + 1   # publish last
+
+    # ---------------- readers ----------------
+
+    def _fix(self, i):
+        return Fix(*self.rows[i % self.capacity].tolist())
+
+    def _lapped(self, oldest_used):
+        return self.written - self.capacity > oldest_used
+
+    def latest(self):
+        written = self.written
+        return self._fix(written - 1) if written else None
+
+    def at(self, t):
+        """Fix interpolated at wall-clock time t, or None if there is no fix near t."""
+        for _ in range(3):
+            written = self.written
+            count = min(written, self.capacity)
+            if count == 0:
+                return None
+            first = written - count
+            k = bisect.bisect_right(_Times(self.rows, first, count), t)   # fixes [first, first + k) are <= t
+            if k == count:
+                fix = self._dead_reckon(self._fix(written - 1), t)
+                used = written - 1
+            elif k == 0:
+                fix = self._fix(first)
+                fix = fix if fix.t - t <= MAX_GAP else None
+                used = first
+            else:
+                a, b = self._fix(first + k - 1), self._fix(first + k)
+                fix = self._interpolate(a, b, t)
+                used = first + k - 1
+            if not self._lapped(used):
+                return fix
+        return None
+
+    def between(self, t0, t1):
+        """Fixes recorded in [t0, t1], oldest first."""
+        written = self.written
+        count = min(written, self.capacity)
+        first = written - count
+        times = _Times(self.rows, first, count)
+        lo, hi = bisect.bisect_left(times, t0), bisect.bisect_right(times, t1)
+        fixes = [self._fix(first + i) for i in range(lo, hi)]
+        lapped = self.written - self.capacity - first
+        return fixes[max(0, lapped - lo):]
+
+    @staticmethod
+    def _interpolate(a, b, t):
+        if b.t - a.t > MAX_GAP:
+            near = a if t - a.t <= b.t - t else b
+            return near if abs(near.t - t) <= MAX_GAP else None
+        w = (t - a.t) / (b.t - a.t) if b.t > a.t else 0.0
+        course = a.course
+        if not (math.isnan(a.course) or math.isnan(b.course)):
+            course = (a.course + w * ((b.course - a.course + 180) % 360 - 180)) % 360
+        near = a if w < 0.5 else b
+        return Fix(t, a.lat + w * (b.lat - a.lat), a.lon + w * (b.lon - a.lon),
+                   a.speed + w * (b.speed - a.speed), course, a.alt + w * (b.alt - a.alt),
+                   near.hdop, near.quality, near.sats)
+
+    @staticmethod
+    def _dead_reckon(fix, t):
+        dt = t - fix.t
+        if dt > MAX_GAP:
+            return None
+        if dt > MAX_EXTRAPOLATE or math.isnan(fix.speed) or math.isnan(fix.course):
+            return fix
+        d = fix.speed * dt
+        lat = fix.lat + math.degrees(d * math.cos(math.radians(fix.course)) / EARTH_RADIUS)
+        lon = fix.lon + math.degrees(d * math.sin(math.radians(fix.course))
+                                     / (EARTH_RADIUS * math.cos(math.radians(fix.lat))))
+        return fix._replace(t=t, lat=lat, lon=lon)
+
+
+# ---------------- NMEA ----------------
+
+def _checksum_ok(line):
+    body, _, check = line[1:].partition("*")
+    if not check:
+        return True      # checksum is optional in NMEA 0183
+    value = 0
+    for ch in body:
+        value ^= ord(ch)
+    try:
+        return value == int(check[:2], 16)
+    except ValueError:
+        return False
+
+
+def _float(s):
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def _degrees(value, hemisphere):
+    """ddmm.mmmm + N/S/E/W -> signed decimal degrees."""
+    v = _float(value)
+    if v is None:
+        return None
+    deg = int(v // 100)
+    deg += (v - deg * 100) / 60
+    return -deg if hemisphere in ("S", "W") else deg
+
+
+class NmeaParser:
+    """
+    Merges the RMC, GGA and VTG sentences of one fix epoch into a Fix.
+
+    feed(line, t_rx) returns a finished Fix or None. An epoch is finished
+    as soon as both its RMC and GGA are in (the usual receiver output), or
+    else when a sentence of the next epoch arrives. VTG only fills speed /
+    course the RMC did not have. Any talker ($GP, $GN, $GL...) is accepted.
+
+    The fix time is the receive time of the epoch's first sentence minus
+    FIX_LATENCY (the frames are stamped with the same clock), or with
+    gps_time=True the receiver's UTC time: for recorded NMEA files.
+    """
+
+    def __init__(self, gps_time=False):
+        self.gps_time = gps_time
+        self.date = None
+        self._reset(None, None)
+        self.counters = {"sentences": 0, "bad_checksum": 0, "fixes": 0, "no_fix": 0}
+
+    def _reset(self, epoch, t_rx):
+        self.epoch, self.t_rx = epoch, t_rx
+        self.cur = dict.fromkeys(FIELDS[1:])
+        self.seen = set()
+        self.done = False
+
+    def _finish(self):
+        cur = self.cur
+        if self.done or cur["lat"] is None or cur["lon"] is None or cur["quality"] == 0:
+            if not self.done and self.epoch is not None:
+                self.counters["no_fix"] += 1
+            return None
+        self.done = True
+        if self.gps_time:
+            if self.date is None:
+                return None
+            t = self._utc(self.epoch)
+        else:
+            t = self.t_rx - FIX_LATENCY
+        self.counters["fixes"] += 1
+        return Fix(t, *(cur[f] for f in FIELDS[1:]))
+
+    def _utc(self, hhmmss):
+        h, m, s = int(hhmmss[0:2]), int(hhmmss[2:4]), float(hhmmss[4:])
+        day = datetime.strptime(self.date, "%d%m%y").replace(tzinfo=timezone.utc)
+        return day.timestamp() + h * 3600 + m * 60 + s
+
+    def feed(self, line, t_rx=None):
+        line = line.strip()
+        if not line.startswith("$") or len(line) < 7:
+            return None
+        self.counters["sentences"] += 1
+        if not _checksum_ok(line):
+            self.counters["bad_checksum"] += 1
+            return None
+        t_rx = time.time() if t_rx is None else t_rx
+        f = line[1:].split("*")[0].split(",")
+        kind = f[0][2:]
+        out = None
+        if kind in ("RMC", "GGA") and len(f) > 6 and f[1] and f[1] != self.epoch:
+            out = self._finish()
+            self._reset(f[1], t_rx)
+        cur = self.cur
+        if kind == "RMC" and len(f) > 9:
+            if f[9]:
+                self.date = f[9]
+            if f[2] == "A":
+                cur["lat"], cur["lon"] = _degrees(f[3], f[4]), _degrees(f[5], f[6])
+                speed = _float(f[7])
+                cur["speed"] = speed * KNOTS if speed is not None else None
+                cur["course"] = _float(f[8])
+            else:
+                cur["quality"] = 0
+        elif kind == "GGA" and len(f) > 9:
+            quality = int(f[6]) if f[6].isdigit() else 0
+            cur["quality"], cur["sats"] = quality, _float(f[7])
+            cur["hdop"], cur["alt"] = _float(f[8]), _float(f[9])
+            if quality and cur["lat"] is None:
+                cur["lat"], cur["lon"] = _degrees(f[2], f[3]), _degrees(f[4], f[5])
+        elif kind == "VTG" and len(f) > 7:
+            if cur["course"] is None:
+                cur["course"] = _float(f[1])
+            if cur["speed"] is None:
+                kmh = _float(f[7])
+                cur["speed"] = kmh / 3.6 if kmh is not None else None
+        else:
+            return out
+        self.seen.add(kind)
+        if out is None and {"RMC", "GGA"} <= self.seen:
+            out = self._finish()
+        return out
+
+    def flush(self):
+        """End of input: the last epoch, if it was not finished yet."""
+        return self._finish()
+
+
+def load_nmea(path, capacity=GPS_CAPACITY):
+    """GpsTrack of a recorded NMEA file, timed by the receiver's UTC clock."""
+    track, parser = GpsTrack(capacity), NmeaParser(gps_time=True)
+    with open(path, errors="replace") as f:
+        for line in f:
+            fix = parser.feed(line)
+            if fix is not None:
+                track.add(fix)
+    fix = parser.flush()
+    if fix is not None:
+        track.add(fix)
+    return track
+
+
+# ---------------- clips ----------------
+
+def gps_sidecar_path(video_path):
+    return os.path.splitext(str(video_path))[0] + GPS_SIDECAR_SUFFIX
+
+
+def write_gps_sidecar(video_path, track, t0, t1, event_ts=None):
+    """<clip>.gps.json: the fixes of [t0, t1] (and the interpolated fix at event_ts)."""
+    def row(fix):
+        return None if fix is None else [None if isinstance(v, float) and math.isnan(v) else round(v, 7) for v in fix]
+    data = {"fields": FIELDS, "fixes": [row(fix) for fix in track.between(t0, t1)]}
+    if event_ts is not None:
+        data["event"] = row(track.at(event_ts))
+    path = gps_sidecar_path(video_path)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    return path
+
+
+# ---------------- shared memory ----------------
+
+def create_shared(name=GPS_SHM, capacity=GPS_CAPACITY):
+    """Writer side: (GpsTrack, SharedMemory) in a fresh block called name."""
+    size = GpsTrack.nbytes(capacity)
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        # left behind by a crashed run
+        stale = shared_memory.SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    return GpsTrack(capacity, buffer=shm.buf), shm
+
+
+def attach_shared(name=GPS_SHM):
+    """Reader side: GpsTrack over the writer's block, None while it is missing or not initialised yet."""
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except (FileNotFoundError, ValueError):   # ValueError: created, not sized yet
+        return None
+    # the writer owns the block; don't let this process' tracker unlink it on exit
+    resource_tracker.unregister(shm._name, "shared_memory")
+    # the writer writes MAGIC after the rest of the header
+    header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=shm.buf) if shm.size >= HEADER_LEN * 8 else None
+    if header is None or header[H_MAGIC] != MAGIC or shm.size < GpsTrack.nbytes(int(header[H_CAPACITY])):
+        del header
+        shm.close()
+        return None
+    track = GpsTrack(int(header[H_CAPACITY]), buffer=shm.buf)
+    del header
+    track.shm = shm  # keep the mapping alive as long as the track
+    return track
+
+
+_track = None
+_track_checked = 0.0
+_track_written = -1
+
+
+def get_track():
+    """
+    This process' view of the GPS service's track, None while there is no
+    service. A restarted service unlinks the block and makes a new one, so
+    a track that has not advanced since the last check is attached again.
+    """
+    global _track, _track_checked, _track_written
+    now = time.time()
+    if now - _track_checked >= REATTACH_CHECK:
+        _track_checked = now
+        if _track is None or _track.written == _track_written:
+            _track = attach_shared()
+        _track_written = _track.written if _track is not None else -1
+    return _track
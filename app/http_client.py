@@ -0,0 +1,348 @@
+"""
+Shared HTTP client for all device -> server traffic.
+
+One pooled requests.Session per process (keep-alive), per-endpoint timeouts,
+retries with jittered exponential backoff, per-endpoint concurrency limits,
+streamed multipart bodies (the file is never read into memory) and
+per-endpoint latency / byte counters (summary(), logged by task_manager and
+recoder_uploader).
+
+Retries never duplicate work on the server: idempotent methods (GET, PUT,
+...) and IDEMPOTENT_ENDPOINTS retry on any connection error, timeout or
+RETRY_STATUS; other POSTs (driver_event, uploads) only when the server
+cannot have processed the request: the connection was never established,
+or it answered NOT_PROCESSED_STATUS.
+
+Point API_BASE at a local stand-in (see stub_server.py) to test the whole
+device side without the real backend.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import threading
+import mimetypes
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# ----------------- CONFIG -----------------
+API_BASE = os.getenv("API_BASE", "http://localhost:8083/api")
+
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "8"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+RETRY_BASE = 0.5     # sec, first backoff ceiling
+RETRY_CAP = 30       # sec, max backoff ceiling
+CHUNK_SIZE = 64 * 1024
+
+# (connect, read) timeouts per endpoint
+ENDPOINT_TIMEOUTS = {
+    "default": (5, 30),
+    "driver_event": (5, 10),
+    "video_upload": (10, 120),
+    "recorder_upload": (10, 120),
+    "model_check": (5, 20),
+    "model_download": (10, 60),
+    "sync": (5, 30),
+}
+
+# max in-flight requests per endpoint
+ENDPOINT_CONCURRENCY = {
+    "default": 4,
+    "driver_event": 4,
+    "video_upload": 2,
+    "recorder_upload": int(os.getenv("UPLOAD_WORKERS", "3")),  # one per recoder_uploader worker
+    "model_check": 1,
+    "model_download": 1,
+    "sync": 1,
+}
+
+# statuses worth retrying; anything else is returned to the caller as is
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+# statuses that say the request was not acted on: safe to retry even for a POST
+NOT_PROCESSED_STATUS = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+# POST endpoints that only query, so repeating them is harmless
+IDEMPOTENT_ENDPOINTS = {"sync", "model_check"}
+# ------------------------------------------
+
+
+class MultipartFile:
+    """
+    multipart/form-data body streamed from disk.
+
+    Iterating yields the form fields, then the file in CHUNK_SIZE pieces,
+    then the closing boundary. len() is known up front so requests sends a
+    Content-Length instead of chunked encoding. Every iteration reopens the
+    file, so one instance can be re-sent on retry.
+
+    bandwidth (optional) paces the body: bandwidth.throttle(n) is called
+    before each piece and bandwidth.report(bytes, wire_seconds) at the end.
+    """
+
+    def __init__(self, path, fields=None, file_field="file", filename=None, content_type=None,
+                 bandwidth=None):
+        self.path = str(path)
+        self.bandwidth = bandwidth
+        self.boundary = uuid.uuid4().hex
+        filename = filename or Path(path).name
+        content_type = content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+        head = []
+        for name, value in (fields or {}).items():
+            head.append(
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f"{value}\r\n"
+            )
+        head.append(
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        )
+        self._head = "".join(head).encode()
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self._file_size = os.path.getsize(self.path)
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return len(self._head) + self._file_size + len(self._tail)
+
+    def _pieces(self):
+        yield self._head
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        yield self._tail
+
+    def __iter__(self):
+        if self.bandwidth is None:
+            yield from self._pieces()
+            return
+        wire = 0.0
+        for piece in self._pieces():
+            self.bandwidth.throttle(len(piece))
+            t0 = time.monotonic()
+            yield piece  # time until resumed ~ time the socket took to take it
+            wire += time.monotonic() - t0
+        self.bandwidth.report(len(self), wire)
+
+
+class _EndpointStats:
+    __slots__ = ("requests", "errors", "retries", "bytes_sent", "bytes_received",
+                 "latency_total", "latency_max", "in_flight")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.in_flight = 0
+
+    def as_dict(self):
+        d = {k: getattr(self, k) for k in self.__slots__}
+        d["latency_avg"] = self.latency_total / self.requests if self.requests else 0.0
+        return d
+
+
+class HttpClient:
+    """Pooled session with per-endpoint timeouts, retries, limits and counters."""
+
+    def __init__(self, pool_size=POOL_SIZE, max_retries=MAX_RETRIES,
+                 timeouts=None, concurrency=None):
+        self.max_retries = max_retries
+        self.timeouts = dict(ENDPOINT_TIMEOUTS, **(timeouts or {}))
+        self.concurrency = dict(ENDPOINT_CONCURRENCY, **(concurrency or {}))
+
+        self.session = requests.Session()
+        # retries are done here (with jitter), not by urllib3
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._limits = {}
+        self._stats = {}
+
+    # ---------------- internals ----------------
+
+    def _limit(self, endpoint):
+        with self._lock:
+            sem = self._limits.get(endpoint)
+            if sem is None:
+                n = self.concurrency.get(endpoint, self.concurrency["default"])
+                sem = self._limits[endpoint] = threading.BoundedSemaphore(n)
+            return sem
+
+    def _stat(self, endpoint):
+        st = self._stats.get(endpoint)
+        if st is None:
+            with self._lock:
+                st = self._stats.setdefault(endpoint, _EndpointStats())
+        return st
+
+    def _record(self, endpoint, elapsed, sent, received, ok):
+        st = self._stat(endpoint)
+        with self._lock:
+            st.requests += 1
+            st.errors += 0 if ok else 1
+            st.bytes_sent += sent
+            st.bytes_received += received
+            st.latency_total += elapsed
+            st.latency_max = max(st.latency_max, elapsed)
+
+    @staticmethod
+    def _not_sent(err):
+        """The request never reached the server (connect failed / timed out)."""
+        if isinstance(err, requests.ConnectTimeout):
+            return True
+        reason = getattr(err.args[0], "reason", None) if err.args else None
+        return isinstance(reason, NewConnectionError)
+
+    @staticmethod
+    def _backoff(attempt):
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(RETRY_CAP, RETRY_BASE * (2 ** attempt)))
+
+    @staticmethod
+    def _body_len(kwargs):
+        data = kwargs.get("data")
+        if kwargs.get("json") is not None:
+            return len(json.dumps(kwargs["json"]))
+        if isinstance(data, (bytes, bytearray, str)):
+            return len(data)
+        try:
+            return len(data) if data is not None else 0
+        except TypeError:
+            return 0
+
+    # ---------------- public API ----------------
+
+    def request(self, endpoint, method, url, retries=None, stream=False, idempotent=None, **kwargs):
+        """
+        Send one request through the pool. Retries with jittered backoff:
+        idempotent requests on connection errors, timeouts and RETRY_STATUS,
+        others only when the server did not process them (see module doc).
+        idempotent=None decides by method / endpoint. Returns the last
+        response (not raised on HTTP errors) or raises the last exception.
+        A returned stream=True response is counted by the caller once its
+        body is read (download()), so its latency includes the body.
+        """
+        retries = self.max_retries if retries is None else retries
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS or endpoint in IDEMPOTENT_ENDPOINTS
+        kwargs.setdefault("timeout", self.timeouts.get(endpoint, self.timeouts["default"]))
+        sent = self._body_len(kwargs)
+        st = self._stat(endpoint)
+
+        attempt = 0
+        while True:
+            t0 = time.monotonic()
+            resp, err = None, None
+            with self._limit(endpoint):
+                with self._lock:
+                    st.in_flight += 1
+                try:
+                    resp = self.session.request(method, url, stream=stream, **kwargs)
+                    received = 0 if stream else len(resp.content)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    err, received = e, 0
+                finally:
+                    with self._lock:
+                        st.in_flight -= 1
+            if idempotent:
+                retryable = err is not None or resp.status_code in RETRY_STATUS
+            else:
+                retryable = self._not_sent(err) if err is not None else resp.status_code in NOT_PROCESSED_STATUS
+            last = not retryable or attempt >= retries
+            if not (stream and last and err is None):
+                ok = err is None and resp.status_code < 400
+                self._record(endpoint, time.monotonic() - t0, sent, received, ok)
+            if last:
+                if err is not None:
+                    raise err
+                return resp
+
+            if resp is not None:
+                resp.close()
+            with self._lock:
+                st.retries += 1
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def post_json(self, endpoint, url, payload, **kwargs):
+        return self.request(endpoint, "POST", url, json=payload, **kwargs)
+
+    def upload_file(self, endpoint, url, path, fields=None, file_field="file",
+                    content_type=None, headers=None, bandwidth=None, **kwargs):
+        """POST a file as a streamed multipart body (optionally paced, see MultipartFile)."""
+        body = MultipartFile(path, fields, file_field=file_field, content_type=content_type,
+                             bandwidth=bandwidth)
+        headers = dict(headers or {})
+        headers["Content-Type"] = body.content_type
+        return self.request(endpoint, "POST", url, data=body, headers=headers, **kwargs)
+
+    def download(self, endpoint, url, dest, chunk_size=CHUNK_SIZE, **kwargs):
+        """Stream a GET response into dest (path). Raises on HTTP errors."""
+        resp = self.request(endpoint, "GET", url, stream=True, **kwargs)
+        received = 0
+        t0 = time.monotonic()
+        ok = False
+        try:
+            with resp:
+                resp.raise_for_status()
+                with open(dest, "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            received += len(chunk)
+            ok = True
+        finally:
+            # one request: time to the headers plus the body
+            self._record(endpoint, resp.elapsed.total_seconds() + time.monotonic() - t0, 0, received, ok)
+        return dest
+
+    def stats(self):
+        """Per-endpoint counters snapshot: {endpoint: {requests, errors, ...}}."""
+        with self._lock:
+            return {name: st.as_dict() for name, st in self._stats.items()}
+
+    def summary(self):
+        """One log line of the counters, per endpoint."""
+        parts = []
+        for name, st in sorted(self.stats().items()):
+            parts.append(f"{name}: {st['requests']} req, {st['errors']} err, {st['retries']} retries, "
+                         f"avg {st['latency_avg']:.2f}s, max {st['latency_max']:.2f}s, "
+                         f"{st['bytes_sent'] / 1024 ** 2:.1f}/{st['bytes_received'] / 1024 ** 2:.1f} MiB out/in, "
+                         f"{st['in_flight']} in flight")
+        return "; ".join(parts) or "no requests"
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide shared client."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient()
+    return _client
@@ -1,3 +1,4 @@
+import os
 import cv2
 import json
 import time
@@ -7,6 +8,13 @@ from collections import deque
 from datetime import datetime, timedelta
 from ultralytics import YOLO
 from task_manager import enqueue_video, enqueue_event
+from frame_share import SharedFrameCapture
+from preview import make_preview
+from detections import DetectionTrack
+from driver_roi import DriverROI
+from frame_quality import QualityGate
+from motion_gate import MotionGate
+from telemetry import get_telemetry
 
 from local_functions_new import (
     check_buffer,
@@ -16,9 +24,10 @@ from local_functions_new import (
     INNER_MODEL,
     CAMERA_TYPE,
     AUDIO_DEVICE_INNER,
+    FRAME_SOURCE,
+    FRAME_SHM_INNER,
     VIDEO_SEGMENT_LEN,
     EVENT_CHOICE,
-    getColours,
     save_upload_in_background,
     save_event_in_background,
     play_alert,
@@ -29,6 +38,7 @@ from local_functions_new import (
 CAMERA_INDEX = 2
 BUFFER_LEN = 20
 COOLDOWN_THRESHOLD = 30
+IDLE_RATE = float(os.getenv("INNER_IDLE_RATE", "5"))   # model runs per second while parked
 VIOLATION_CLASSES = {
     'drinking', 'eyes_closed', 'mobile_usage', 'no_seatbelt',
     'smoking', 'yawn', "inattentive_driving"
@@ -46,7 +56,11 @@ inner_model = YOLO(MODEL_PATH + INNER_MODEL)
 
 camera = None
 threading.Thread(target=audio_record_loop, args=(AUDIO_DEVICE_INNER,),daemon=True).start()
-if is_windows:
+get_telemetry()   # CAN reader up before the first event, so payloads only read its snapshot
+if FRAME_SOURCE == "shm":
+    # kadrlar recoder_uploader ffmpeg'idan: qayta decode yo‘q, v4l2loopback yo‘q
+    camera = SharedFrameCapture(FRAME_SHM_INNER)
+elif is_windows:
     camera = cv2.VideoCapture(CAMERA_INDEX, cv2.CAP_DSHOW)
     camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
     camera.set(cv2.CAP_PROP_FPS,30)
@@ -63,11 +77,17 @@ else:
         from nanocamera import Camera
         camera = Camera(device_id=0, fps=25, width=1280, height=720, flip=0)
 
+preview = make_preview("inner", "Driver Monitor")
+track = DetectionTrack()
+driver_roi = None   # created with the first frame's size
+
 cooldown_timers = {cls: 0 for cls in VIOLATION_CLASSES}
 detected_violations = set()
 detected_classes = set()
 is_buffer_ready = False
 last_seen_driver = time.time()
+quality_gate = QualityGate("inner")
+motion_gate = MotionGate("inner", IDLE_RATE)
 
 FPS = 30
 VIDEO_FRAME_LEN = VIDEO_SEGMENT_LEN*FPS
@@ -82,7 +102,7 @@ segment_end = segment_start + timedelta(seconds=VIDEO_SEGMENT_LEN)
 # ---------------- MAIN LOOP ------------------
 while True:
     # -------- Read frame --------
-    if CAMERA_TYPE == "usb":
+    if FRAME_SOURCE == "shm" or CAMERA_TYPE == "usb":
         ret, frame = camera.read()
         if not ret:
             continue
@@ -92,26 +112,41 @@ while True:
             continue
     
     frame_buffer.append(frame)
+    frame_no = track.frame()
     current = datetime.now()
-    results = inner_model.predict(frame, verbose=False)
-
-    for cls in VIOLATION_CLASSES:
-        class_buffer[cls].append(0)
-
-    result = results[0]
-    class_names = result.names
-    for box in result.boxes:
+    if driver_roi is None:
+        driver_roi = DriverROI(frame.shape[1], frame.shape[0])
+    # cheap image check first: a covered / black / glared frame is not worth a model run (frame_quality.py)
+    quality = quality_gate.check(frame, time.time())
+    # parked and nobody moving: reduced rate (motion_gate.py); skipped frames don't vote
+    analyse = not quality.usable or motion_gate.due(time.time(), quality.stats["diff"])
+    if analyse and quality.usable:
+        # periodic full-frame pass finds the driver; frames in between run on the crop (driver_roi.py)
+        result, region, (ox, oy) = driver_roi.infer(inner_model, frame)
+        boxes, class_names = result.boxes, result.names
+    else:
+        boxes = ()
+
+    if analyse:
+        for cls in VIOLATION_CLASSES:
+            class_buffer[cls].append(0)
+
+    dets = []
+    roi_boxes, roi_classes, roi_scores = [], [], []
+    for box in boxes:
         x1, y1, x2, y2 = map(int, box.xyxy[0])
+        x1, y1, x2, y2 = x1 + ox, y1 + oy, x2 + ox, y2 + oy
         cls_id = int(box.cls[0])
         cls_name = class_names[cls_id]
         conf = float(box.conf[0])
+        roi_boxes.append((x1, y1, x2, y2))
+        roi_classes.append(cls_name)
+        roi_scores.append(conf)
 
         threshold = 0.7 if cls_name == "eyes_closed" else 0.4
         if conf > threshold:
-            color = getColours(cls_id)
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-            cv2.putText(frame, f'{cls_name} {conf:.2f}', (x1, y1),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
+            # not drawn into the frame: recorded in the segment's sidecar (detections.py)
+            dets.append([cls_name, round(conf, 2), x1, y1, x2, y2])
 
             if cls_name in VIOLATION_CLASSES:
                 class_buffer[cls_name][-1] = 1
@@ -119,7 +154,12 @@ while True:
             if cls_name in OBSTRUCTION_CLASSES:
                 last_seen_driver = time.time()
 
+    if analyse and quality.usable:
+        driver_roi.update(roi_boxes, roi_classes, roi_scores, full=region is None)
+
     now = time.time()
+    if analyse:
+        track.add(frame_no, now, dets, flags=None if quality.usable else [quality.status])
     for cls, buf in class_buffer.items():
         if sum(buf) / BUFFER_LEN >= 0.8:
             if now - cooldown_timers[cls] >= COOLDOWN_THRESHOLD:
@@ -129,7 +169,8 @@ while True:
             class_buffer[cls].clear()
             class_buffer[cls].extend([0] * BUFFER_LEN)
 
-    if now - last_seen_driver > 10:
+    # lens covered / dark / frozen within a second; no driver seen for 10 s as before
+    if quality.obstructed or now - last_seen_driver > 10:
         if "camera_obstructed" not in class_buffer:
             class_buffer["camera_obstructed"] = deque([1] * BUFFER_LEN, maxlen=BUFFER_LEN)
             cooldown_timers["camera_obstructed"] = 0
@@ -148,7 +189,7 @@ while True:
     if detected_classes:
         for event in detected_classes:
             # save_event_in_background(EVENT_CHOICE[event])
-            enqueue_event(EVENT_CHOICE[event])
+            enqueue_event(EVENT_CHOICE[event], camera_type="INSIDE")
         detected_classes.clear()
 
     # endtime = time.time()
@@ -166,11 +207,11 @@ while True:
         fname = f"{start_time_str}-{end_time_str}"
         duration_sec = (segment_end - segment_start).total_seconds()
         output_file = f"{LOCAL_PATH}Inner_{fname}.mp4"
-        audio_file = f"{LOCAL_PATH}Inner_{fname}.wav"
         # duration_sec = time.time() - starttime
         FPS = len(frame_buffer)/duration_sec
         print("Real FPS",FPS)
         print("Buffer Len",len(frame_buffer))
+        print("[MOTION]", motion_gate.summary(time.time()))
         # save_upload_in_background(buffer=list(frame_buffer), 
         #                           output_file=output_file, 
         #                           fps=FPS, 
@@ -178,7 +219,7 @@ while True:
         #                           end_time=end_time,
         #                           format="P720",
         #                           camera_type="INSIDE",
-        #                           audio_file=audio_file)
+        #                           with_audio=True)
         enqueue_video(
                         buffer=list(frame_buffer),
                         output_file=output_file,
@@ -187,21 +228,20 @@ while True:
                         end_time=end_time,
                         format="P720",
                         camera_type="INSIDE",
-                        audio_file=audio_file
+                        with_audio=True,  # audio ring'dan pipe orqali, vaqtinchalik WAV yo‘q
+                        detections=track.take(len(frame_buffer))
                     )
         frame_buffer.clear()
         segment_start = segment_end
         segment_end = segment_start + timedelta(seconds=VIDEO_SEGMENT_LEN)
         # starttime = time.time()
 
-    try:
-        cv2.namedWindow('Driver Monitor', cv2.WINDOW_NORMAL)
-        cv2.resizeWindow('Driver Monitor', 960,540)
-        cv2.imshow('Driver Monitor', frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+    # Display result (DISPLAY_MODE, preview.py)
+    if preview is not None:
+        preview.publish(frame, track.last)
+        if preview.quit.is_set():
             break
-    except cv2.error as e:
-        print("cv2.imshow error (no GUI):", e)
 # -------- CLEANUP --------
 camera.release()
-cv2.destroyAllWindows()
+if preview is not None:
+    preview.close()
@@ -0,0 +1,161 @@
+"""
+Ego-lane line tracker, so the lane model can run at a few Hz.
+
+Each lane-model box is reduced to one number: where the line crosses the
+bottom row of the frame (x_ref), extrapolated along the box diagonal (a
+line left of the car runs '/', right of it '\\'; a line under the car is
+taken at its box centre). Boxes are matched to the tracked lines first;
+the nearest remaining line on a side without one becomes that side's
+line. A line tracked across the car centre has been crossed: it becomes
+the other side's line of the new lane.
+
+Each side is tracked with an alpha-beta filter on x_ref (position and
+px/s drift) using real time stamps. Between lane-model runs, predict()
+carries both lines forward, so decisions are made every analysed frame
+from a smoothed state instead of from one noisy result:
+
+    departure  the car centre stays closer than departure_threshold to a
+               tracked line for DEPARTURE_MIN_TIME; cleared again only
+               past DEPARTURE_RELEASE * threshold (hysteresis)
+    lines      {"left_<type>", "right_<type>"} of the tracked lines, each the
+               most frequent recent type of its side, for check_to_fast_lane()
+
+A side not confirmed by the model for LINE_LOST seconds is dropped.
+"""
+
+from collections import Counter, namedtuple
+
+# ----------------- CONFIG -----------------
+LANE_CONF = 0.4
+ALPHA = 0.6               # position gain
+BETA = 0.3                # drift gain
+GATE = 0.15               # max jump of a line between runs, share of frame width
+LINE_LOST = 1.5           # sec
+DEPARTURE_MIN_TIME = 0.4  # sec
+DEPARTURE_RELEASE = 1.5
+TYPE_MEMORY = 8           # recent type votes kept per side
+# ------------------------------------------
+
+LaneState = namedtuple("LaneState", "left right left_type right_type departure lines")
+
+
+def lane_lines(model, frame, conf=LANE_CONF):
+    """Run the lane model once: [[type, conf, x1, y1, x2, y2], ...]."""
+    result = model.predict(source=frame, verbose=False)[0]
+    lines = []
+    for box in result.boxes:
+        score = float(box.conf[0])
+        if score > conf:
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            lines.append([result.names[int(box.cls[0])], round(score, 2), x1, y1, x2, y2])
+    return lines
+
+
+class _Line:
+    __slots__ = ("x", "v", "t", "seen", "types")
+
+    def __init__(self, x, t, line_type):
+        self.x, self.v, self.t, self.seen = x, 0.0, t, t
+        self.types = [line_type]
+
+    def predict(self, t):
+        return self.x + self.v * (t - self.t)
+
+    def update(self, z, t, line_type):
+        dt = t - self.t
+        pred = self.predict(t)
+        r = z - pred
+        self.x = pred + ALPHA * r
+        if dt > 0:
+            self.v += BETA * r / dt
+        self.t = self.seen = t
+        self.types = (self.types + [line_type])[-TYPE_MEMORY:]
+
+    @property
+    def type(self):
+        return Counter(self.types).most_common(1)[0][0]
+
+
+class LaneTracker:
+    def __init__(self, width, height, departure_threshold):
+        self.width = width
+        self.y_ref = height - 1
+        self.center = width / 2
+        self.threshold = departure_threshold
+        self.left = self.right = None
+        self.close_since = None
+        self.departure = False
+        self.counters = {"runs": 0, "predicted": 0}
+
+    def _x_ref(self, x1, y1, x2, y2):
+        """Where the line of this box crosses the bottom row."""
+        cx = (x1 + x2) / 2
+        if x1 <= self.center <= x2 or y2 - y1 < 2:
+            return cx
+        if cx < self.center:
+            xb, xt = x1, x2     # '/'
+        else:
+            xb, xt = x2, x1     # '\'
+        return xb + (self.y_ref - y2) * (xt - xb) / (y1 - y2)
+
+    def update(self, lines, t):
+        """Lane-model run: lines as returned by lane_lines()."""
+        self.counters["runs"] += 1
+        candidates = [(self._x_ref(x1, y1, x2, y2), line_type) for line_type, conf, x1, y1, x2, y2 in lines]
+        # tracked lines take the nearest plausible box
+        for line in (self.left, self.right):
+            if line is None or not candidates:
+                continue
+            pred = line.predict(t)
+            best = min(candidates, key=lambda c: abs(c[0] - pred))
+            if abs(best[0] - pred) <= GATE * self.width:
+                line.update(best[0], t, best[1])
+                candidates.remove(best)
+        # a side without a line takes the remaining line nearest the car
+        if self.left is None:
+            left = [c for c in candidates if c[0] < self.center]
+            if left:
+                x, line_type = max(left)
+                self.left = _Line(x, t, line_type)
+        if self.right is None:
+            right = [c for c in candidates if c[0] >= self.center]
+            if right:
+                x, line_type = min(right)
+                self.right = _Line(x, t, line_type)
+        return self.state(t)
+
+    def predict(self, t):
+        """Frame without a lane-model run."""
+        self.counters["predicted"] += 1
+        return self.state(t)
+
+    def state(self, t):
+        for side in ("left", "right"):
+            line = getattr(self, side)
+            if line is not None and t - line.seen > LINE_LOST:
+                setattr(self, side, None)
+        # lane change completed: the crossed line bounds the new lane on the other side
+        if self.left is not None and self.left.predict(t) > self.center:
+            self.left, self.right = None, self.left
+        elif self.right is not None and self.right.predict(t) < self.center:
+            self.left, self.right = self.right, None
+        left = self.left.predict(t) if self.left else None
+        right = self.right.predict(t) if self.right else None
+
+        gaps = [abs(self.center - x) for x in (left, right) if x is not None]
+        gap = min(gaps) if gaps else float("inf")
+        if gap < self.threshold:
+            if self.close_since is None:
+                self.close_since = t
+            if t - self.close_since >= DEPARTURE_MIN_TIME:
+                self.departure = True
+        elif gap > DEPARTURE_RELEASE * self.threshold:
+            self.close_since = None
+            self.departure = False
+
+        left_type = self.left.type if self.left else None
+        right_type = self.right.type if self.right else None
+        names = {f"left_{left_type}"} if left_type else set()
+        if right_type:
+            names.add(f"right_{right_type}")
+        return LaneState(left, right, left_type, right_type, self.departure, names)
@@ -1,18 +1,22 @@
 import cv2
 import os
+import time
 import subprocess
 import threading
 import requests
 import numpy as np
 import sounddevice as sd
 import soundfile as sf
-import pygame
 import paramiko
 from scp import SCPClient
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
-from collections import deque
-from api_request import upload_video, send_driver_event
+from api_request import upload_video_chunked, send_driver_event
+from event_clips import keyframe_args
+from audio_ring import AudioRing, attach_shared
+from alert_engine import get_alerts
+from gps_track import get_track, compass
+from telemetry import get_telemetry, MAX_AGE as TELEMETRY_MAX_AGE
 import random
 
 os.environ["ULTRALYTICS_NO_CHECK"] = "1"
@@ -25,7 +29,10 @@ VIDEO_SEGMENT_LEN = int(os.getenv("VIDEO_SEGMENT_LEN"))
 AUDIO_SR = 44100
 CHANNELS = 1
 AUDIO_DURATION = VIDEO_SEGMENT_LEN
-audio_buffer = deque(maxlen=AUDIO_SR * AUDIO_DURATION)
+AUDIO_BLOCK = 1024
+# segment audio is cut after the segment ends (and after the video queue), so keep a few segments
+AUDIO_RING_SECONDS = 3 * VIDEO_SEGMENT_LEN + 30
+audio_buffer = AudioRing(AUDIO_SR, AUDIO_RING_SECONDS, blocksize=AUDIO_BLOCK)
 recording = True
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -47,11 +54,15 @@ LANE_MODEL = os.getenv("LANE_MODEL")
 CAMERA_TYPE = os.getenv("CAMERA_TYPE")
 AUDIO_DEVICE_INNER = os.getenv("AUDIO_DEVICE_INNER", "default")
 AUDIO_DEVICE_FRONT = os.getenv("AUDIO_DEVICE_FRONT", "default")
+# "device": mikrofon shu processda ochiladi; "service": audio_service.py ring'idan o‘qiladi (bitta capture)
+AUDIO_SOURCE = os.getenv("AUDIO_SOURCE", "device")
+# "device": kamera shu processda ochiladi; "shm": recoder_uploader ffmpeg'i decode qilgan kadrlar (frame_share.py)
+FRAME_SOURCE = os.getenv("FRAME_SOURCE", "device")
+FRAME_SHM_FRONT = os.getenv("FRAME_SHM_FRONT", "adas_cam1")
+FRAME_SHM_INNER = os.getenv("FRAME_SHM_INNER", "adas_cam0")
 
 headers = {"Content-Type": "application/json", "Accept": "application/json"}
 
-pygame.mixer.init()
-
 violation_sounds = {
     "drinking": f"{SOUND_PATH}drinking.mp3",
     "eating": f"{SOUND_PATH}eating.mp3",
@@ -125,9 +136,35 @@ EVENT_CHOICE = {
     'camera_obstructed':'CAMERA_OBSTRUCTED'
 }
 
+def attach_audio_service(AUDIO_DEVICE):
+    """
+    Use the shared ring of audio_service.py for this mic instead of a local
+    capture. Runs for good: a restarted service replaces the ring, so a ring
+    that stops advancing is attached again.
+    """
+    global audio_buffer
+    from audio_service import shm_name
+    ring, written = None, -1
+    while True:
+        if ring is None or ring.written == written:
+            if ring is not None:
+                print(f"[WARN] Audio service for {AUDIO_DEVICE} stalled, attaching again")
+            ring = attach_shared(shm_name(AUDIO_DEVICE))
+            if ring is None:
+                print(f"[WARN] Audio service for {AUDIO_DEVICE} not running, retrying")
+            else:
+                audio_buffer = ring
+                print(f"[INFO] Using audio service: {shm_name(AUDIO_DEVICE)}")
+        written = ring.written if ring is not None else -1
+        time.sleep(5)
+
 def audio_record_loop(AUDIO_DEVICE):
+    if AUDIO_SOURCE == "service":
+        attach_audio_service(AUDIO_DEVICE)
+        return
+
     def callback(indata, frames, time_info, status):
-        audio_buffer.extend(indata[:, 0])
+        audio_buffer.write(indata[:, 0], AudioRing.callback_time(time_info, frames, AUDIO_SR))
 
     try:
         device = int(AUDIO_DEVICE)
@@ -139,28 +176,49 @@ def audio_record_loop(AUDIO_DEVICE):
     with sd.InputStream(
         samplerate=AUDIO_SR,
         channels=CHANNELS,
+        dtype="int16",
+        blocksize=AUDIO_BLOCK,
         device=device,
         callback=callback
     ):
         while recording:
             sd.sleep(100)
 
-def save_audio_from_buffer(filename):
-    sf.write(filename, np.array(audio_buffer), AUDIO_SR)
-    audio_buffer.clear() 
+def save_audio_from_buffer(filename, t_start=None, t_end=None):
+    """Audio of [t_start, t_end] (epoch sec) from the ring; without a range the last segment."""
+    if t_start is None or t_end is None:
+        samples = audio_buffer.latest(AUDIO_DURATION)
+    else:
+        samples = audio_buffer.slice(t_start, t_end)
+    sf.write(filename, samples, AUDIO_SR, subtype="PCM_16")
 
 def check_buffer(buffer, frame_number):
     while len(buffer) > frame_number:
         buffer.popleft()
     return buffer
 
-def upload_to_server(file_path, start_time, end_time, format, camera_type):
+def upload_to_server(file_path, start_time, end_time, format, camera_type, bandwidth=None, segment_id=None):
+    """Resumable upload; raises on failure with progress persisted for the next try."""
+    return upload_video_chunked(file_path, start_time, end_time, format, camera_type, bandwidth, segment_id)
+
+def audio_for_segment(start_time, end_time, time_format="%Y-%m-%d %H:%M:%S"):
+    """int16 samples of exactly [start_time, end_time] from the audio ring."""
+    return audio_buffer.slice(datetime.strptime(start_time, time_format).timestamp(),
+                              datetime.strptime(end_time, time_format).timestamp())
+
+def _feed_pipe(fd, data):
     try:
-        upload_video(file_path, start_time, end_time, format, camera_type)
-    except Exception as e:
-        print(f"Upload failed: {e}")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+    except BrokenPipeError:
+        pass
 
-def save_video(buffer, output_file, fps, audio_file=None):
+def save_video(buffer, output_file, fps, audio_file=None, audio=None):
+    """
+    Encode frames (+ audio) into output_file. Audio is either int16 samples
+    (audio=, streamed to ffmpeg through a second pipe, nothing written to
+    disk) or an existing file (audio_file=).
+    """
     frames = buffer
     if not frames:
         print(f"[WARN] Empty buffer, nothing to save: {output_file}")
@@ -170,26 +228,51 @@ def save_video(buffer, output_file, fps, audio_file=None):
         "ffmpeg", "-y", "-f", "rawvideo", "-vcodec", "rawvideo", "-pix_fmt", "bgr24",
         "-s", f"{width}x{height}", "-r", str(fps), "-i", "-"
     ]
+    audio_rfd = audio_wfd = None
+    tmp_wav = None
+    if audio is not None and len(audio):
+        if os.name == "nt":
+            # no fd passing on Windows: fall back to a temp WAV
+            tmp_wav = output_file + ".wav"
+            sf.write(tmp_wav, audio, AUDIO_SR, subtype="PCM_16")
+            audio_file = tmp_wav
+        else:
+            audio_rfd, audio_wfd = os.pipe()
+            command += ["-f", "s16le", "-ar", str(AUDIO_SR), "-ac", str(CHANNELS),
+                        "-i", f"pipe:{audio_rfd}", "-c:a", "aac", "-b:a", "96k"]
     if audio_file:
         command += ["-i", audio_file, "-c:a", "aac", "-b:a", "96k"]
 
+    # fixed 1 s GOP so event clips can be stream-copy cut from this segment
     command += ["-c:v", "libx264", "-pix_fmt", "yuv420p",
-                "-crf", "28", "-preset", "ultrafast", output_file]
-
-    process = subprocess.Popen(command, stdin=subprocess.PIPE)
-    for frame in frames:
-        process.stdin.write(frame.astype(np.uint8).tobytes())
-    process.stdin.close()
-    process.communicate()
+                "-crf", "28", "-preset", "ultrafast", *keyframe_args(fps), output_file]
 
-def save_upload_in_background(buffer, output_file, fps, start_time, end_time, format, camera_type, audio_file=None):
+    try:
+        if audio_rfd is None:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        else:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, pass_fds=(audio_rfd,))
+            os.close(audio_rfd)
+            # ffmpeg reads both inputs interleaved, so audio goes in from its own thread
+            feeder = threading.Thread(target=_feed_pipe, args=(audio_wfd, audio.astype(np.int16).tobytes()),
+                                      daemon=True)
+            feeder.start()
+        for frame in frames:
+            process.stdin.write(frame.astype(np.uint8).tobytes())
+        process.stdin.close()
+        process.communicate()
+    finally:
+        if tmp_wav and os.path.exists(tmp_wav):
+            os.remove(tmp_wav)
+
+def save_upload_in_background(buffer, output_file, fps, start_time, end_time, format, camera_type, with_audio=False):
     def task():
-        if audio_file:
-            save_audio_from_buffer(audio_file)
-        save_video(buffer, output_file, fps, audio_file)
-        if os.path.exists(audio_file):
-            os.remove(audio_file)
-        upload_to_server(output_file, start_time, end_time, format, camera_type)
+        audio = audio_for_segment(start_time, end_time) if with_audio else None
+        save_video(buffer, output_file, fps, audio=audio)
+        try:
+            upload_to_server(output_file, start_time, end_time, format, camera_type)
+        except Exception as e:
+            print(f"Upload failed: {e}")
     threading.Thread(target=task, daemon=True).start()
 
 def getColours(cls_num):
@@ -200,25 +283,9 @@ def getColours(cls_num):
     return tuple(color)
 
 def play_alert(violation):
+    # played by alert_engine: preloaded sounds, one mixer shared by both cameras
     if violation in violation_sounds:
-        threading.Thread(target=lambda: pygame.mixer.Sound(violation_sounds[violation]).play(), daemon=True).start()
-
-def focal_length(measured_distance, real_width, width_in_rf_image):
-    return (width_in_rf_image * measured_distance) / real_width
-
-def distance_finder(focal_length, real_width, width_in_frame):
-    return (real_width * focal_length) / width_in_frame
-
-def get_width(ref_image, model, cls_name):
-    results = model.predict(ref_image)
-    for result in results:
-        for box in result.boxes:
-            cls = int(box.cls[0])
-            if cls_name == result.names[cls]:
-                x1, _, x2, _ = map(int, box.xyxy[0])
-                return x2 - x1
-    return None
-
+        get_alerts(violation_sounds).send(violation)
 
 def check_to_fast_lane(detected_lines: set) -> bool:
     left_options = {
@@ -236,45 +303,35 @@ def check_to_fast_lane(detected_lines: set) -> bool:
     return any(left in detected_lines for left in left_options) and \
            any(right in detected_lines for right in right_options)
 
-def is_lane_departure_and_fast_lane(model, frame, departure_threshold, frame_center_x, height):
-    detected_lines = set()
-    lanedeparture = False
-    fastlane = False
-    results = model.predict(source=frame, verbose=False)
-    result = results[0]
-    classes_names = result.names
-    for box in result.boxes:
-        [x1, y1, x2, y2] = map(int, box.xyxy[0])
-        cls = int(box.cls[0])
-        class_name = classes_names[cls]
-        x_center = (x1 + x2) / 2
-            # Порог вероятности
-        threshold =  0.4
-        if box.conf[0] > threshold:
-            if  x_center < frame_center_x:
-                class_name = "left_"+class_name
-            else:
-                class_name = "right_"+class_name
-            detected_lines.add(class_name)
-            if abs(x_center - frame_center_x) < departure_threshold:
-                lanedeparture = True
-            #     cv2.putText(frame, f"Lane departure", (50, 50), fonts, 1, (RED), 2)
-            # colour = getColours(cls)
-            # cv2.rectangle(frame, (x1, y1), (x2, y2), colour, 2)
-            # cv2.putText(frame, f'{class_name} {box.conf[0]:.2f}', (x1, y1),
-            #             cv2.FONT_HERSHEY_SIMPLEX, 1, colour, 2)
-    if check_to_fast_lane(detected_lines):
-        fastlane = True
-    # # Нарисовать вертикальную линию в центре кадра (машина)
-    # cv2.line(frame, (frame_center_x, 0), (frame_center_x, height), (200, 200, 200), 2)
-    return frame, lanedeparture, fastlane
-
 #############################################################
-def get_cordinate():
-    return round(89.0 + random.uniform(-0.01, 0.01), 6), round(87.0 + random.uniform(-0.01, 0.01), 6)
-
-def get_distance():
-    return round(random.uniform(10.0, 15.0), 1)
+def get_fix(ts=None):
+    """
+    (fix, valid, age) from gps_service's track at ts (default now). valid:
+    the track has a fix at ts (age 0.0); otherwise it is the last known fix
+    and its age in sec, and (None, False, None) if the track has none at all.
+    """
+    ts = time.time() if ts is None else ts
+    track = get_track()
+    if track is None:
+        return None, False, None
+    fix = track.at(ts)
+    if fix is not None:
+        return fix, True, 0.0
+    fix = track.latest()
+    return (fix, False, round(abs(ts - fix.t), 1)) if fix is not None else (None, False, None)
+
+def get_cordinate(fix):
+    if fix is None:
+        return 0.0, 0.0
+    return round(fix.lat, 6), round(fix.lon, 6)
+
+def get_distance(ts=None):
+    # (odometer in miles, age in sec) from CAN (telemetry.py)
+    telemetry = get_telemetry()
+    km, age = telemetry.at("total_distance_hr", ts)
+    if km is None:
+        km, age = telemetry.at("total_distance", ts)
+    return (round(km * 0.621371, 1), age) if km is not None else (0.0, None)
 
 def get_state():
     return "AR"
@@ -282,29 +339,57 @@ def get_state():
 def get_location():
     return "Arzon State"
 
-def get_direction():
-    return random.choice(["N", "S", "E", "W", "NE", "NW", "SE", "SW"])
+def get_direction(fix):
+    return compass(fix.course) if fix is not None else "N/A"
 
-def get_fuel_level_percent():
-    return random.randint(10, 100)
+def get_fuel_level_percent(ts=None):
+    level, age = get_telemetry().at("fuel_level", ts)
+    return (round(level), age) if level is not None else (0, None)
 
-def get_def_level_percent():
-    return random.randint(5, 50)
+def get_def_level_percent(ts=None):
+    level, age = get_telemetry().at("def_level", ts)
+    return (round(level), age) if level is not None else (0, None)
 
-def get_speed():
-    return random.randint(40, 120)
+def get_speed(fix, ts=None):
+    # mph at ts: wheel-based speed from CAN when the bus had one then, else GPS (same fix as the position)
+    kmh, age = get_telemetry().at("wheel_speed", ts)
+    if kmh is not None and age <= TELEMETRY_MAX_AGE:
+        return round(kmh * 0.621371, 1)
+    if fix is None or np.isnan(fix.speed):
+        return 0.0
+    return round(fix.speed * 2.23694, 1)
 
 
-def create_driver_event(event: str, global_event_id: str = None, status: str = "NEED_REVIEW"):
+def create_driver_event(event: str, global_event_id: str = None, status: str = "NEED_REVIEW", event_ts: float = None):
     """
     Build driver event payload using getter functions for all parameters except `event`.
+    Position, speed and direction are the GPS track's at event_ts (when the event was raised).
+
+    No GPS fix at event_ts: the server requires these fields, so they are
+    never None. They come from the last known fix instead, with gpsValid
+    False and gpsAge its age in sec. Before the first fix ever they are
+    0.0 / "N/A" with gpsAge None. gpsValid is the only thing to check.
+
+    Distance, fuel and DEF level (CAN) follow the same policy: the last
+    value the bus gave at event_ts (telemetry keeps a short history, since
+    the payload may be built minutes later), canValid False when the oldest
+    of them is more than telemetry.MAX_AGE from event_ts, canAge that age in
+    sec, and 0 / None before the bus gave any.
     """
     if global_event_id is None:
         global_event_id = f"GL-EVENT-{random.randint(100000, 999999)}"
 
-    device_datetime = datetime.now().isoformat()
+    if event_ts is None:
+        event_ts = time.time()
+    device_datetime = datetime.fromtimestamp(event_ts).isoformat()
 
-    latitude, longitude = get_cordinate()
+    fix, gps_valid, gps_age = get_fix(event_ts)
+    latitude, longitude = get_cordinate(fix)
+    distance, distance_age = get_distance(event_ts)
+    fuel_level, fuel_age = get_fuel_level_percent(event_ts)
+    def_level, def_age = get_def_level_percent(event_ts)
+    can_ages = (distance_age, fuel_age, def_age)
+    can_age = None if None in can_ages else round(max(can_ages), 1)
 
     return {
         "globalEventId": global_event_id,
@@ -313,13 +398,17 @@ def create_driver_event(event: str, global_event_id: str = None, status: str = "
         "deviceDateTime": device_datetime,
         "latitude": latitude,
         "longitude": longitude,
-        "distance": get_distance(),
+        "distance": distance,
         "state": get_state(),
         "location": get_location(),
-        "direction": get_direction(),
-        "fuelLevelPercent": get_fuel_level_percent(),
-        "defLevelPercent": get_def_level_percent(),
-        "speed": get_speed(),
+        "direction": get_direction(fix),
+        "fuelLevelPercent": fuel_level,
+        "defLevelPercent": def_level,
+        "speed": get_speed(fix, event_ts),
+        "gpsValid": gps_valid,
+        "gpsAge": gps_age,
+        "canValid": can_age is not None and can_age <= TELEMETRY_MAX_AGE,
+        "canAge": can_age,
         "truck": {"id": 1},
         "driver": {"id": 1}
     }
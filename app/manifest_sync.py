@@ -0,0 +1,90 @@
+"""
+Manifest-based sync: upload only what the server is missing.
+
+The device describes every finished, not-yet-confirmed file in the segment
+index (id, sha256, camera, time range, size) and asks the server in one
+request which of them it lacks:
+
+    POST {API_BASE}/video/sync/missing
+         {"deviceId": ..., "segments": [{"id", "sha256", "camera", "kind",
+                                          "startTime", "endTime", "size"}, ...]}
+      -> {"missing": [id, ...]}
+
+Files the server already has are marked uploaded locally and never sent
+again, so after an outage (or a crash mid-upload) the traffic is only what
+is really missing. Uploads carry segmentId/sha256 so the server can match
+them to the manifest.
+"""
+
+import os
+import uuid
+
+from http_client import get_client, API_BASE
+from chunked_upload import file_sha256
+from segment_index import get_index
+
+SYNC_URL = os.getenv("SYNC_URL", f"{API_BASE}/video/sync/missing")
+DEVICE_ID = os.getenv("DEVICE_ID") or ":".join(f"{(uuid.getnode() >> s) & 0xff:02x}" for s in range(40, -1, -8))
+MANIFEST_MAX = 2000   # entries per request; more than that is split
+
+
+def segment_id(camera, path):
+    """Stable id of a file across restarts: device / camera / file name."""
+    return f"{DEVICE_ID}/{camera}/{os.path.basename(path)}"
+
+
+def build_manifest(rows, index=None):
+    """Manifest entries for index rows, hashing files that have no hash yet."""
+    index = index or get_index()
+    entries = []
+    for row in rows:
+        path = row["path"]
+        if not os.path.exists(path):
+            continue
+        sha256 = row["sha256"]
+        if not sha256:
+            sha256 = file_sha256(path)
+            index.set_hash(path, sha256)
+        entries.append({
+            "id": segment_id(row["camera"], path),
+            "path": path,
+            "sha256": sha256,
+            "camera": row["camera"],
+            "kind": row["kind"],
+            "startTime": row["start_ts"],
+            "endTime": row["end_ts"],
+            "size": os.path.getsize(path),
+        })
+    return entries
+
+
+def ask_missing(entries, headers=None):
+    """Set of manifest ids the server does not have. Raises on transport errors."""
+    missing = set()
+    for i in range(0, len(entries), MANIFEST_MAX):
+        batch = [{k: v for k, v in e.items() if k != "path"} for e in entries[i:i + MANIFEST_MAX]]
+        resp = get_client().post_json("sync", SYNC_URL, {"deviceId": DEVICE_ID, "segments": batch},
+                                      headers=headers)
+        resp.raise_for_status()
+        missing.update(resp.json().get("missing", []))
+    return missing
+
+
+def sync(cameras, headers=None, index=None):
+    """
+    Reconcile the index with the server for the given cameras. Marks files
+    the server already has as uploaded. Returns (entries still to upload,
+    oldest first; paths the server already has).
+    """
+    index = index or get_index()
+    rows = index.not_uploaded(list(cameras))
+    if not rows:
+        return [], []
+    entries = build_manifest(rows, index)
+    missing = ask_missing(entries, headers)
+    present = [e["path"] for e in entries if e["id"] not in missing]
+    if present:
+        index.mark_uploaded(present)
+    todo = [e for e in entries if e["id"] in missing]
+    print(f"[SYNC] {len(entries)} unconfirmed, server has {len(present)}, uploading {len(todo)}")
+    return todo, present
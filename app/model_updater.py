@@ -1,6 +1,5 @@
 import os
 import time
-import requests
 import shutil
 import subprocess
 import json
@@ -10,6 +9,7 @@ import zipfile
 import hashlib
 from datetime import datetime
 from dotenv import load_dotenv
+from http_client import get_client
 
 load_dotenv()
 
@@ -76,12 +76,7 @@ def download_file(url: str, dest: str, expected_md5: str = None, timeout: int =
     try:
         logger.info(f"Downloading from {url} → {dest}")
 
-        with requests.get(url, stream=True, timeout=timeout) as r:
-            r.raise_for_status()
-            with open(tmp_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+        get_client().download("model_download", url, tmp_path, timeout=timeout)
 
         shutil.move(tmp_path, dest)
         logger.info(f"Download complete: {dest}")
@@ -207,7 +202,7 @@ def main():
             local_versions = get_local_versions()
             logger.info("Checking for updates...")
 
-            resp = requests.post(SERVER_URL, json=local_versions, timeout=TIMEOUT)
+            resp = get_client().post_json("model_check", SERVER_URL, local_versions, timeout=TIMEOUT)
             resp.raise_for_status()
             data = resp.json()
 
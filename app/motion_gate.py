@@ -0,0 +1,83 @@
+"""
+Vehicle-state gate: full-rate inference only while something is moving.
+
+Parked at a depot both loops would otherwise run their models on the
+same static scene all day. Each loop asks due() before a model run; it
+combines
+
+    speed   GPS speed (ranging.own_speed, gps_service's track), >= MOVING_SPEED is driving
+    motion  mean absolute difference of consecutive frames on the
+            quality gate's small grayscale copy (frame_quality.py, so
+            no extra image work), >= MOTION_DIFF is movement in view
+
+Nothing of either for STATIONARY_TIME makes the camera idle: due() then
+allows one run per 1 / idle_rate seconds (front: a heartbeat, inner: a
+reduced rate so a driver on the phone at a stop is still seen). The
+first frame with speed or motion wakes it up again at once.
+
+counters and summary() show what was saved (runs skipped, idle time).
+"""
+
+import os
+
+from ranging import own_speed
+
+# ----------------- CONFIG -----------------
+MOVING_SPEED = 1.5          # m/s (~3 mph); below is standing, GPS jitter included
+MOTION_DIFF = float(os.getenv("MOTION_DIFF", "2.0"))    # grey levels
+STATIONARY_TIME = float(os.getenv("STATIONARY_TIME", "5"))   # sec
+SPEED_POLL = 1.0            # sec between GPS reads
+# ------------------------------------------
+
+
+class MotionGate:
+    def __init__(self, name, idle_rate, speed=own_speed):
+        self.name = name
+        self.idle_every = 1.0 / idle_rate
+        self.speed_fn = speed
+        self.speed = None
+        self.speed_t = None
+        self.still_since = None
+        self.idle = False
+        self.idle_from = None
+        self.last_run = None
+        self.counters = {"runs": 0, "skipped": 0, "idle_s": 0.0, "wakeups": 0}
+
+    def _speed(self, t):
+        if self.speed_t is None or t - self.speed_t >= SPEED_POLL:
+            self.speed, self.speed_t = self.speed_fn(), t
+        return self.speed
+
+    def moving(self, t, diff):
+        speed = self._speed(t)
+        return (speed is not None and speed >= MOVING_SPEED) or (diff is not None and diff >= MOTION_DIFF)
+
+    def due(self, t, diff):
+        """Should this frame get a model run? diff: frame difference (None if unknown)."""
+        if self.moving(t, diff):
+            self.still_since = None
+            if self.idle:
+                self.idle = False
+                self.counters["idle_s"] += t - self.idle_from
+                self.counters["wakeups"] += 1
+                print(f"[MOTION] {self.name}: moving, full rate")
+        else:
+            self.still_since = self.still_since or t
+            if not self.idle and t - self.still_since >= STATIONARY_TIME:
+                self.idle, self.idle_from = True, t
+                print(f"[MOTION] {self.name}: stationary, {1 / self.idle_every:g} runs/s")
+        if self.idle and self.last_run is not None and t - self.last_run < self.idle_every:
+            self.counters["skipped"] += 1
+            return False
+        self.last_run = t
+        self.counters["runs"] += 1
+        return True
+
+    def summary(self, t):
+        c = dict(self.counters)
+        if self.idle:
+            c["idle_s"] += t - self.idle_from
+        total = c["runs"] + c["skipped"]
+        saved = 100.0 * c["skipped"] / total if total else 0.0
+        return (f"{self.name}: {c['runs']} runs, {c['skipped']} skipped ({saved:.0f}%), "
+                f"idle {c['idle_s']:.0f}s, {c['wakeups']} wakeups")
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Display of the camera loops, off the hot path.
+
+DISPLAY_MODE selects it per unit:
+
+    off     (default) nothing: no window, no copies, no thread
+    window  local cv2 window
+    shared  preview frames in shared memory (frame_share.FrameRing named
+            preview_shm(name)), for a viewer or the live stream to attach:
+                python preview.py --name front
+
+The camera loop only hands over its latest frame and detection entry
+(references, no copy). A separate thread renders at most PREVIEW_FPS times
+a second: it scales the newest frame down once to PREVIEW_SIZE, draws the
+overlay on that small copy (detections.draw) and shows or publishes it.
+"""
+
+import os
+import time
+import argparse
+import threading
+
+import cv2
+
+from frame_share import FrameRing, SharedFrameCapture
+from detections import draw
+
+# ----------------- CONFIG -----------------
+DISPLAY_MODE = os.getenv("DISPLAY_MODE", "off")      # off / window / shared
+PREVIEW_FPS = float(os.getenv("PREVIEW_FPS", "10"))
+PREVIEW_SIZE = (960, 540)
+# ------------------------------------------
+
+DISPLAY_MODES = ("off", "window", "shared")
+
+
+def preview_shm(name):
+    return f"adas_preview_{name}"
+
+
+class Preview:
+    def __init__(self, name, title=None, mode=DISPLAY_MODE, fps=PREVIEW_FPS, size=PREVIEW_SIZE):
+        if mode not in DISPLAY_MODES:
+            raise ValueError(f"DISPLAY_MODE must be one of {DISPLAY_MODES}, not {mode!r}")
+        self.name = name
+        self.title = title or name
+        self.mode = mode
+        self.interval = 1.0 / fps
+        self.size = size
+        self.latest = None
+        self.seq = 0
+        self.ring = None
+        self.quit = threading.Event()   # set when the window was closed with 'q'
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._render_loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def publish(self, frame, entry=None):
+        """Called by the camera loop with every frame; just keeps references."""
+        self.latest = (frame, entry)
+        self.seq += 1
+
+    def _show(self, small):
+        cv2.imshow(self.title, small)
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            self.quit.set()
+
+    def _share(self, small):
+        if self.ring is None:
+            h, w = small.shape[:2]
+            self.ring = FrameRing(preview_shm(self.name), w, h, fps=1.0 / self.interval, slots=2)
+        self.ring.begin()[:] = small.reshape(-1)
+        self.ring.commit()
+
+    def _render_loop(self):
+        out = self._show if self.mode == "window" else self._share
+        if self.mode == "window":
+            try:
+                cv2.namedWindow(self.title, cv2.WINDOW_NORMAL)
+                cv2.resizeWindow(self.title, *self.size)
+            except cv2.error as e:
+                print(f"[PREVIEW] {self.name}: no GUI, display off ({e})")
+                return
+        shown = 0
+        next_at = time.monotonic()
+        while not self.stop_event.is_set():
+            next_at += self.interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            else:
+                next_at = time.monotonic()   # fell behind; don't try to catch up
+            latest, seq = self.latest, self.seq
+            if latest is None or seq == shown:
+                continue
+            shown = seq
+            frame, entry = latest
+            small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+            if entry:
+                h, w = frame.shape[:2]
+                draw(small, entry, (self.size[0] / w, self.size[1] / h))
+            try:
+                out(small)
+            except cv2.error as e:
+                print(f"[PREVIEW] {self.name}: display failed, display off ({e})")
+                return
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+        if self.ring is not None:
+            self.ring.close()
+        if self.mode == "window":
+            try:
+                cv2.destroyAllWindows()
+            except cv2.error:
+                pass
+
+
+def make_preview(name, title=None):
+    """Started Preview for DISPLAY_MODE, or None when display is off."""
+    if DISPLAY_MODE == "off":
+        return None
+    return Preview(name, title).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show a shared camera preview")
+    parser.add_argument("--name", default="front", help="front or inner")
+    args = parser.parse_args()
+    cap = SharedFrameCapture(preview_shm(args.name))
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            continue
+        cv2.imshow(args.name, frame)
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            break
+    cap.release()
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Distance, closing speed and time-to-collision for every tracked vehicle.
+
+Replaces the single reference-image scale factor per class: distances
+come from the camera model (intrinsics + mounting height + pitch), for
+all vehicle boxes of a frame at once, as numpy arrays.
+
+For each box two estimates are made and averaged when both are usable:
+
+    ground plane  the box bottom touches the road: Z = H / tan(angle below horizon)
+    width         Z = fx * real_width[class] / box width
+
+Lateral offset X = (u - cx) * Z / fx puts a vehicle in the ego lane when
+|X| < EGO_LANE_HALF_WIDTH (or between the tracked lane lines when the
+caller passes them).
+
+Per track (tracker.py ids), closing speed is the least-squares slope of
+distance over the last RANGE_WINDOW seconds of its matched boxes, and
+
+    ttc      = distance / closing speed        (only when closing)
+    headway  = distance / own speed            (own speed from the GPS track)
+
+Following-distance events use headway < HEADWAY_MIN or ttc < TTC_MIN on
+the nearest ego-lane vehicle instead of a fixed distance.
+
+Calibration comes from the environment (FRONT_CAM_*). Without fx/fy they
+are derived from FRONT_CAM_HFOV and the frame size.
+"""
+
+import os
+import math
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from gps_track import get_track
+
+# ----------------- CONFIG -----------------
+CAM_FX = os.getenv("FRONT_CAM_FX")                 # px; None -> from HFOV
+CAM_FY = os.getenv("FRONT_CAM_FY")
+CAM_CX = os.getenv("FRONT_CAM_CX")                 # px; None -> frame centre
+CAM_CY = os.getenv("FRONT_CAM_CY")
+CAM_HFOV = float(os.getenv("FRONT_CAM_HFOV", "90"))          # deg, used when FX is not set
+CAM_HEIGHT = float(os.getenv("FRONT_CAM_HEIGHT", "1.5"))     # m above the road
+CAM_PITCH = float(os.getenv("FRONT_CAM_PITCH", "0"))         # deg, positive = tilted down
+
+EGO_LANE_HALF_WIDTH = 1.75   # m
+MIN_GROUND_ANGLE = math.radians(0.5)   # below this the box bottom is at the horizon: ground estimate unusable
+RANGE_WINDOW = 1.0           # sec of box history for closing speed
+MIN_CLOSING = 0.3            # m/s; slower is "not closing"
+MIN_OWN_SPEED = 2.0          # m/s; slower, headway is meaningless
+HEADWAY_MIN = float(os.getenv("HEADWAY_MIN", "1.0"))   # sec
+TTC_MIN = float(os.getenv("TTC_MIN", "2.5"))           # sec
+# ------------------------------------------
+
+# typical real widths, m
+VEHICLE_WIDTH = {"car": 1.8, "truck": 2.5, "bus": 2.55, "motorbike": 0.8, "bicycle": 0.6}
+
+Range = namedtuple("Range", "track_id cls box distance lateral in_lane closing_speed ttc headway")
+
+
+class Ranger:
+    def __init__(self, width, height, fx=CAM_FX, fy=CAM_FY, cx=CAM_CX, cy=CAM_CY,
+                 hfov=CAM_HFOV, mount_height=CAM_HEIGHT, pitch=CAM_PITCH):
+        default_f = (width / 2) / math.tan(math.radians(hfov) / 2)
+        self.fx = float(fx) if fx else default_f
+        self.fy = float(fy) if fy else self.fx
+        self.cx = float(cx) if cx else width / 2
+        self.cy = float(cy) if cy else height / 2
+        self.mount_height = mount_height
+        self.pitch = math.radians(pitch)
+
+    # ---------------- per frame, vectorized ----------------
+
+    def distances(self, boxes, classes):
+        """(distance, lateral) in metres for boxes (N,4 xyxy) of the given classes."""
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        real_w = np.array([VEHICLE_WIDTH.get(c, np.nan) for c in classes], dtype=float)
+        w_px = np.maximum(boxes[:, 2] - boxes[:, 0], 1.0)
+        z_width = self.fx * real_w / w_px
+
+        below = np.arctan((boxes[:, 3] - self.cy) / self.fy) + self.pitch
+        ground_ok = below > MIN_GROUND_ANGLE
+        z_ground = np.where(ground_ok, self.mount_height / np.tan(np.maximum(below, MIN_GROUND_ANGLE)), np.nan)
+
+        z = np.where(ground_ok & ~np.isnan(z_width), (z_ground + z_width) / 2,
+                     np.where(ground_ok, z_ground, z_width))
+        u = (boxes[:, 0] + boxes[:, 2]) / 2
+        x = (u - self.cx) * z / self.fx
+        return z, x
+
+    def update(self, tracks, now, own_speed=None, lane_bounds=None):
+        """
+        Ranges of all vehicle tracks (tracker.TrackView) at time now.
+        own_speed in m/s (None if unknown); lane_bounds (left_x, right_x) in
+        metres at the vehicle's distance, if a lane tracker provides them.
+        """
+        vehicles = [trk for trk in tracks if trk.cls in VEHICLE_WIDTH]
+        if not vehicles:
+            return []
+        z, x = self.distances([trk.box for trk in vehicles], [trk.cls for trk in vehicles])
+        if lane_bounds is not None:
+            in_lane = (x > lane_bounds[0]) & (x < lane_bounds[1])
+        else:
+            in_lane = np.abs(x) < EGO_LANE_HALF_WIDTH
+        out = []
+        for k, trk in enumerate(vehicles):
+            closing = self.closing_speed(trk, now)
+            ttc = z[k] / closing if closing > MIN_CLOSING else math.inf
+            headway = z[k] / own_speed if own_speed and own_speed > MIN_OWN_SPEED else math.inf
+            out.append(Range(trk.id, trk.cls, trk.box, float(z[k]), float(x[k]), bool(in_lane[k]),
+                             closing, float(ttc), float(headway)))
+        return out
+
+    def closing_speed(self, trk, now):
+        """m/s the track is approaching (negative: pulling away), 0 without enough history."""
+        pts = [(t, box) for t, box in trk.history if now - t <= RANGE_WINDOW]
+        if len(pts) < 3 or pts[-1][0] - pts[0][0] < RANGE_WINDOW / 3:
+            return 0.0
+        ts = np.array([t for t, _ in pts])
+        z, _ = self.distances([box for _, box in pts], [trk.cls] * len(pts))
+        ok = ~np.isnan(z)
+        if ok.sum() < 3:
+            return 0.0
+        slope = np.polyfit(ts[ok] - ts[ok][0], z[ok], 1)[0]
+        return float(-slope)
+
+
+def lead_vehicle(ranges):
+    """Nearest ego-lane vehicle, or None."""
+    ahead = [r for r in ranges if r.in_lane and not math.isnan(r.distance)]
+    return min(ahead, key=lambda r: r.distance) if ahead else None
+
+
+def too_close(lead):
+    """Following-distance rule: short time headway or a collision course."""
+    return lead is not None and (lead.headway < HEADWAY_MIN or lead.ttc < TTC_MIN)
+
+
+def own_speed(t=None):
+    """Vehicle speed in m/s from the GPS track (gps_service.py), None if there is no fix."""
+    track = get_track()
+    fix = track.at(time.time() if t is None else t) if track is not None else None
+    if fix is None or math.isnan(fix.speed):
+        return None
+    return fix.speed
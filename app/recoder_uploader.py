@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 """
 Run two ffmpeg capture processes:
- - camera A: /dev/video2  -> virtual /dev/video10 + segments -> recordings/cam0/
- - camera B: /dev/video6  -> virtual /dev/video11 + segments -> recordings/cam1/
+ - camera A: /dev/video2  -> raw frames (shm "adas_cam0") + segments -> recordings/cam0/
+ - camera B: /dev/video6  -> raw frames (shm "adas_cam1") + segments -> recordings/cam1/
+
+CAPTURE_MODE=loopback writes the raw frames to v4l2loopback devices
+/dev/video10 / /dev/video11 instead (needs the kernel module and sudo).
 
 Track created mp4 files in SQLite and upload them to SERVER_URL.
 """
@@ -10,14 +13,22 @@ Track created mp4 files in SQLite and upload them to SERVER_URL.
 import os
 import sys
 import time
-import sqlite3
 import threading
 import subprocess
 import signal
-import shutil
 from pathlib import Path
 from datetime import datetime
-import requests
+from http_client import get_client
+from upload_scheduler import get_scheduler, UploadJob
+from segment_index import get_index
+from event_clips import ClipBuilder, keyframe_args, FRAGMENTED_MP4_OPTS
+from manifest_sync import sync, segment_id
+from chunked_upload import file_sha256
+from segment_watcher import SegmentWatcher
+from upload_store import UploadStore
+from retention import RetentionManager
+from frame_share import FrameRing
+from audio_service import socket_path
 
 # ----------------- CONFIG -----------------
 # Edit these to match your environment
@@ -31,12 +42,29 @@ CAM_B_AUDIO = "hw:1,0"
 CAM_B_VDEV  = "/dev/video11"
 CAM_B_OUTDIR = Path("recordings/cam1")
 
+# camera_type the camera processes report events with -> recorder camera
+EVENT_CAMERAS = {"INSIDE": "cam0", "OUTSIDE": "cam1"}
+
+# how inference processes get raw frames from the same ffmpeg:
+#   "shm"      - BGR frames on ffmpeg stdout -> shared memory ring (frame_share.py)
+#   "loopback" - yuv420p into v4l2loopback devices (CAM_*_VDEV)
+CAPTURE_MODE = os.getenv("CAPTURE_MODE", "shm")
+CAM_A_SHM = "adas_cam0"
+CAM_B_SHM = "adas_cam1"
+
+# where the segment audio comes from:
+#   "alsa"    - ffmpeg opens CAM_*_AUDIO itself (the mic is then busy for everyone else)
+#   "service" - live PCM from audio_service.py for that device (mic shared with the camera loops)
+AUDIO_SOURCE = os.getenv("AUDIO_SOURCE", "alsa")
+
 # ffmpeg options (tweak CRF / bitrate as desired)
 VIDEO_SIZE = "1280x720"
 FRAMERATE = 30
 CRF = 28
 PRESET = "veryfast"
 AUDIO_BITRATE = "128k"
+SEGMENT_TIME = 60  # sec per segment file
+SEGMENT_NAME_FORMAT = "%Y-%m-%d_%H-%M-%S"
 
 # sqlite DB
 DB_PATH = Path("video_uploader.db")
@@ -44,11 +72,22 @@ DB_PATH = Path("video_uploader.db")
 # Server upload endpoint (REPLACE with your real server)
 SERVER_URL = "https://example.com/upload"  # <-- change this
 
-# how often (sec) to scan directories for new files
-SCAN_INTERVAL = 5
+# parallel upload workers (they share the scheduler's bandwidth cap)
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "3"))
 
-# uploader loop sleep between retries for files with failures (exponential backoff base)
+# per-file retry delay after a failure: UPLOAD_RETRY_BASE * 2^retries, at most UPLOAD_RETRY_CAP
 UPLOAD_RETRY_BASE = 5
+UPLOAD_RETRY_CAP = 300
+
+# a claim not refreshed for this long belongs to a dead worker and is released
+CLAIM_TIMEOUT = 120
+REAP_INTERVAL = 30
+
+# manifest sync with the server: at start, after failed uploads and every SYNC_INTERVAL
+SYNC_INTERVAL = 600
+
+# sec between metrics log lines (HTTP pool / retries)
+STATS_INTERVAL = 300
 
 # ensure directories exist
 CAM_A_OUTDIR.mkdir(parents=True, exist_ok=True)
@@ -56,59 +95,14 @@ CAM_B_OUTDIR.mkdir(parents=True, exist_ok=True)
 # ------------------------------------------
 
 # ---------------- DB helpers ----------------
-def init_db(conn):
-    cur = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS files (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        path TEXT UNIQUE NOT NULL,
-        camera TEXT NOT NULL,
-        created_at TEXT NOT NULL,
-        size_bytes INTEGER NOT NULL,
-        status TEXT NOT NULL, -- pending / uploading / uploaded / error
-        retries INTEGER NOT NULL DEFAULT 0,
-        last_error TEXT,
-        uploaded_at TEXT
-    )
-    """)
-    conn.commit()
-
-def add_file_record(conn, path: str, camera: str):
-    stat = os.stat(path)
-    created = datetime.utcnow().isoformat()
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-        INSERT INTO files (path, camera, created_at, size_bytes, status)
-        VALUES (?, ?, ?, ?, 'pending')
-        """, (str(path), camera, created, stat.st_size))
-        conn.commit()
-        print(f"[DB] Added {path} ({camera})")
-    except sqlite3.IntegrityError:
-        # already exists
-        pass
+# files table lives in upload_store.UploadStore (WAL, single writer thread)
 
-def mark_uploaded(conn, path: str):
-    cur = conn.cursor()
-    cur.execute("""
-    UPDATE files SET status='uploaded', uploaded_at=?, last_error=NULL WHERE path=?
-    """, (datetime.utcnow().isoformat(), str(path)))
-    conn.commit()
-
-def mark_error(conn, path: str, errmsg: str):
-    cur = conn.cursor()
-    cur.execute("""
-    UPDATE files SET status='error', retries=retries+1, last_error=?, uploaded_at=NULL WHERE path=?
-    """, (errmsg, str(path)))
-    conn.commit()
-
-def mark_uploading(conn, path: str):
-    cur = conn.cursor()
-    cur.execute("""
-    UPDATE files SET status='uploading' WHERE path=? AND status='pending'
-    """, (str(path),))
-    conn.commit()
-    return cur.rowcount > 0
+def add_file_record(store, path: str, camera: str):
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return None
+    return store.add_file(path, camera, size)
 
 # ---------------- ffmpeg process helpers ----------------
 
@@ -135,14 +129,31 @@ def ensure_v4l2loopback(devices=("10","11")):
         print("[ERR] Couldn't load v4l2loopback:", e)
         return False
 
+def raw_frame_output(vdev):
+    """ffmpeg output args for the raw frames inference reads (see CAPTURE_MODE)."""
+    if CAPTURE_MODE == "loopback":
+        # map raw video to virtual camera (no h264)
+        return ["-map", "0:v", "-pix_fmt", "yuv420p", "-f", "v4l2", vdev]
+    # raw BGR on stdout, copied into shared memory by FrameRing.pump
+    return ["-map", "0:v", "-pix_fmt", "bgr24", "-f", "rawvideo", "pipe:1"]
+
+def audio_input(audio_dev):
+    """ffmpeg input args for the segment audio (see AUDIO_SOURCE)."""
+    if AUDIO_SOURCE == "service":
+        return ["-probesize", "32", "-analyzeduration", "0",
+                "-f", "s16le", "-ar", "44100", "-ac", "1", "-i", f"unix:{socket_path(audio_dev)}"]
+    return ["-f", "alsa", "-i", audio_dev]
+
 def build_ffmpeg_cmd(video_dev, audio_dev, vdev, outdir, camera_name):
     """
     Returns a list command to run ffmpeg that:
-      - reads from video_dev and audio_dev
-      - maps raw video to vdev (pix_fmt yuv420p)
+      - reads from video_dev and audio_dev (camera decoded once)
+      - outputs raw frames for inference (stdout or vdev, see CAPTURE_MODE)
       - writes video+audio to segments in outdir using strftime naming
+        (fixed 1 s GOP, fragmented mp4 so event clips can be cut from the
+        segment that is still being written)
     """
-    outpattern = str(Path(outdir) / "%Y-%m-%d_%H-%M-%S.mp4")
+    outpattern = str(Path(outdir) / f"{SEGMENT_NAME_FORMAT}.mp4")
     cmd = [
         "ffmpeg",
         "-thread_queue_size", "512",
@@ -152,17 +163,14 @@ def build_ffmpeg_cmd(video_dev, audio_dev, vdev, outdir, camera_name):
         "-video_size", VIDEO_SIZE,
         "-i", video_dev,
         "-thread_queue_size", "512",
-        "-f", "alsa",
-        "-i", audio_dev,
-        # map raw video to virtual camera (no h264)
-        "-map", "0:v",
-        "-pix_fmt", "yuv420p",
-        "-f", "v4l2", vdev,
+        *audio_input(audio_dev),
+        *raw_frame_output(vdev),
         # now map video+audio to segment writer
         "-map", "0:v", "-map", "1:a",
-        "-c:v", "libx264", "-preset", PRESET, "-crf", str(CRF),
+        "-c:v", "libx264", "-preset", PRESET, "-crf", str(CRF), *keyframe_args(FRAMERATE),
         "-c:a", "aac", "-b:a", AUDIO_BITRATE,
-        "-f", "segment", "-strftime", "1", "-segment_time", "60", "-reset_timestamps", "1",
+        "-f", "segment", "-strftime", "1", "-segment_time", str(SEGMENT_TIME), "-reset_timestamps", "1",
+        "-segment_format_options", FRAGMENTED_MP4_OPTS,
         outpattern
     ]
     return cmd
@@ -202,22 +210,24 @@ def build_ffmpeg_cmd(video_dev, audio_dev, vdev, outdir, camera_name):
 
 # ---------------- file watcher ----------------
 
-def watch_dirs_and_register(conn, dirs_cameras):
-    """Periodically scan directories for new mp4 files and insert into DB."""
-    seen = set()
-    while True:
-        for d, cam in dirs_cameras:
-            for path in sorted(Path(d).glob("*.mp4")):
-                if str(path) not in seen:
-                    # only register finished files (size non-zero and mtime older than 1s)
-                    try:
-                        st = path.stat()
-                        if st.st_size > 100 and (time.time() - st.st_mtime) > 5:
-                            add_file_record(conn, str(path), cam)
-                            seen.add(str(path))
-                    except FileNotFoundError:
-                        continue
-        time.sleep(SCAN_INTERVAL)
+def make_segment_watcher(store, dirs_cameras):
+    """
+    inotify watcher: a segment is indexed (complete=0) as soon as ffmpeg opens
+    it, so clips can cut from it already, and registered for upload the moment
+    ffmpeg closes it.
+    """
+    index = get_index()
+
+    def on_open(path, cam):
+        start_ts, end_ts = segment_time_range(path)
+        index.add(path, cam, start_ts, end_ts, complete=False)
+
+    def on_complete(path, cam):
+        start_ts, end_ts = segment_time_range(path)
+        add_file_record(store, path, cam)
+        index.add(path, cam, start_ts, end_ts)
+
+    return SegmentWatcher(dirs_cameras, on_complete, on_open=on_open)
 
 # def watch_dirs_and_register(conn, dirs_cameras):
 #     """Yangi tugagan .mp4 fayllarni DBga qo‘shadi."""
@@ -242,83 +252,159 @@ def watch_dirs_and_register(conn, dirs_cameras):
 
 # ---------------- uploader ----------------
 
-def upload_file(session, path):
+def segment_time_range(path):
+    """(start_ts, end_ts) of a segment from its strftime file name."""
+    try:
+        start = datetime.strptime(Path(path).stem, SEGMENT_NAME_FORMAT).timestamp()
+    except ValueError:
+        start = os.path.getmtime(path) - SEGMENT_TIME
+    return start, start + SEGMENT_TIME
+
+def upload_file(path, bandwidth=None, fields=None):
     """Upload one file. Return True if success, False otherwise, and error message."""
-    fname = Path(path).name
-    url = SERVER_URL
     try:
-        with open(path, "rb") as f:
-            files = {"file": (fname, f, "video/mp4")}
-            # adjust to your server's requirements (auth headers, extra fields)
-            resp = session.post(url, files=files, timeout=30)
-            if resp.status_code == 200:
-                return True, None
-            else:
-                return False, f"HTTP {resp.status_code}: {resp.text[:200]}"
+        # adjust to your server's requirements (auth headers, extra fields)
+        resp = get_client().upload_file("recorder_upload", SERVER_URL, path, fields=fields,
+                                        content_type="video/mp4", bandwidth=bandwidth)
+        if resp.status_code == 200:
+            return True, None
+        else:
+            return False, f"HTTP {resp.status_code}: {resp.text[:200]}"
     except Exception as e:
         return False, str(e)
 
-# def uploader_loop(conn, stop_event):
-#     session = requests.Session()
-#     backoff = UPLOAD_RETRY_BASE
-#     while not stop_event.is_set():
-#         cur = conn.cursor()
-#         cur.execute("SELECT path, retries FROM files WHERE status IN ('pending','error') ORDER BY created_at")
-#         rows = cur.fetchall()
-#         if not rows:
-#             time.sleep(2)
-#             continue
-#         for path, retries in rows:
-#             if stop_event.is_set():
-#                 break
-#             # set uploading only if currently pending (avoid races)
-#             mark_uploading(conn, path)
-#             success, err = upload_file(session, path)
-#             if success:
-#                 mark_uploaded(conn, path)
-#                 print(f"[UPLOAD] Sent {path}")
-#                 backoff = UPLOAD_RETRY_BASE
-#             else:
-#                 mark_error(conn, path, err)
-#                 print(f"[UPLOAD] Failed {path}: {err}")
-#                 # exponential backoff on global loop
-#                 time.sleep(min(backoff, 300))
-#                 backoff *= 2
-#         # small sleep to avoid busy loop
-#         time.sleep(1)
-
-def uploader_loop(conn, stop_event):
-    """Doimiy cheksiz upload retry loop."""
-    session = requests.Session()
+def sync_with_server(store, cameras):
+    """
+    Manifest sync: serverda allaqachon bor fayllar 'uploaded' bo‘ladi,
+    yetishmayotgan 'error' fayllar yana 'pending' ga qaytadi.
+    """
+    try:
+        todo, present = sync(cameras)
+    except Exception as e:
+        print(f"[SYNC] Failed: {e}")
+        return False
+    for path in present:
+        store.mark_uploaded(path)
+    for entry in todo:
+        store.mark_pending(entry["path"])
+    print(f"[SYNC] Recorder: {len(present)} already on the server, {len(todo)} to upload")
+    return True
+
+def upload_fields(index, camera, path):
+    """segmentId/sha256 so the server can match the upload to the sync manifest."""
+    row = index.get(path)
+    sha256 = row["sha256"] if row is not None and row["sha256"] else None
+    if sha256 is None:
+        sha256 = file_sha256(path)
+        index.set_hash(path, sha256)
+    return {"segmentId": segment_id(camera, path), "sha256": sha256}
+
+def upload_worker(store, stop_event, active, resync):
+    """Bitta upload worker: navbatdan oladi, atomik claim qiladi, yuklaydi."""
+    scheduler = get_scheduler()
+    index = get_index()
+    me = threading.current_thread()
     while not stop_event.is_set():
-        cur = conn.cursor()
-        cur.execute("SELECT path FROM files WHERE status='pending' ORDER BY created_at")
-        rows = cur.fetchall()
-        if not rows:
-            time.sleep(3)
+        job = scheduler.get(timeout=3)
+        if job is None:
+            continue
+        # pending -> uploading atomik: boshqa worker olgan bo‘lsa o‘tkazib yuboramiz
+        if not store.claim(job.path):
+            continue
+        if not os.path.exists(job.path):
+            # disk to‘lganda retention o‘chirib yuborgan
+            store.mark_evicted(job.path)
             continue
-        for (path,) in rows:
-            if stop_event.is_set():
-                break
-            # upload qilamiz
-            success, err = upload_file(session, path)
-            if success:
-                mark_uploaded(conn, path)
-                print(f"[UPLOAD] Sent {path}")
-            else:
-                # status 'pending' qoladi → keyingi loopda qayta urinadi
-                mark_error(conn, path, err)
-                print(f"[UPLOAD] Failed {path}: {err}")
-                time.sleep(10)  # keyingi urinish oldidan kutish
+        active[job.path] = me
+        try:
+            with scheduler.transfer():
+                success, err = upload_file(job.path, bandwidth=scheduler,
+                                           fields=upload_fields(index, job.camera, job.path))
+        except Exception as e:
+            success, err = False, str(e)
+        finally:
+            active.pop(job.path, None)
+        if success:
+            store.mark_uploaded(job.path)
+            index.mark_uploaded([job.path])
+            print(f"[UPLOAD] {me.name} sent {job.path}")
+        else:
+            # faqat shu fayl kutadi, boshqa workerlar davom etadi
+            delay = store.retry_later(job.path, err, UPLOAD_RETRY_BASE, UPLOAD_RETRY_CAP).result()
+            print(f"[UPLOAD] {me.name} failed {job.path}: {err} (retry in {delay:.0f}s)")
+            resync.set()
+
+def uploader_loop(store, stop_event, cameras=("cam0", "cam1"), workers=UPLOAD_WORKERS):
+    """
+    Doimiy cheksiz upload: vaqti kelgan 'pending' fayllarni scheduler'ga beradi
+    (event segmentlari birinchi), N worker parallel yuklaydi, o‘lik claim'lar qaytariladi.
+    """
+    scheduler = get_scheduler()
+    active = {}                 # path -> worker thread uploading it
+    resync = threading.Event()  # upload failed: ask the server again what it is missing
+    resync.set()                # start: avval serverdan nima yetishmayotganini so‘raymiz
+
+    def start_worker(i):
+        t = threading.Thread(target=upload_worker, args=(store, stop_event, active, resync),
+                             name=f"upload-{i}", daemon=True)
+        t.start()
+        return t
+
+    pool = [start_worker(i) for i in range(workers)]
+    last_reap = last_sync = 0.0
+    last_stats = time.monotonic()
+    while not stop_event.is_set():
+        if time.monotonic() - last_sync >= SYNC_INTERVAL:
+            resync.set()
+        if resync.is_set() and sync_with_server(store, cameras):
+            resync.clear()
+            last_sync = time.monotonic()
+        for path, camera in store.pending():
+            if path not in scheduler:
+                start_ts, end_ts = segment_time_range(path)
+                scheduler.submit(UploadJob(path, path, start_ts, end_ts, camera))
+
+        if time.monotonic() - last_reap >= REAP_INTERVAL:
+            last_reap = time.monotonic()
+            for i, t in enumerate(pool):
+                if not t.is_alive():
+                    print(f"[UPLOAD] {t.name} died, restarting")
+                    pool[i] = start_worker(i)
+            store.touch_claims([p for p, t in list(active.items()) if t.is_alive()])
+            reaped = store.reap_stale_claims(CLAIM_TIMEOUT).result()
+            if reaped:
+                print(f"[UPLOAD] Released {reaped} stale claims")
+
+        if time.monotonic() - last_stats >= STATS_INTERVAL:
+            last_stats = time.monotonic()
+            print(f"[HTTP] {get_client().summary()}")
+            print(f"[SCHED] {scheduler.stats()}")
+        stop_event.wait(3)
 
 
 # ---------------- main process management ----------------
 
 def start_ffmpeg_process(cmd, name):
     print(f"[FFMPEG] Starting {name}: {' '.join(cmd[:6])} ...")
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
+    # stdout carries raw frames in shm mode, so the pipes are binary
+    stdout = subprocess.PIPE if CAPTURE_MODE == "shm" else subprocess.DEVNULL
+    p = subprocess.Popen(cmd, stdout=stdout, stderr=subprocess.PIPE, bufsize=0)
     return p
 
+def start_frame_pump(proc, shm_name, stop_event):
+    """Copy ffmpeg's raw frames into shared memory for the inference processes."""
+    width, height = (int(v) for v in VIDEO_SIZE.split("x"))
+    ring = FrameRing(shm_name, width, height, fps=FRAMERATE)
+
+    def pump():
+        try:
+            ring.pump(proc.stdout, stop_event)
+        finally:
+            ring.close()
+
+    threading.Thread(target=pump, daemon=True).start()
+    return ring
+
 def stream_process_logger(proc, name, stop_event):
     """Read stderr of ffmpeg and print lines (non-blocking)."""
     try:
@@ -329,20 +415,28 @@ def stream_process_logger(proc, name, stop_event):
                     break
                 time.sleep(0.1)
                 continue
-            print(f"[{name}] {line.rstrip()}")
+            print(f"[{name}] {line.decode(errors='replace').rstrip()}")
     except Exception:
         pass
 
 def main():
     # Ensure DB
-    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
-    init_db(conn)
+    store = UploadStore(DB_PATH)
+    store.release_claims()  # uploads interrupted by the last shutdown start over
 
     # Ensure v4l2loopback present
-    if not ensure_v4l2loopback(devices=("10","11")):
+    if CAPTURE_MODE == "loopback" and not ensure_v4l2loopback(devices=("10","11")):
         print("[FATAL] v4l2loopback not present. Please install v4l2loopback-dkms and try again.")
         sys.exit(1)
 
+    # files finished while we were down: reconcile disk with the DB before ffmpeg starts writing
+    watcher = make_segment_watcher(store, [(CAM_A_OUTDIR, "cam0"), (CAM_B_OUTDIR, "cam1")])
+    watcher.reconcile(store.is_registered)
+
+    # make room before the encoders start, then keep ahead of them
+    retention = RetentionManager(disk=str(CAM_A_OUTDIR))
+    retention.check()
+
     # Build ffmpeg commands
     cmd_a = build_ffmpeg_cmd(CAM_A_VIDEO, CAM_A_AUDIO, CAM_A_VDEV, CAM_A_OUTDIR, "cam0")
     cmd_b = build_ffmpeg_cmd(CAM_B_VIDEO, CAM_B_AUDIO, CAM_B_VDEV, CAM_B_OUTDIR, "cam1")
@@ -352,18 +446,43 @@ def main():
     proc_b = start_ffmpeg_process(cmd_b, "cam1")
 
     stop_event = threading.Event()
+    if CAPTURE_MODE == "shm":
+        start_frame_pump(proc_a, CAM_A_SHM, stop_event)
+        start_frame_pump(proc_b, CAM_B_SHM, stop_event)
     # start logger threads
     t_log_a = threading.Thread(target=stream_process_logger, args=(proc_a, "cam0", stop_event), daemon=True)
     t_log_b = threading.Thread(target=stream_process_logger, args=(proc_b, "cam1", stop_event), daemon=True)
     t_log_a.start(); t_log_b.start()
 
+    retention.start(stop_event)
+
     # start directory watcher thread
-    watcher = threading.Thread(target=watch_dirs_and_register, args=(conn, [(CAM_A_OUTDIR, "cam0"), (CAM_B_OUTDIR, "cam1")]), daemon=True)
-    watcher.start()
+    t_watch = threading.Thread(target=watcher.run, args=(stop_event,), daemon=True)
+    t_watch.start()
+
+    # event clips: events come from the camera processes via the scheduler's shared events file
+    cameras = ("cam0", "cam1")
+    clip_builder = ClipBuilder(on_ready=lambda path, cam, t0, t1, label: add_file_record(store, path, cam))
+    scheduler = get_scheduler()
+    scheduler.camera_aliases = EVENT_CAMERAS
+
+    def on_event(ts, cam):
+        for c in cameras:
+            if cam in (None, c):
+                clip_builder.request(ts, c)
+
+    scheduler.add_listener(on_event)
+
+    def follow_events():
+        while not stop_event.is_set():
+            scheduler.refresh_events()
+            time.sleep(0.5)
+
+    threading.Thread(target=follow_events, daemon=True).start()
 
     # start uploader thread
     uploader_stop = threading.Event()
-    uploader = threading.Thread(target=uploader_loop, args=(conn, uploader_stop), daemon=True)
+    uploader = threading.Thread(target=uploader_loop, args=(store, uploader_stop), daemon=True)
     uploader.start()
 
     def handle_sigint(sig, frame):
@@ -381,7 +500,7 @@ def main():
             if p and p.poll() is None:
                 print("[MAIN] Killing ffmpeg pid", p.pid)
                 p.kill()
-        conn.close()
+        store.close()
         sys.exit(0)
 
     signal.signal(signal.SIGINT, handle_sigint)
@@ -398,7 +517,7 @@ def main():
                     print(f"[MAIN] {name} ffmpeg exited with code {p.returncode}. Exiting.")
                     handle_sigint(None, None)
     finally:
-        conn.close()
+        store.close()
 
 if __name__ == "__main__":
     main()
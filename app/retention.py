@@ -0,0 +1,150 @@
+"""
+Disk retention for recorded footage.
+
+Every file the device records is in segment_index (camera-loop segments,
+recoder_uploader segments, event clips, audio_service segments) with its size, kind and upload
+state, so retention works from that index and never walks the tree.
+
+When indexed footage exceeds RETENTION_QUOTA, or the disk holding it has
+less than RETENTION_MIN_FREE free, files are deleted oldest first in this
+order until usage is back under the low watermark (RETENTION_LOW_WATERMARK
+of the quota) with free space to spare:
+
+    1. uploaded segments        (routine footage the server already has)
+    2. audio_service segments   (camera segments carry their own audio)
+    3. uploaded event clips
+    4. segments not uploaded yet
+    5. event clips not uploaded yet
+
+Files still being written are never touched. The check runs every
+RETENTION_INTERVAL seconds and before capture starts, and free space is
+kept RETENTION_MIN_FREE ahead of the encoders, so ffmpeg never hits a full
+disk. Several processes may start a manager; an flock on RETENTION_LOCK
+lets only one of them evict at a time.
+"""
+
+import os
+import fcntl
+import shutil
+import threading
+
+from segment_index import get_index, PARENT_DIR
+from detections import sidecar_path
+from detection_store import store_path
+from gps_track import gps_sidecar_path
+from chunked_upload import state_path
+
+# ----------------- CONFIG -----------------
+RETENTION_QUOTA = int(os.getenv("RETENTION_QUOTA", str(16 * 1024 ** 3)))        # bytes of footage
+RETENTION_LOW_WATERMARK = float(os.getenv("RETENTION_LOW_WATERMARK", "0.9"))    # evict down to this share
+RETENTION_MIN_FREE = int(os.getenv("RETENTION_MIN_FREE", str(2 * 1024 ** 3)))   # bytes free on the disk
+RETENTION_INTERVAL = 10    # sec between checks
+RETENTION_BATCH = 100      # candidates fetched per query
+RETENTION_LOCK = os.getenv("RETENTION_LOCK", "/tmp/adas_retention.lock")
+RETENTION_DISK = os.getenv("RETENTION_DISK", os.path.join(PARENT_DIR, "record"))
+# ------------------------------------------
+
+# (kind, uploaded), evicted first to last
+EVICTION_ORDER = [
+    ("segment", True),
+    ("audio", False),
+    ("clip", True),
+    ("segment", False),
+    ("clip", False),
+]
+
+
+class RetentionManager:
+    def __init__(self, index=None, quota=RETENTION_QUOTA, low_watermark=RETENTION_LOW_WATERMARK,
+                 min_free=RETENTION_MIN_FREE, disk=RETENTION_DISK, lock_path=RETENTION_LOCK):
+        self.index = index or get_index()
+        self.quota = quota
+        self.low = int(quota * low_watermark)
+        self.min_free = min_free
+        self.disk = disk
+        self.lock_path = lock_path
+        os.makedirs(disk, exist_ok=True)
+        self.counters = {"checks": 0, "evicted_files": 0, "evicted_bytes": 0, "evicted_not_uploaded": 0}
+
+    def _free(self):
+        return shutil.disk_usage(self.disk).free
+
+    def check(self):
+        """Evict if over quota or short of free space. Returns bytes freed."""
+        self.counters["checks"] += 1
+        used, free = self.index.total_bytes(), self._free()
+        if used <= self.quota and free >= self.min_free:
+            return 0
+        try:
+            lock = open(self.lock_path, "w")
+        except OSError as e:
+            print(f"[RETENTION] Can't open lock {self.lock_path}: {e}")
+            return 0
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0  # another process is evicting
+            return self._evict(used, free)
+
+    def _evict(self, used, free):
+        # free space target leaves one more min_free of headroom for the encoders
+        need = max(used - self.low, 2 * self.min_free - free, 0)
+        freed = 0
+        for kind, uploaded in EVICTION_ORDER:
+            while freed < need:
+                rows = self.index.oldest(kind, uploaded, RETENTION_BATCH)
+                removed = 0
+                for row in rows:
+                    n = self._delete(row, uploaded)
+                    if n is None:
+                        continue
+                    removed += 1
+                    freed += n
+                    if freed >= need:
+                        break
+                if not removed:
+                    break  # nothing (more) deletable in this class
+            if freed >= need:
+                break
+        print(f"[RETENTION] Freed {freed / 1024 ** 2:.0f} MiB "
+              f"(footage {used / 1024 ** 2:.0f} MiB, free {free / 1024 ** 2:.0f} MiB)")
+        return freed
+
+    def _delete(self, row, uploaded):
+        path = row["path"]
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            size = 0
+        except OSError as e:
+            print(f"[RETENTION] Can't delete {path}: {e}")
+            return None
+        self.index.remove(path)
+        for meta in (sidecar_path(path), store_path(path), gps_sidecar_path(path), state_path(path)):
+            try:
+                os.remove(meta)   # detection / GPS metadata and upload resume state go with the file
+            except OSError:
+                pass
+        self.counters["evicted_files"] += 1
+        self.counters["evicted_bytes"] += size
+        if not uploaded:
+            self.counters["evicted_not_uploaded"] += 1
+            print(f"[RETENTION] Out of space, dropping not uploaded {path}")
+        # a deleted row frees its indexed size even if the file was already gone
+        return max(size, row["size_bytes"])
+
+    def run(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[RETENTION] Check failed: {e}")
+            stop_event.wait(RETENTION_INTERVAL)
+
+    def start(self, stop_event=None):
+        t = threading.Thread(target=self.run, args=(stop_event,), daemon=True)
+        t.start()
+        return t
@@ -1,5 +1,8 @@
 import threading, os, time, subprocess
 
+# alert engine and GPS first, so both cameras find them (see alert_engine.py, gps_service.py)
+subprocess.Popen(["python3", "alert_engine.py"])
+subprocess.Popen(["python3", "gps_service.py"])
 subprocess.Popen(["python3", "front_cam_new.py"])
 subprocess.Popen(["python3", "inner_cam_new.py"])
 
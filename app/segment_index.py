@@ -0,0 +1,192 @@
+"""
+Index of recorded segments and their wall-clock time ranges.
+
+Shared by every process that writes or reads footage (camera loops,
+recoder_uploader, clip builder) through one SQLite file in WAL mode, so
+"which files cover [t0, t1] for this camera" is an indexed query instead
+of a directory scan.
+
+    kind     'segment' (continuous recording) or 'clip' (event clip)
+    complete 0 while the encoder is still writing the file
+    sha256   content hash, filled in lazily for the sync manifest
+    uploaded 1 once the server has the file (uploaded or reported present)
+
+The detections table summarises detection_store's per-segment columns:
+one row per (segment, class) with its time span, count and best score,
+so a class / time-range search opens only the segments that matter.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.dirname(BASE_DIR)
+SEGMENT_INDEX_DB = os.getenv("SEGMENT_INDEX_DB", os.path.join(PARENT_DIR, "record", "segments.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    path TEXT PRIMARY KEY,
+    camera TEXT NOT NULL,
+    kind TEXT NOT NULL DEFAULT 'segment',
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 1,
+    size_bytes INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_segments_camera_start ON segments (camera, start_ts);
+CREATE TABLE IF NOT EXISTS detections (
+    path TEXT NOT NULL,
+    camera TEXT NOT NULL,
+    class TEXT NOT NULL,
+    first_ts REAL NOT NULL,
+    last_ts REAL NOT NULL,
+    count INTEGER NOT NULL,
+    max_conf REAL NOT NULL,
+    PRIMARY KEY (path, class)
+);
+CREATE INDEX IF NOT EXISTS idx_detections_class_ts ON detections (class, first_ts);
+"""
+
+# columns added after the first release: (name, definition)
+MIGRATIONS = [
+    ("sha256", "TEXT"),
+    ("uploaded", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+# indexes on migrated columns, created once the columns exist
+POST_MIGRATION_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_segments_retention ON segments (kind, uploaded, complete, start_ts);
+"""
+
+
+class SegmentIndex:
+    def __init__(self, db_path=SEGMENT_INDEX_DB):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False, timeout=10)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.executescript(SCHEMA)
+            cols = {row["name"] for row in self.conn.execute("PRAGMA table_info(segments)")}
+            for name, definition in MIGRATIONS:
+                if name not in cols:
+                    self.conn.execute(f"ALTER TABLE segments ADD COLUMN {name} {definition}")
+            self.conn.executescript(POST_MIGRATION_SCHEMA)
+
+    def add(self, path, camera, start_ts, end_ts, kind="segment", complete=True):
+        """Insert or update one file (e.g. mark an in-progress segment complete)."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        with self.lock, self.conn:
+            self.conn.execute("""
+            INSERT INTO segments (path, camera, kind, start_ts, end_ts, complete, size_bytes, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                start_ts=excluded.start_ts, end_ts=excluded.end_ts,
+                complete=excluded.complete, size_bytes=excluded.size_bytes,
+                sha256=CASE WHEN size_bytes=excluded.size_bytes THEN sha256 ELSE NULL END
+            """, (str(path), camera, kind, start_ts, end_ts, int(complete), size, time.time()))
+
+    def covering(self, camera, t0, t1, kind="segment"):
+        """Files of camera overlapping [t0, t1], oldest first."""
+        with self.lock:
+            return self.conn.execute("""
+            SELECT * FROM segments
+            WHERE camera=? AND kind=? AND start_ts < ? AND end_ts > ?
+            ORDER BY start_ts
+            """, (camera, kind, t1, t0)).fetchall()
+
+    def not_uploaded(self, cameras):
+        """Finished files of the given cameras the server may not have yet, oldest first."""
+        marks = ",".join("?" * len(cameras))
+        with self.lock:
+            return self.conn.execute(f"""
+            SELECT * FROM segments
+            WHERE camera IN ({marks}) AND complete=1 AND uploaded=0
+            ORDER BY start_ts
+            """, tuple(cameras)).fetchall()
+
+    def set_hash(self, path, sha256):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE segments SET sha256=? WHERE path=?", (sha256, str(path)))
+
+    def mark_uploaded(self, paths):
+        with self.lock, self.conn:
+            self.conn.executemany("UPDATE segments SET uploaded=1 WHERE path=?",
+                                  [(str(p),) for p in paths])
+
+    def total_bytes(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM segments").fetchone()[0]
+
+    def oldest(self, kind, uploaded, limit=100):
+        """Oldest finished files of one retention class, for eviction."""
+        with self.lock:
+            return self.conn.execute("""
+            SELECT path, camera, size_bytes FROM segments
+            WHERE kind=? AND uploaded=? AND complete=1
+            ORDER BY start_ts LIMIT ?
+            """, (kind, int(uploaded), limit)).fetchall()
+
+    def get(self, path):
+        with self.lock:
+            return self.conn.execute("SELECT * FROM segments WHERE path=?", (str(path),)).fetchone()
+
+    def remove(self, path):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM segments WHERE path=?", (str(path),))
+            self.conn.execute("DELETE FROM detections WHERE path=?", (str(path),))
+
+    def add_detections(self, path, camera, summary):
+        """Replace the per-class summary of one segment: [(class, first_ts, last_ts, count, max_conf)]."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM detections WHERE path=?", (str(path),))
+            self.conn.executemany("""
+            INSERT INTO detections (path, camera, class, first_ts, last_ts, count, max_conf)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(str(path), camera, *row) for row in summary])
+
+    def detection_segments(self, cls=None, t0=None, t1=None, camera=None, min_conf=0.0):
+        """Summary rows of segments with detections of cls (any if None) in [t0, t1], oldest first."""
+        where, args = ["max_conf >= ?"], [min_conf]
+        if cls is not None:
+            where.append("class = ?")
+            args.append(cls)
+        if t0 is not None:
+            where.append("last_ts >= ?")
+            args.append(t0)
+        if t1 is not None:
+            where.append("first_ts <= ?")
+            args.append(t1)
+        if camera is not None:
+            where.append("camera = ?")
+            args.append(camera)
+        with self.lock:
+            return self.conn.execute(f"""
+            SELECT * FROM detections WHERE {" AND ".join(where)} ORDER BY first_ts
+            """, args).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Process-wide shared index connection."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SegmentIndex()
+    return _index
@@ -0,0 +1,184 @@
+"""
+Event-driven watcher for finished segment files.
+
+On Linux it uses inotify directly (through ctypes, no extra package):
+IN_CREATE reports a segment ffmpeg has just opened, IN_CLOSE_WRITE /
+IN_MOVED_TO report the moment it is finished, so nothing is stat'ed or
+re-globbed. Elsewhere it falls back to polling, which relies on strftime
+file names sorting in time order: only names after the last finished one
+are looked at, and a file counts as finished once a newer one exists or it
+has been idle for POLL_IDLE seconds.
+
+State is bounded either way (one watch per directory / one watermark per
+directory); recovery after a restart is done by reconcile(), which checks
+each file on disk against the caller's DB instead of an in-memory set.
+An inotify queue overflow runs it again, since finished events were lost.
+"""
+
+import os
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+POLL_INTERVAL = 1.0
+POLL_IDLE = 5.0
+MIN_SEGMENT_BYTES = 100
+
+
+def _load_inotify():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, "inotify_init1") else None
+
+
+class SegmentWatcher:
+    """
+    Calls on_open(path, camera) when a segment file appears and
+    on_complete(path, camera) when it has been fully written.
+    """
+
+    def __init__(self, dirs_cameras, on_complete, on_open=None, suffix=".mp4", force_polling=False):
+        # absolute paths: the DB/index rows are read by processes with other cwds
+        self.dirs_cameras = [(os.path.abspath(d), cam) for d, cam in dirs_cameras]
+        self.on_complete = on_complete
+        self.on_open = on_open
+        self.suffix = suffix
+        self.libc = None if force_polling else _load_inotify()
+        # polling watermark: newest finished file name per dir (set by reconcile)
+        self._done_upto = {d: "" for d, _ in self.dirs_cameras}
+        self.is_known = None   # the DB check of the last reconcile(), reused after an overflow
+
+    # ---------------- startup recovery ----------------
+
+    def reconcile(self, is_known, recording=False):
+        """
+        Register finished files that the DB does not know yet (e.g. written
+        while this process was down). Call before the encoders start, when
+        every file on disk is complete; with recording, the newest file of
+        each directory may still be open and is left to its own event.
+        is_known(path) -> bool.
+        """
+        self.is_known = is_known
+        count = 0
+        for d, cam in self.dirs_cameras:
+            names = sorted(n for n in os.listdir(d) if n.endswith(self.suffix))
+            if recording:
+                names = names[:-1]
+            for name in names:
+                path = os.path.join(d, name)
+                self._done_upto[d] = name
+                if not is_known(path):
+                    try:
+                        if os.path.getsize(path) > MIN_SEGMENT_BYTES:
+                            self.on_complete(path, cam)
+                            count += 1
+                    except FileNotFoundError:
+                        continue
+        if count:
+            print(f"[WATCH] Reconciled {count} unregistered segments")
+        return count
+
+    # ---------------- main loop ----------------
+
+    def run(self, stop_event):
+        if self.libc is not None:
+            try:
+                return self._run_inotify(stop_event)
+            except OSError as e:
+                print(f"[WATCH] inotify unavailable ({e}), falling back to polling")
+        return self._run_polling(stop_event)
+
+    def _finished(self, path, cam):
+        try:
+            if os.path.getsize(path) > MIN_SEGMENT_BYTES:
+                self.on_complete(path, cam)
+        except FileNotFoundError:
+            pass
+
+    def _run_inotify(self, stop_event):
+        fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        try:
+            watches = {}
+            for d, cam in self.dirs_cameras:
+                wd = self.libc.inotify_add_watch(fd, os.fsencode(d), IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), f"inotify_add_watch {d}")
+                watches[wd] = (d, cam)
+            print(f"[WATCH] inotify on {', '.join(d for d, _ in self.dirs_cameras)}")
+
+            while not stop_event.is_set():
+                ready, _, _ = select.select([fd], [], [], 1.0)
+                if not ready:
+                    continue
+                try:
+                    buf = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                offset = 0
+                while offset < len(buf):
+                    wd, mask, _, length = EVENT_HEADER.unpack_from(buf, offset)
+                    offset += EVENT_HEADER.size
+                    name = buf[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+                    offset += length
+                    if mask & IN_Q_OVERFLOW:
+                        print("[WATCH] inotify queue overflow, checking the directories")
+                        if self.is_known is not None:
+                            self.reconcile(self.is_known, recording=True)
+                        continue
+                    if mask & IN_ISDIR or wd not in watches or not name.endswith(self.suffix):
+                        continue
+                    d, cam = watches[wd]
+                    path = os.path.join(d, name)
+                    if mask & IN_CREATE:
+                        if self.on_open:
+                            self.on_open(path, cam)
+                    else:
+                        self._finished(path, cam)
+        finally:
+            os.close(fd)
+
+    def _run_polling(self, stop_event):
+        # per dir: name of the newest finished file, and the file being written
+        done_upto = dict(self._done_upto)
+        writing = {d: None for d, _ in self.dirs_cameras}
+        print(f"[WATCH] Polling {', '.join(done_upto)} every {POLL_INTERVAL}s")
+        while not stop_event.is_set():
+            for d, cam in self.dirs_cameras:
+                try:
+                    with os.scandir(d) as it:
+                        names = sorted(e.name for e in it
+                                       if e.name.endswith(self.suffix) and e.name > done_upto[d])
+                except FileNotFoundError:
+                    continue
+                for i, name in enumerate(names):
+                    path = os.path.join(d, name)
+                    newer_exists = i < len(names) - 1
+                    try:
+                        idle = time.time() - os.path.getmtime(path) > POLL_IDLE
+                    except FileNotFoundError:
+                        continue
+                    if newer_exists or idle:
+                        self._finished(path, cam)
+                        done_upto[d] = name
+                        if writing[d] == name:
+                            writing[d] = None
+                    elif writing[d] != name:
+                        writing[d] = name
+                        if self.on_open:
+                            self.on_open(path, cam)
+            stop_event.wait(POLL_INTERVAL)
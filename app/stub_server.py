@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the backend, for testing the device side without the
+real server.
+
+    python3 stub_server.py --port 8083 --fail-rate 0.2 --delay 0.1
+    API_BASE=http://127.0.0.1:8083/api python3 inner_cam_new.py
+
+Speaks HTTP/1.1 keep-alive, stores uploads under --store, and can inject
+503s / latency to exercise the client's retries and timeouts.
+GET /stats returns what it has received.
+
+Also the reference implementation of the resumable chunked upload protocol
+(see chunked_upload.py) and of the manifest sync endpoint (manifest_sync.py).
+Session state lives in --store, so uploads resume across a stub restart too.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubState:
+    def __init__(self, store_dir, fail_rate=0.0, delay=0.0):
+        self.store_dir = store_dir
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.uploads = []
+        self.known = {}        # segmentId -> sha256 of files the "server" has
+        self.events = []
+        self.requests = 0
+        self.failures_injected = 0
+        os.makedirs(store_dir, exist_ok=True)
+
+
+SESSION_RE = re.compile(r"^/api/video/upload/sessions/([0-9a-f]+)(/chunks|/complete)?$")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # set by make_server()
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # ---------------- helpers ----------------
+
+    def _send_json(self, code, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body_to(self, f):
+        """Copy the request body into f without holding it in memory."""
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining > 0:
+            chunk = self.rfile.read(min(65536, remaining))
+            if not chunk:
+                break
+            f.write(chunk)
+            remaining -= len(chunk)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _drain(self):
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining > 0:
+            chunk = self.rfile.read(min(65536, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    # ---------------- chunked sessions ----------------
+
+    def _session_paths(self, upload_id):
+        base = os.path.join(self.state.store_dir, upload_id)
+        return base + ".json", base + ".part"
+
+    def _load_session(self, upload_id):
+        meta_path, part_path = self._session_paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None, part_path
+        return meta, part_path
+
+    def _session_offset(self, part_path):
+        return os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    def _create_session(self):
+        meta = self._read_json()
+        meta["uploadId"] = uuid.uuid4().hex
+        meta["complete"] = False
+        meta_path, part_path = self._session_paths(meta["uploadId"])
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+        open(part_path, "wb").close()
+        self._send_json(201, {"uploadId": meta["uploadId"], "offset": 0})
+
+    def _session_status(self, upload_id):
+        meta, part_path = self._load_session(upload_id)
+        if meta is None:
+            return self._send_json(404, {"error": "unknown upload"})
+        self._send_json(200, {"uploadId": upload_id, "size": meta["size"],
+                              "offset": self._session_offset(part_path),
+                              "complete": meta["complete"]})
+
+    def _put_chunk(self, upload_id):
+        meta, part_path = self._load_session(upload_id)
+        if meta is None:
+            self._drain()
+            return self._send_json(404, {"error": "unknown upload"})
+        offset = self._session_offset(part_path)
+        if int(self.headers.get("Upload-Offset", -1)) != offset:
+            self._drain()
+            return self._send_json(409, {"offset": offset})
+        chunk = self._read_body()
+        if hashlib.sha256(chunk).hexdigest() != self.headers.get("X-Chunk-SHA256"):
+            return self._send_json(422, {"offset": offset, "error": "chunk checksum mismatch"})
+        if offset + len(chunk) > meta["size"]:
+            return self._send_json(416, {"offset": offset, "error": "chunk past end of file"})
+        with open(part_path, "ab") as f:
+            f.write(chunk)
+        self._send_json(200, {"offset": offset + len(chunk)})
+
+    def _complete(self, upload_id):
+        meta, part_path = self._load_session(upload_id)
+        if meta is None:
+            return self._send_json(404, {"error": "unknown upload"})
+        if meta["complete"]:
+            # a retried complete (its response was lost): same answer, recorded once
+            return self._send_json(200, {"id": upload_id, "size": meta["size"]})
+        h = hashlib.sha256()   # not hashlib.file_digest: that needs Python 3.11
+        with open(part_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        if digest != meta["sha256"] or self._session_offset(part_path) != meta["size"]:
+            os.remove(part_path)
+            os.remove(self._session_paths(upload_id)[0])
+            return self._send_json(422, {"error": "file checksum mismatch"})
+        meta["complete"] = True
+        with open(self._session_paths(upload_id)[0], "w") as f:
+            json.dump(meta, f)
+        st = self.state
+        with st.lock:
+            # two completes racing past the check above: the second one records nothing
+            if not any(u["id"] == upload_id for u in st.uploads):
+                st.uploads.append({"id": upload_id, "size": meta["size"], "fileName": meta.get("fileName")})
+                if meta.get("segmentId"):
+                    st.known[meta["segmentId"]] = meta["sha256"]
+        self._send_json(200, {"id": upload_id, "size": meta["size"]})
+
+    def _sync_missing(self):
+        body = self._read_json()
+        st = self.state
+        with st.lock:
+            missing = [s["id"] for s in body.get("segments", [])
+                       if st.known.get(s["id"]) != s.get("sha256")]
+        self._send_json(200, {"missing": missing})
+
+    def _inject(self):
+        """Apply configured latency / failure. True if a 503 was sent."""
+        st = self.state
+        with st.lock:
+            st.requests += 1
+        if st.delay:
+            time.sleep(st.delay)
+        if st.fail_rate and random.random() < st.fail_rate:
+            self._drain()
+            with st.lock:
+                st.failures_injected += 1
+            self._send_json(503, {"error": "injected failure"})
+            return True
+        return False
+
+    # ---------------- routes ----------------
+
+    def do_GET(self):
+        m = SESSION_RE.match(self.path)
+        if m and not m.group(2):
+            return self._session_status(m.group(1))
+        if self.path == "/stats":
+            st = self.state
+            with st.lock:
+                return self._send_json(200, {
+                    "requests": st.requests,
+                    "failures_injected": st.failures_injected,
+                    "uploads": list(st.uploads),
+                    "known": len(st.known),
+                    "events": len(st.events),
+                })
+        self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self._inject():
+            return
+        st = self.state
+
+        if self.path in ("/api/video/upload", "/upload"):
+            upload_id = uuid.uuid4().hex
+            dest = os.path.join(st.store_dir, f"{upload_id}.multipart")
+            with open(dest, "wb") as f:
+                self._body_to(f)
+            size = os.path.getsize(dest)
+            with open(dest, "rb") as f:
+                head = f.read(4096).decode("utf-8", "replace")
+            fields = dict(re.findall(r'name="(segmentId|sha256)"\r\n\r\n([^\r]*)', head))
+            with st.lock:
+                st.uploads.append({"id": upload_id, "size": size})
+                if "segmentId" in fields:
+                    st.known[fields["segmentId"]] = fields.get("sha256")
+            return self._send_json(200, {"id": upload_id, "size": size})
+
+        if self.path == "/api/video/sync/missing":
+            return self._sync_missing()
+
+        if self.path == "/api/video/upload/sessions":
+            return self._create_session()
+
+        m = SESSION_RE.match(self.path)
+        if m and m.group(2) == "/complete":
+            return self._complete(m.group(1))
+
+        if self.path == "/api/driver-events":
+            event = self._read_json()
+            with st.lock:
+                st.events.append(event)
+            return self._send_json(200, {"id": len(st.events), **event})
+
+        if self.path == "/check_models":
+            self._read_json()
+            return self._send_json(200, {"update_required": False})
+
+        self._drain()
+        self._send_json(404, {"error": "not found"})
+
+
+    def do_PUT(self):
+        if self._inject():
+            return
+        m = SESSION_RE.match(self.path)
+        if m and m.group(2) == "/chunks":
+            return self._put_chunk(m.group(1))
+        self._drain()
+        self._send_json(404, {"error": "not found"})
+
+
+def make_server(host="127.0.0.1", port=8083, store_dir="stub_store", fail_rate=0.0, delay=0.0):
+    """Build (not start) a stub server; port=0 picks a free port."""
+    handler = type("BoundStubHandler", (StubHandler,), {"state": StubState(store_dir, fail_rate, delay)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Local stand-in backend")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8083)
+    ap.add_argument("--store", default="stub_store")
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--delay", type=float, default=0.0)
+    args = ap.parse_args()
+
+    server = make_server(args.host, args.port, args.store, args.fail_rate, args.delay)
+    print(f"[STUB] Listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -2,13 +2,56 @@ import queue
 import threading
 import time
 import os
-from local_functions_new import save_video, save_audio_from_buffer, upload_to_server, create_driver_event, send_driver_event
-
-# Queue lar
+from datetime import datetime
+from local_functions_new import save_video, audio_for_segment, upload_to_server, create_driver_event, send_driver_event, LOCAL_PATH
+from api_request import headers as api_headers
+from http_client import get_client
+from upload_scheduler import get_scheduler, UploadJob
+from segment_index import get_index
+from event_clips import ClipBuilder
+from manifest_sync import sync, segment_id
+from retention import RetentionManager
+from detections import write_sidecar
+from detection_store import get_store
+
+# Queue lar (upload navbati scheduler ichida: event segmentlari birinchi, tezlik cheklangan)
 video_queue = queue.Queue()
 event_queue = queue.Queue()
+scheduler = get_scheduler()
+segment_index = get_index()
+
+# Upload retry: chunked upload saves progress, so each retry continues where it stopped.
+# After UPLOAD_MAX_ATTEMPTS the file is left to the next manifest sync.
+UPLOAD_MAX_ATTEMPTS = 8
+UPLOAD_RETRY_BASE = 5
+UPLOAD_RETRY_CAP = 300
+
+# Manifest sync: serverda yo‘q segmentlarni aniqlab faqat ularni yuborish
+SYNC_INTERVAL = 600
+STATS_INTERVAL = 300    # sec between metrics log lines
+local_cameras = set()           # shu process yozadigan kameralar (OUTSIDE / INSIDE)
+sync_wakeup = threading.Event()  # yangi kamera yoki reconnect bo‘lganda darhol sync
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def submit_upload(output_file, start_time, end_time, format, camera_type, attempt=0):
+    start_ts = datetime.strptime(start_time, TIME_FORMAT).timestamp()
+    end_ts = datetime.strptime(end_time, TIME_FORMAT).timestamp()
+    scheduler.submit(UploadJob(output_file, output_file, start_ts, end_ts, camera_type,
+                               payload=(start_time, end_time, format, camera_type), attempt=attempt))
 
 
+def upload_clip(path, camera_type, t0, t1, label):
+    """Tayyor event klipini upload navbatiga qo‘yish (event bo‘lgani uchun birinchi ketadi)."""
+    submit_upload(path, datetime.fromtimestamp(t0).strftime(TIME_FORMAT),
+                  datetime.fromtimestamp(t1).strftime(TIME_FORMAT), "P720", camera_type)
+
+
+clip_builder = ClipBuilder(on_ready=upload_clip)
+
+# Disk kvotasi: avval serverda bor oddiy segmentlar o‘chiriladi (retention.py)
+retention = RetentionManager(disk=LOCAL_PATH)
 
 
 def video_worker():
@@ -17,61 +60,146 @@ def video_worker():
         if task is None:
             break
         try:
-            buffer, output_file, fps, start_time, end_time, format, camera_type, audio_file = task
+            buffer, output_file, fps, start_time, end_time, format, camera_type, with_audio, detections = task
             try:
                 # Agar video fayl allaqachon mavjud bo‘lsa, qayta saqlash shart emas
                 if not os.path.exists(output_file):
-                    if audio_file:
-                        save_audio_from_buffer(audio_file)
-                    save_video(buffer, output_file, fps, audio_file)
-                    if audio_file and os.path.exists(audio_file):
-                        os.remove(audio_file)
+                    # aynan shu segment vaqtidagi audio ring buffer'dan to‘g‘ridan-to‘g‘ri ffmpeg'ga (WAV yo‘q)
+                    audio = audio_for_segment(start_time, end_time, TIME_FORMAT) if with_audio else None
+                    save_video(buffer, output_file, fps, audio=audio)
                     print(f"[INFO] Video saved: {output_file}")
+                    if detections is not None:
+                        # kadrlarga chizilmagan detection'lar segment yonida (detections.py)
+                        write_sidecar(output_file, detections)
+                        # qidiruv uchun ustunli saqlash + indeks (detection_store.py)
+                        get_store().add_segment(output_file, camera_type, detections)
+                    segment_index.add(output_file, camera_type,
+                                      datetime.strptime(start_time, TIME_FORMAT).timestamp(),
+                                      datetime.strptime(end_time, TIME_FORMAT).timestamp())
                 else:
                     print(f"[INFO] Video already exists: {output_file}")
 
-                # Endi faqat upload qismida retry bo‘ladi
-                upload_to_server(output_file, start_time, end_time, format, camera_type)
-                print(f"[INFO] Video uploaded: {output_file}")
+                submit_upload(output_file, start_time, end_time, format, camera_type)
 
             except Exception as e:
-                print(f"[ERROR] Upload failed: {e}")
-                # Faqat uploadni retry qilish uchun qayta qo‘yiladi
-                video_queue.put((None, output_file, fps, start_time, end_time, format, camera_type, None))
-                time.sleep(5)
+                print(f"[ERROR] Video save failed: {e}")
 
         finally:
             video_queue.task_done()
 
 
+def upload_worker():
+    link_down = False
+    while True:
+        job = scheduler.get()
+        start_time, end_time, format, camera_type = job.payload
+        row = segment_index.get(job.path)
+        if row is not None and row["uploaded"]:
+            continue  # sync allaqachon serverda borligini aniqlagan
+        if not os.path.exists(job.path):
+            print(f"[INFO] {job.path} evicted before upload")
+            continue  # disk to‘lganda retention o‘chirib yuborgan
+        try:
+            upload_to_server(job.path, start_time, end_time, format, camera_type, bandwidth=scheduler,
+                             segment_id=segment_id(camera_type, job.path))
+            segment_index.mark_uploaded([job.path])
+            print(f"[INFO] Video uploaded: {job.path}")
+            if link_down:
+                link_down = False
+                sync_wakeup.set()  # reconnect: nima yetishmayotganini serverdan so‘raymiz
+        except Exception as e:
+            link_down = True
+            print(f"[ERROR] Upload failed ({job.attempt + 1}/{UPLOAD_MAX_ATTEMPTS}): {e}")
+            if job.attempt + 1 < UPLOAD_MAX_ATTEMPTS:
+                # Faqat uploadni retry qilish uchun qayta qo‘yiladi (navbatni bloklamasdan)
+                delay = min(UPLOAD_RETRY_CAP, UPLOAD_RETRY_BASE * 2 ** job.attempt)
+                job.attempt += 1
+                timer = threading.Timer(delay, scheduler.submit, args=(job,))
+                timer.daemon = True
+                timer.start()
+            else:
+                print(f"[ERROR] Giving up on {job.path}, next sync will retry it")
+
+
 def event_worker():
     while True:
         task = event_queue.get()
         if task is None:
             break
         try:
-            event = task
+            event, event_ts, payload = task
             try:
-                payload = create_driver_event(event=event)
+                if payload is None:
+                    payload = create_driver_event(event=event, event_ts=event_ts)
                 send_driver_event(payload)
                 print(f"[INFO] Event sent: {event}")
             except Exception as e:
                 print(f"[ERROR] Event worker failed: {e}")
-                event_queue.put(task)  # Retry
+                # same payload (same globalEventId) again, so the server can drop a duplicate
+                event_queue.put((event, event_ts, payload))  # Retry
                 time.sleep(5)
         finally:
             event_queue.task_done()
 
 
+def sync_worker():
+    """
+    Restart / reconnect dan keyin: manifest bo‘yicha serverda yo‘q fayllarnigina yuborish.
+    Yarim qolgan uploadlar .upload.json dagi offsetdan davom etadi.
+    """
+    while True:
+        sync_wakeup.wait(SYNC_INTERVAL)
+        sync_wakeup.clear()
+        if not local_cameras:
+            continue
+        try:
+            todo, _ = sync(local_cameras, headers=api_headers)
+            for entry in todo:
+                if entry["path"] not in scheduler:
+                    submit_upload(entry["path"],
+                                  datetime.fromtimestamp(entry["startTime"]).strftime(TIME_FORMAT),
+                                  datetime.fromtimestamp(entry["endTime"]).strftime(TIME_FORMAT),
+                                  "P720", entry["camera"])
+        except Exception as e:
+            print(f"[ERROR] Sync failed: {e}")
+
+
+def stats_worker():
+    """Pool / retry counters in the log, so they are visible without a debugger."""
+    while True:
+        time.sleep(STATS_INTERVAL)
+        print(f"[HTTP] {get_client().summary()}")
+        print(f"[SCHED] {scheduler.stats()}")
+
+
+def register_camera(camera_type):
+    if camera_type and camera_type not in local_cameras:
+        local_cameras.add(camera_type)
+        sync_wakeup.set()
+
+
 # Worker threadlarni ishga tushirish
 threading.Thread(target=video_worker, daemon=True).start()
+threading.Thread(target=upload_worker, daemon=True).start()
 threading.Thread(target=event_worker, daemon=True).start()
+threading.Thread(target=sync_worker, daemon=True).start()
+threading.Thread(target=stats_worker, daemon=True).start()
+retention.start()
 
 
 # Wrapper funksiyalar (oldingi save_upload_in_background va save_event_in_background o‘rniga)
-def enqueue_video(buffer, output_file, fps, start_time, end_time, format, camera_type, audio_file=None):
-    video_queue.put((buffer, output_file, fps, start_time, end_time, format, camera_type, audio_file))
-
-
-def enqueue_event(event):
-    event_queue.put(event)
\ No newline at end of file
+def enqueue_video(buffer, output_file, fps, start_time, end_time, format, camera_type, with_audio=False,
+                  detections=None):
+    register_camera(camera_type)
+    video_queue.put((buffer, output_file, fps, start_time, end_time, format, camera_type, with_audio,
+                     detections))
+
+
+def enqueue_event(event, camera_type=None):
+    # shu vaqt atrofidagi segmentlar upload navbatida oldinga o‘tadi
+    now = time.time()
+    scheduler.note_event(now, camera_type)
+    if camera_type:
+        register_camera(camera_type)
+        clip_builder.request(now, camera_type, label=event)
+    event_queue.put((event, now, None))   # payload gets GPS at the moment of the event, not of sending
\ No newline at end of file
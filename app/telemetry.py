@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Vehicle telemetry from the CAN bus (J1939, or OBD-II on light vehicles).
+
+A reader thread per process listens on the bus through python-can and
+decodes only the configured signals (SIGNALS, CAN_SIGNALS); the kernel
+filters the rest out (can_filters on their PGNs), so the thread wakes up
+a few dozen times a second at most. Every decoded value goes into a
+snapshot dict {name: (value, timestamp)} that is replaced, never
+modified: the thread builds the next dict and swaps the reference, so
+readers take `telemetry.snapshot` without a lock and building an event
+payload is a dictionary read, never bus I/O. A short history per signal
+(one value per HISTORY_STEP) answers at(name, t) for events whose payload
+is built long after they were raised.
+
+SocketCAN lets every process open the bus on its own, so there is no
+service process: front and inner each have their own reader.
+
+Test without a truck on a virtual interface:
+
+    sudo ip link add dev vcan0 type vcan && sudo ip link set up vcan0
+    CAN_CHANNEL=vcan0 python telemetry.py --simulate &    # sends J1939 frames
+    CAN_CHANNEL=vcan0 python telemetry.py                 # prints the snapshot
+"""
+
+import os
+import sys
+import time
+import bisect
+import struct
+import threading
+from collections import deque
+
+# ----------------- CONFIG -----------------
+CAN_INTERFACE = os.getenv("CAN_INTERFACE", "socketcan")
+CAN_CHANNEL = os.getenv("CAN_CHANNEL", "can0")
+CAN_PROTOCOL = os.getenv("CAN_PROTOCOL", "j1939")     # j1939 | obd
+MAX_AGE = 10.0             # sec; older values are not reported
+HISTORY_STEP = 1.0         # sec between kept values of a signal
+HISTORY_LEN = 3600         # kept values per signal (an hour at HISTORY_STEP)
+REOPEN_DELAY = 5           # sec
+OBD_POLL = 1.0             # sec between OBD-II requests
+OBD_REQUEST_ID = 0x7DF
+OBD_RESPONSE_IDS = range(0x7E8, 0x7F0)
+
+# J1939: name -> (PGN, first byte, bytes, scale, offset)
+SIGNALS = {
+    "fuel_level": (65276, 1, 1, 0.4, 0.0),              # DD,   SPN 96,   %
+    "def_level": (65110, 0, 1, 0.4, 0.0),               # AT1T1I, SPN 1761, %
+    "wheel_speed": (65265, 1, 2, 1 / 256, 0.0),         # CCVS, SPN 84,   km/h
+    "total_distance": (65248, 4, 4, 0.125, 0.0),        # VD,   SPN 245,  km
+    "total_distance_hr": (65217, 0, 4, 0.005, 0.0),     # VDHR, SPN 917,  km
+    "engine_speed": (61444, 3, 2, 0.125, 0.0),          # EEC1, SPN 190,  rpm
+}
+# OBD-II mode 01: name -> (PID, bytes, scale, offset)
+OBD_SIGNALS = {
+    "fuel_level": (0x2F, 1, 100 / 255, 0.0),            # %
+    "wheel_speed": (0x0D, 1, 1.0, 0.0),                 # km/h
+    "engine_speed": (0x0C, 2, 0.25, 0.0),               # rpm
+}
+CAN_SIGNALS = [s for s in os.getenv("CAN_SIGNALS", ",".join(SIGNALS)).split(",") if s]
+# ------------------------------------------
+
+PGN_MASK = 0x3FFFF
+
+
+def pgn_of(can_id):
+    """PGN of a 29-bit J1939 identifier (destination address dropped for PDU1)."""
+    pgn = (can_id >> 8) & PGN_MASK
+    if (pgn >> 8) & 0xFF < 240:
+        pgn &= 0x3FF00
+    return pgn
+
+
+def _raw(data, start, length):
+    chunk = bytes(data[start:start + length])
+    if len(chunk) < length:
+        return None
+    raw = int.from_bytes(chunk, "little")
+    # the top of each range means "error" / "not available" (J1939-71)
+    if raw > {1: 0xFA, 2: 0xFAFF, 4: 0xFAFFFFFF}[length]:
+        return None
+    return raw
+
+
+def j1939_decoder(names):
+    """(decode(can_id, data) -> [(name, value)], can_filters) for the given signals."""
+    by_pgn = {}
+    for name in names:
+        pgn, start, length, scale, offset = SIGNALS[name]
+        by_pgn.setdefault(pgn, []).append((name, start, length, scale, offset))
+
+    def decode(can_id, data):
+        out = []
+        for name, start, length, scale, offset in by_pgn.get(pgn_of(can_id), ()):
+            raw = _raw(data, start, length)
+            if raw is not None:
+                out.append((name, raw * scale + offset))
+        return out
+
+    filters = [{"can_id": pgn << 8, "can_mask": PGN_MASK << 8, "extended": True} for pgn in by_pgn]
+    return decode, filters
+
+
+def obd_decoder(names):
+    by_pid = {OBD_SIGNALS[n][0]: (n,) + OBD_SIGNALS[n][1:] for n in names if n in OBD_SIGNALS}
+
+    def decode(can_id, data):
+        # single frame: [length, 0x41, pid, A, B, ...]
+        if len(data) < 4 or data[1] != 0x41 or data[2] not in by_pid:
+            return []
+        name, length, scale, offset = by_pid[data[2]]
+        if len(data) < 3 + length:
+            return []
+        return [(name, int.from_bytes(bytes(data[3:3 + length]), "big") * scale + offset)]
+
+    filters = [{"can_id": i, "can_mask": 0x7FF, "extended": False} for i in OBD_RESPONSE_IDS]
+    return decode, filters
+
+
+class Telemetry:
+    def __init__(self, interface=CAN_INTERFACE, channel=CAN_CHANNEL, protocol=CAN_PROTOCOL, names=CAN_SIGNALS):
+        self.interface = interface
+        self.channel = channel
+        self.protocol = protocol
+        if protocol == "obd":
+            self.decode, self.filters = obd_decoder(names)
+            self.pids = [OBD_SIGNALS[n][0] for n in names if n in OBD_SIGNALS]
+        else:
+            self.decode, self.filters = j1939_decoder(names)
+            self.pids = []
+        self.snapshot = {}      # name -> (value, timestamp); replaced, never modified
+        self.history = {}       # name -> deque of (timestamp, value), newest last
+        self.stop_event = threading.Event()
+        self.counters = {"frames": 0, "decoded": 0, "errors": 0}
+
+    # ---------------- reader thread ----------------
+
+    def handle(self, can_id, data, t):
+        values = self.decode(can_id, data)
+        self.counters["frames"] += 1
+        if values:
+            snap = dict(self.snapshot)
+            for name, value in values:
+                snap[name] = (value, t)
+                self._remember(name, value, t)
+            self.snapshot = snap   # single reference swap: readers see the old or the new dict
+            self.counters["decoded"] += len(values)
+
+    def _remember(self, name, value, t):
+        hist = self.history.get(name)
+        if hist is None:
+            hist = self.history[name] = deque(maxlen=HISTORY_LEN)
+        # the newest entry follows the bus; older ones stay HISTORY_STEP apart
+        if len(hist) >= 2 and t - hist[-2][0] < HISTORY_STEP:
+            hist[-1] = (t, value)
+        else:
+            hist.append((t, value))
+
+    def _poll(self, bus):
+        import can
+        while not self.stop_event.wait(OBD_POLL):
+            for pid in self.pids:
+                try:
+                    bus.send(can.Message(arbitration_id=OBD_REQUEST_ID, is_extended_id=False,
+                                         data=[0x02, 0x01, pid, 0, 0, 0, 0, 0]))
+                except can.CanError:
+                    self.counters["errors"] += 1
+
+    def run(self):
+        import can
+        while not self.stop_event.is_set():
+            try:
+                bus = can.Bus(interface=self.interface, channel=self.channel, can_filters=self.filters)
+            except (OSError, can.CanError) as e:
+                print(f"[TELEMETRY] Can't open {self.interface}:{self.channel}: {e}")
+                self.stop_event.wait(REOPEN_DELAY)
+                continue
+            print(f"[TELEMETRY] Reading {self.protocol} on {self.channel}")
+            if self.pids:
+                threading.Thread(target=self._poll, args=(bus,), daemon=True).start()
+            try:
+                while not self.stop_event.is_set():
+                    msg = bus.recv(timeout=1.0)
+                    if msg is not None and not msg.is_error_frame:
+                        self.handle(msg.arbitration_id, msg.data, msg.timestamp or time.time())
+            except (OSError, can.CanError) as e:
+                self.counters["errors"] += 1
+                print(f"[TELEMETRY] {self.channel} read failed: {e}")
+            finally:
+                bus.shutdown()
+            self.stop_event.wait(REOPEN_DELAY)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    # ---------------- readers ----------------
+
+    def value(self, name, max_age=MAX_AGE, now=None):
+        """Latest value of a signal, None if never seen or older than max_age."""
+        entry = self.snapshot.get(name)
+        if entry is None or (now or time.time()) - entry[1] > max_age:
+            return None
+        return entry[0]
+
+    def at(self, name, t=None):
+        """
+        (value, age in sec) of a signal at wall-clock time t (default now):
+        the last value at or before t, else the first one after it, however
+        old. (None, None) if never seen.
+        """
+        t = time.time() if t is None else t
+        hist = tuple(self.history.get(name, ()))
+        if not hist:
+            return None, None
+        i = bisect.bisect_right(hist, (t, float("inf"))) - 1
+        ts, value = hist[max(i, 0)]
+        return value, abs(t - ts)
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """
+    Process-wide telemetry reader, started on first use. The camera loops
+    call it at startup, so the bus is open before the first event.
+    """
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = Telemetry().start()
+    return _telemetry
+
+
+# ---------------- testing on vcan ----------------
+
+def simulate(channel=CAN_CHANNEL, interface=CAN_INTERFACE):
+    """Send the J1939 signals of a truck cruising at ~90 km/h, for vcan tests."""
+    import can
+    bus = can.Bus(interface=interface, channel=channel)
+    odo, fuel = 123456.0, 62.0
+    try:
+        while True:
+            odo += 0.025       # km per 1 s at 90 km/h
+            fuel -= 0.001
+            frames = {
+                65265: b"\xff" + struct.pack("<H", int(90 * 256)) + b"\xff" * 5,
+                65276: b"\xff" + bytes([int(fuel / 0.4)]) + b"\xff" * 6,
+                65110: bytes([int(35 / 0.4)]) + b"\xff" * 7,
+                65248: b"\xff" * 4 + struct.pack("<I", int(odo / 0.125)),
+                65217: struct.pack("<I", int(odo / 0.005)) + b"\xff" * 4,
+                61444: b"\xff" * 3 + struct.pack("<H", int(1400 / 0.125)) + b"\xff" * 3,
+            }
+            for pgn, data in frames.items():
+                # priority 6, source address 0x00 (engine)
+                bus.send(can.Message(arbitration_id=(6 << 26) | (pgn << 8), is_extended_id=True, data=data))
+            time.sleep(1.0)
+    finally:
+        bus.shutdown()
+
+
+def main():
+    if "--simulate" in sys.argv:
+        simulate()
+        return
+    telemetry = get_telemetry()
+    while True:
+        time.sleep(1)
+        now = time.time()
+        print(f"[TELEMETRY] {telemetry.counters} "
+              + " ".join(f"{n}={v:.1f} ({now - t:.1f}s)" for n, (v, t) in sorted(telemetry.snapshot.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+ByteTrack-style multi-object tracker with Kalman prediction.
+
+The front camera runs its detector only on keyframes; in between, the
+tracker's constant-velocity Kalman filter carries every box forward, so
+votes, distances and overlays keep updating at the analysis rate for
+roughly half the detector calls (or less).
+
+On a keyframe (update):
+  1. all tracks are predicted to the frame time
+  2. high-score detections (>= HIGH_CONF) are matched to tracks by IoU,
+     greedily, same class only
+  3. low-score detections (LOW_CONF .. HIGH_CONF) are matched to the
+     tracks still unmatched; they keep a track alive through blur or
+     partial occlusion, but never start one
+  4. unmatched high-score detections start new tracks
+  5. tracks not matched for MAX_LOST seconds are dropped
+
+A track is reported once it has MIN_HITS matches (one-frame false
+positives never vote) and while it was matched less than COAST seconds
+ago. Track ids are stable, so callers can keep per-object state (box
+history for closing speed, per-id voting).
+
+State per track is [cx, cy, w, h, vcx, vcy, vw, vh] with velocities per
+second; all tracks are predicted and updated together as numpy batches.
+"""
+
+from collections import deque
+
+import numpy as np
+
+# ----------------- CONFIG -----------------
+HIGH_CONF = 0.5
+LOW_CONF = 0.1          # detector should be run with conf=LOW_CONF
+MATCH_IOU = 0.3
+MIN_HITS = 2
+COAST = 0.5             # sec a track is still reported without a match
+MAX_LOST = 1.5          # sec before an unmatched track is dropped
+HISTORY_LEN = 30        # (t, box) of the last matches kept per track
+# ------------------------------------------
+
+# noise relative to box height per REF_DT step (as in ByteTrack / DeepSORT at 30 fps);
+# the filter itself runs on real time stamps, velocities in px / s
+STD_POS = 1 / 20
+STD_VEL = 1 / 160
+REF_DT = 1 / 30
+
+_H = np.hstack([np.eye(4), np.zeros((4, 4))])
+
+
+def iou_matrix(a, b):
+    """IoU of every box in a (N,4) with every box in b (M,4), xyxy."""
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def greedy_match(iou, threshold):
+    """[(row, col)] pairs, best IoU first, each row and column used once."""
+    pairs = []
+    if not iou.size:
+        return pairs
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols])
+    used_r, used_c = set(), set()
+    for k in order:
+        r, c = int(rows[k]), int(cols[k])
+        if r in used_r or c in used_c:
+            continue
+        used_r.add(r)
+        used_c.add(c)
+        pairs.append((r, c))
+    return pairs
+
+
+def _xyxy_to_z(boxes):
+    w = boxes[:, 2] - boxes[:, 0]
+    h = boxes[:, 3] - boxes[:, 1]
+    return np.stack([boxes[:, 0] + w / 2, boxes[:, 1] + h / 2, w, h], axis=1)
+
+
+def _z_to_xyxy(z):
+    cx, cy, w, h = z[:, 0], z[:, 1], np.maximum(z[:, 2], 1), np.maximum(z[:, 3], 1)
+    return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+
+class Track:
+    __slots__ = ("id", "cls", "score", "hits", "last_seen", "history")
+
+    def __init__(self, track_id, cls, score, t, box):
+        self.id = track_id
+        self.cls = cls
+        self.score = score
+        self.hits = 1
+        self.last_seen = t
+        self.history = deque([(t, box)], maxlen=HISTORY_LEN)
+
+
+class TrackView:
+    """What callers get: a track with its box at the current frame."""
+    __slots__ = ("id", "cls", "score", "box", "velocity", "predicted", "history")
+
+    def __init__(self, track, box, velocity, predicted):
+        self.id = track.id
+        self.cls = track.cls
+        self.score = track.score
+        self.box = box
+        self.velocity = velocity      # (vcx, vcy, vw, vh) px / s
+        self.predicted = predicted    # True if not matched on this frame
+        self.history = track.history
+
+
+class Tracker:
+    def __init__(self, high_conf=HIGH_CONF, low_conf=LOW_CONF, match_iou=MATCH_IOU,
+                 min_hits=MIN_HITS, coast=COAST, max_lost=MAX_LOST):
+        self.high_conf = high_conf
+        self.low_conf = low_conf
+        self.match_iou = match_iou
+        self.min_hits = min_hits
+        self.coast = coast
+        self.max_lost = max_lost
+        self.tracks = []
+        self.x = np.zeros((0, 8))        # state per track
+        self.P = np.zeros((0, 8, 8))     # covariance per track
+        self.t = None
+        self.next_id = 1
+        self.counters = {"keyframes": 0, "predicted": 0, "tracks_started": 0}
+
+    # ---------------- Kalman ----------------
+
+    def _predict(self, t):
+        dt = 0.0 if self.t is None else max(0.0, t - self.t)
+        self.t = t
+        if not len(self.tracks) or dt == 0:
+            return
+        F = np.eye(8)
+        F[:4, 4:] = np.eye(4) * dt
+        h = self.x[:, 3]
+        std = np.concatenate([np.repeat((STD_POS * h)[:, None], 4, axis=1),
+                              np.repeat((STD_VEL / REF_DT * h)[:, None], 4, axis=1)], axis=1)
+        # random walk: variance grows linearly with the time since the last step
+        Q = np.einsum("ni,ij->nij", std ** 2 * (dt / REF_DT) + 1e-6, np.eye(8))
+        self.x = self.x @ F.T
+        self.P = F @ self.P @ F.T + Q
+
+    def _update(self, idx, z):
+        """Kalman update of tracks idx with measurements z (M,4)."""
+        x, P = self.x[idx], self.P[idx]
+        r = (STD_POS * z[:, 3]) ** 2 + 1e-6
+        R = np.einsum("n,ij->nij", r, np.eye(4))
+        S = _H @ P @ _H.T + R
+        K = P @ _H.T @ np.linalg.inv(S)
+        y = z - x[:, :4]
+        self.x[idx] = x + np.einsum("nij,nj->ni", K, y)
+        self.P[idx] = (np.eye(8) - K @ _H) @ P
+
+    def _add(self, cls, score, t, box):
+        z = _xyxy_to_z(box[None])[0]
+        h = max(z[3], 1.0)
+        std = np.array([STD_POS * h] * 4 + [10 * STD_VEL / REF_DT * h] * 4)
+        self.tracks.append(Track(self.next_id, cls, score, t, tuple(box)))
+        self.x = np.vstack([self.x, np.concatenate([z, np.zeros(4)])[None]])
+        self.P = np.concatenate([self.P, np.diag(std ** 2)[None]])
+        self.next_id += 1
+        self.counters["tracks_started"] += 1
+
+    # ---------------- public API ----------------
+
+    def update(self, boxes, scores, classes, t):
+        """Keyframe: detections (xyxy (N,4), scores (N,), class names) at time t."""
+        self.counters["keyframes"] += 1
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=float).reshape(-1)
+        classes = np.asarray(classes, dtype=object).reshape(-1)
+        keep = scores >= self.low_conf
+        boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+        self._predict(t)
+
+        track_cls = np.array([trk.cls for trk in self.tracks], dtype=object)
+        track_boxes = _z_to_xyxy(self.x[:, :4]) if self.tracks else np.zeros((0, 4))
+        matched = {}   # track index -> detection index
+        free = np.arange(len(self.tracks))
+        for high in (True, False):
+            dets = np.flatnonzero((scores >= self.high_conf) if high else (scores < self.high_conf))
+            if not len(dets) or not len(free):
+                continue
+            iou = iou_matrix(track_boxes[free], boxes[dets])
+            iou[track_cls[free][:, None] != classes[dets][None, :]] = 0
+            for r, c in greedy_match(iou, self.match_iou):
+                matched[int(free[r])] = int(dets[c])
+            free = np.array([i for i in free if i not in matched], dtype=int)
+
+        if matched:
+            idx = np.fromiter(matched.keys(), dtype=int)
+            self._update(idx, _xyxy_to_z(boxes[list(matched.values())]))
+            for i, d in matched.items():
+                trk = self.tracks[i]
+                trk.hits += 1
+                trk.score = float(scores[d])
+                trk.last_seen = t
+                trk.history.append((t, tuple(float(v) for v in boxes[d])))
+
+        used = set(matched.values())
+        for d in np.flatnonzero(scores >= self.high_conf):
+            if int(d) not in used:
+                self._add(classes[d], float(scores[d]), t, boxes[d])
+
+        alive = [i for i, trk in enumerate(self.tracks) if t - trk.last_seen <= self.max_lost]
+        if len(alive) < len(self.tracks):
+            self.tracks = [self.tracks[i] for i in alive]
+            self.x, self.P = self.x[alive], self.P[alive]
+        return self._views(t)
+
+    def predict(self, t):
+        """Frame between keyframes: tracks carried forward to time t."""
+        self.counters["predicted"] += 1
+        self._predict(t)
+        return self._views(t)
+
+    def _views(self, t):
+        if not self.tracks:
+            return []
+        boxes = _z_to_xyxy(self.x[:, :4])
+        out = []
+        for i, trk in enumerate(self.tracks):
+            if trk.hits < self.min_hits or t - trk.last_seen > self.coast:
+                continue
+            out.append(TrackView(trk, tuple(float(v) for v in boxes[i]),
+                                 tuple(float(v) for v in self.x[i, 4:]), trk.last_seen != t))
+        return out
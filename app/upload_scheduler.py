@@ -0,0 +1,355 @@
+"""
+Priority- and bandwidth-aware upload scheduling.
+
+ - segments overlapping a driver event (EVENT_PRE_ROLL before .. EVENT_POST_ROLL
+   after the event) go ahead of routine footage, also when the event arrives
+   after the segment was queued
+ - a token bucket caps upload bandwidth so uploads leave room for event posts
+   and live streaming
+ - the cap follows measured throughput: probe up while the link keeps up,
+   drop to UPLOAD_LINK_SHARE of what the link delivers when it doesn't
+ - every decision is counted in stats()
+
+Events are shared between processes through a small append-only file
+(UPLOAD_EVENTS_FILE): the camera processes write it, recoder_uploader reads it.
+"""
+
+import os
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from collections import deque
+
+# ----------------- CONFIG -----------------
+UPLOAD_RATE_INITIAL = int(os.getenv("UPLOAD_RATE_INITIAL", str(256 * 1024)))   # bytes/sec
+UPLOAD_RATE_MIN = int(os.getenv("UPLOAD_RATE_MIN", str(32 * 1024)))
+UPLOAD_RATE_MAX = int(os.getenv("UPLOAD_RATE_MAX", str(4 * 1024 * 1024)))
+UPLOAD_LINK_SHARE = float(os.getenv("UPLOAD_LINK_SHARE", "0.7"))  # of measured link, rest for events/stream
+RATE_PROBE_UP = 1.1        # multiplicative increase while the link keeps up
+RATE_KEEPS_UP = 0.9        # achieved >= 90% of cap -> link keeps up
+RATE_FALLS_BEHIND = 0.7    # achieved < 70% of cap  -> link is the bottleneck
+THROUGHPUT_EWMA = 0.3
+
+EVENT_PRE_ROLL = 30        # sec of footage before an event that counts as "event"
+EVENT_POST_ROLL = 30
+EVENT_HORIZON = 6 * 3600   # events older than this are forgotten
+UPLOAD_EVENTS_FILE = os.getenv("UPLOAD_EVENTS_FILE", "/tmp/adas_upload_events.log")
+EVENTS_FILE_MAX = 64 * 1024
+EVENTS_REFRESH = 1.0       # sec between re-reads of the shared events file
+# ------------------------------------------
+
+PRIORITY_EVENT = 0
+PRIORITY_ROUTINE = 1
+PRIORITY_NAMES = {PRIORITY_EVENT: "event", PRIORITY_ROUTINE: "routine"}
+
+
+class TokenBucket:
+    """Byte token bucket. consume() blocks; a request larger than the burst is
+    let through and paid back as debt, so big chunks are never starved."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+            self.burst = float(rate)
+
+    def consume(self, n):
+        """Wait until n bytes may be sent. Returns seconds waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                need = min(n, self.burst)
+                if self.tokens >= need:
+                    self.tokens -= n
+                    return waited
+                delay = (need - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class AdaptiveLimiter(TokenBucket):
+    """Token bucket whose rate tracks measured upload throughput."""
+
+    def __init__(self, rate=UPLOAD_RATE_INITIAL, rate_min=UPLOAD_RATE_MIN, rate_max=UPLOAD_RATE_MAX):
+        super().__init__(rate)
+        self.rate_min = rate_min
+        self.rate_max = rate_max
+        self.throughput = None  # EWMA bytes/sec of the link itself
+        self.waited = 0.0
+        self.sent = 0
+        self.active = 0         # transfers in flight, they share the link
+
+    def consume(self, n):
+        waited = super().consume(n)
+        self.waited += waited
+        self.sent += n
+        return waited
+
+    def report(self, nbytes, seconds):
+        """Feed one transfer's size and wire time (excluding bucket waits)."""
+        if seconds <= 0 or nbytes <= 0:
+            return
+        # each of `active` parallel transfers gets about 1/active of the link
+        achieved = nbytes / seconds * max(1, self.active)
+        if self.throughput is None:
+            self.throughput = achieved
+        else:
+            self.throughput += THROUGHPUT_EWMA * (achieved - self.throughput)
+
+        rate = self.rate
+        if achieved >= RATE_KEEPS_UP * rate:
+            rate = rate * RATE_PROBE_UP
+        elif achieved < RATE_FALLS_BEHIND * rate:
+            rate = self.throughput * UPLOAD_LINK_SHARE
+        rate = max(self.rate_min, min(self.rate_max, rate))
+        if rate != self.rate:
+            self.set_rate(rate)
+
+
+class UploadJob:
+    __slots__ = ("key", "path", "start_ts", "end_ts", "camera", "payload", "priority", "attempt")
+
+    def __init__(self, key, path, start_ts, end_ts, camera=None, payload=None, attempt=0):
+        self.key = key
+        self.path = path
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.camera = camera
+        self.payload = payload
+        self.priority = PRIORITY_ROUTINE
+        self.attempt = attempt
+
+
+class UploadScheduler:
+    def __init__(self, limiter=None, events_file=UPLOAD_EVENTS_FILE):
+        self.limiter = limiter or AdaptiveLimiter()
+        self.events_file = events_file
+        self._events = deque(maxlen=1024)   # (ts, camera)
+        self._events_pos = 0
+        self._events_ino = None
+        self._events_checked = 0.0
+
+        self._listeners = []                # fn(ts, camera) for every new event
+        self.camera_aliases = {}            # camera name in the shared file -> ours (e.g. OUTSIDE -> cam1)
+        self._unannounced = []              # events the listeners haven't seen yet
+        self._heap = []                     # (priority, seq, job)
+        self._queued = {}                   # key -> job
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+        self.counters = {
+            "submitted": 0,
+            "dispatched_event": 0,
+            "dispatched_routine": 0,
+            "promoted": 0,
+            "events_noted": 0,
+            "bytes_sent": 0,
+        }
+
+    # ---------------- events ----------------
+
+    def note_event(self, ts=None, camera=None):
+        """Mark an event; queued and future segments around ts jump the queue."""
+        # rounded like the shared file, so re-reading our own line is a no-op
+        ts = round(time.time() if ts is None else ts, 3)
+        if self.events_file:
+            try:
+                with open(self.events_file, "a") as f:
+                    f.write(f"{ts:.3f} {camera or '*'}\n")
+                self._compact_events_file()
+            except OSError as e:
+                print(f"[SCHED] Can't write events file: {e}")
+        with self._cond:
+            self._add_event(ts, camera)
+        self._announce()
+
+    def add_listener(self, fn):
+        """fn(ts, camera) is called for every new event, local or from the shared file."""
+        self._listeners.append(fn)
+
+    def refresh_events(self):
+        with self._cond:
+            self._refresh_events()
+        self._announce()
+
+    def _announce(self):
+        """Call the listeners outside the lock: they may block or call back into us."""
+        with self._cond:
+            events, self._unannounced = self._unannounced, []
+        for ts, camera in events:
+            for fn in self._listeners:
+                fn(ts, camera)
+
+    def _add_event(self, ts, camera):
+        self._events.append((ts, camera))
+        self.counters["events_noted"] += 1
+        if self._listeners:
+            self._unannounced.append((ts, camera))
+        for job in self._queued.values():
+            if job.priority != PRIORITY_EVENT and self._overlaps(job, ts, camera):
+                job.priority = PRIORITY_EVENT
+                heapq.heappush(self._heap, (job.priority, next(self._seq), job))
+                self.counters["promoted"] += 1
+        self._cond.notify_all()
+
+    def _compact_events_file(self):
+        """Keep the shared file small: rewrite with recent events only."""
+        if os.path.getsize(self.events_file) < EVENTS_FILE_MAX:
+            return
+        cutoff = time.time() - EVENT_HORIZON
+        keep = []
+        with open(self.events_file) as f:
+            for line in f:
+                try:
+                    if float(line.split()[0]) >= cutoff:
+                        keep.append(line)
+                except (ValueError, IndexError):
+                    continue
+        tmp = self.events_file + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(keep[-512:])
+        os.replace(tmp, self.events_file)
+
+    def _refresh_events(self):
+        """Pick up events written by other processes."""
+        now = time.monotonic()
+        if not self.events_file or now - self._events_checked < EVENTS_REFRESH:
+            return
+        self._events_checked = now
+        try:
+            st = os.stat(self.events_file)
+            if st.st_ino != self._events_ino or st.st_size < self._events_pos:
+                self._events_ino, self._events_pos = st.st_ino, 0
+            if st.st_size == self._events_pos:
+                return
+            with open(self.events_file) as f:
+                f.seek(self._events_pos)
+                lines = f.readlines()
+                self._events_pos = f.tell()
+        except OSError:
+            return
+        known = set(self._events)
+        for line in lines:
+            try:
+                ts_str, cam = line.split()
+                ev = (float(ts_str), None if cam == "*" else self.camera_aliases.get(cam, cam))
+            except ValueError:
+                continue
+            if ev not in known and ev[0] >= time.time() - EVENT_HORIZON:
+                self._add_event(*ev)
+
+    @staticmethod
+    def _overlaps(job, ts, camera):
+        if camera is not None and job.camera is not None and camera != job.camera:
+            return False
+        return job.start_ts <= ts + EVENT_POST_ROLL and job.end_ts >= ts - EVENT_PRE_ROLL
+
+    def priority_for(self, job):
+        with self._cond:
+            self._refresh_events()
+            for ts, camera in self._events:
+                if self._overlaps(job, ts, camera):
+                    return PRIORITY_EVENT
+        return PRIORITY_ROUTINE
+
+    # ---------------- queue ----------------
+
+    def submit(self, job):
+        job.priority = self.priority_for(job)
+        with self._cond:
+            self._queued[job.key] = job
+            heapq.heappush(self._heap, (job.priority, next(self._seq), job))
+            self.counters["submitted"] += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Highest-priority job (FIFO within a priority), or None on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.refresh_events()
+            with self._cond:
+                while self._heap:
+                    prio, _, job = heapq.heappop(self._heap)
+                    # stale entry left behind by a promotion, or already taken
+                    if self._queued.get(job.key) is not job or prio != job.priority:
+                        continue
+                    del self._queued[job.key]
+                    self.counters[f"dispatched_{PRIORITY_NAMES[prio]}"] += 1
+                    print(f"[SCHED] -> {PRIORITY_NAMES[prio]} {job.key} "
+                          f"(queued {len(self._queued)}, cap {self.limiter.rate / 1024:.0f} KiB/s)")
+                    return job
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(min(EVENTS_REFRESH, remaining) if remaining else EVENTS_REFRESH)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._queued)
+
+    def __contains__(self, key):
+        with self._cond:
+            return key in self._queued
+
+    # ---------------- bandwidth ----------------
+
+    def throttle(self, nbytes):
+        """Block until nbytes may go on the wire."""
+        return self.limiter.consume(nbytes)
+
+    @contextmanager
+    def transfer(self):
+        """Wrap one upload so parallel uploads are measured as one link."""
+        with self._cond:
+            self.limiter.active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.limiter.active -= 1
+
+    def report(self, nbytes, seconds):
+        self.limiter.report(nbytes, seconds)
+        with self._cond:
+            self.counters["bytes_sent"] += nbytes
+
+    def stats(self):
+        with self._cond:
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for job in self._queued.values():
+                queued[PRIORITY_NAMES[job.priority]] += 1
+            return dict(self.counters,
+                        queued=queued,
+                        rate_cap=self.limiter.rate,
+                        link_throughput=self.limiter.throughput,
+                        throttled_seconds=self.limiter.waited,
+                        active_transfers=self.limiter.active)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide shared scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = UploadScheduler()
+    return _scheduler
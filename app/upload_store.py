@@ -0,0 +1,258 @@
+"""
+Upload bookkeeping for recoder_uploader (the `files` table).
+
+ - WAL mode: readers never block the writer and vice versa
+ - (status, created_at, next_attempt_at) index, so "next pending files
+   that are due" stays an index range scan however many months of uploaded
+   rows pile up
+ - one writer thread owns the write connection; writes from any thread are
+   queued and committed together in batched transactions (one fsync per
+   batch, not per statement)
+ - readers get one connection per thread
+ - claim() moves a row pending -> uploading inside the writer, so a file
+   is only ever handed to one uploader, however many workers there are
+ - a failed upload goes back to pending with its own next_attempt_at
+   (exponential backoff per file), claims whose worker died are reaped
+ - a file retention deleted before it was uploaded ends up evicted, which
+   nothing moves back to pending
+"""
+
+import time
+import queue
+import random
+import sqlite3
+import threading
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import Future
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT UNIQUE NOT NULL,
+    camera TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    status TEXT NOT NULL, -- pending / uploading / uploaded / error / evicted
+    retries INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    uploaded_at TEXT
+);
+"""
+
+# after MIGRATIONS: next_attempt_at is one of them
+INDEXES = """
+DROP INDEX IF EXISTS idx_files_status_created;
+CREATE INDEX IF NOT EXISTS idx_files_status_created_next ON files (status, created_at, next_attempt_at);
+"""
+
+# columns added after the first release: (name, definition)
+MIGRATIONS = [
+    ("claimed_at", "REAL"),
+    ("next_attempt_at", "REAL NOT NULL DEFAULT 0"),
+]
+
+WRITE_BATCH_MAX = 256      # statements per transaction
+WRITE_BATCH_WINDOW = 0.05  # sec to wait for more writes before committing
+
+
+def _now_iso():
+    return datetime.utcnow().isoformat()
+
+
+class UploadStore:
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._queue = queue.Queue()
+
+        conn = self._connect()
+        with conn:
+            conn.executescript(SCHEMA)
+            cols = {row["name"] for row in conn.execute("PRAGMA table_info(files)")}
+            for name, definition in MIGRATIONS:
+                if name not in cols:
+                    conn.execute(f"ALTER TABLE files ADD COLUMN {name} {definition}")
+        conn.executescript(INDEXES)
+        conn.isolation_level = None  # the writer manages its own transactions
+        self._writer = threading.Thread(target=self._write_loop, args=(conn,), daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---------------- writer ----------------
+
+    def _submit(self, fn):
+        """Queue fn(conn) for the writer thread. Returns a Future of its result."""
+        fut = Future()
+        self._queue.put((fn, fut))
+        return fut
+
+    def _write_loop(self, conn):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + WRITE_BATCH_WINDOW
+            while len(batch) < WRITE_BATCH_MAX:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # finish this batch, then stop
+                    break
+                batch.append(item)
+            self._run_batch(conn, batch)
+        conn.close()
+
+    @staticmethod
+    def _run_batch(conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, fut in batch:
+                # savepoint per statement: one bad write doesn't roll back the others
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((fut, fn(conn), None))
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO op")
+                    results.append((fut, None, e))
+                conn.execute("RELEASE op")
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"[DB] Write batch of {len(batch)} failed: {e}")
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        for fut, result, err in results:
+            if err is not None:
+                fut.set_exception(err)
+            else:
+                fut.set_result(result)
+
+    # ---------------- reads ----------------
+
+    @property
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def is_registered(self, path):
+        return self._reader.execute("SELECT 1 FROM files WHERE path=?", (str(path),)).fetchone() is not None
+
+    def pending(self, limit=500):
+        """Oldest pending files that are due for an attempt: [(path, camera), ...]."""
+        return [tuple(row) for row in self._reader.execute("""
+            SELECT path, camera FROM files
+            WHERE status='pending' AND next_attempt_at <= ?
+            ORDER BY created_at LIMIT ?
+            """, (time.time(), limit))]
+
+    def counts(self):
+        return {row["status"]: row["n"] for row in self._reader.execute(
+            "SELECT status, COUNT(*) AS n FROM files GROUP BY status")}
+
+    # ---------------- writes ----------------
+
+    def add_file(self, path, camera, size_bytes):
+        def op(conn):
+            cur = conn.execute("""
+            INSERT OR IGNORE INTO files (path, camera, created_at, size_bytes, status)
+            VALUES (?, ?, ?, ?, 'pending')
+            """, (str(path), camera, _now_iso(), size_bytes))
+            if cur.rowcount:
+                print(f"[DB] Added {path} ({camera})")
+            return cur.rowcount > 0
+        return self._submit(op)
+
+    def claim(self, path):
+        """pending -> uploading. True if this caller got the file (blocks until committed)."""
+        def op(conn):
+            return conn.execute("""
+            UPDATE files SET status='uploading', claimed_at=? WHERE path=? AND status='pending'
+            """, (time.time(), str(path))).rowcount > 0
+        return self._submit(op).result()
+
+    def mark_uploaded(self, path):
+        return self._submit(lambda conn: conn.execute("""
+        UPDATE files SET status='uploaded', uploaded_at=?, last_error=NULL, claimed_at=NULL WHERE path=?
+        """, (_now_iso(), str(path))).rowcount)
+
+    def mark_error(self, path, errmsg):
+        return self._submit(lambda conn: conn.execute("""
+        UPDATE files SET status='error', retries=retries+1, last_error=?, uploaded_at=NULL, claimed_at=NULL
+        WHERE path=?
+        """, (errmsg, str(path))).rowcount)
+
+    def mark_evicted(self, path):
+        """The file is gone from disk: final, sync and retries leave it alone."""
+        return self._submit(lambda conn: conn.execute("""
+        UPDATE files SET status='evicted', last_error='evicted before upload', claimed_at=NULL
+        WHERE path=?
+        """, (str(path),)).rowcount)
+
+    def retry_later(self, path, errmsg, base, cap):
+        """
+        Failed upload: back to pending, next attempt after a jittered
+        exponential delay (base * 2^retries, at most cap). Future of the delay.
+        """
+        def op(conn):
+            row = conn.execute("SELECT retries FROM files WHERE path=?", (str(path),)).fetchone()
+            retries = row["retries"] if row is not None else 0
+            delay = min(cap, base * 2 ** min(retries, 16)) * random.uniform(0.5, 1.0)
+            conn.execute("""
+            UPDATE files SET status='pending', retries=retries+1, last_error=?,
+                             next_attempt_at=?, claimed_at=NULL
+            WHERE path=?
+            """, (errmsg, time.time() + delay, str(path)))
+            return delay
+        return self._submit(op)
+
+    def mark_pending(self, path):
+        return self._submit(lambda conn: conn.execute("""
+        UPDATE files SET status='pending' WHERE path=? AND status='error'
+        """, (str(path),)).rowcount)
+
+    def touch_claims(self, paths):
+        """Heartbeat for claims whose upload is still running."""
+        now = time.time()
+        return self._submit(lambda conn: conn.executemany("""
+        UPDATE files SET claimed_at=? WHERE path=? AND status='uploading'
+        """, [(now, str(p)) for p in paths]).rowcount)
+
+    def reap_stale_claims(self, max_age):
+        """Claims not refreshed for max_age seconds (worker died) go back to pending."""
+        return self._submit(lambda conn: conn.execute("""
+        UPDATE files SET status='pending', claimed_at=NULL
+        WHERE status='uploading' AND (claimed_at IS NULL OR claimed_at < ?)
+        """, (time.time() - max_age,)).rowcount)
+
+    def release_claims(self):
+        """After a crash/restart nobody is uploading: claims go back to pending."""
+        return self._submit(lambda conn: conn.execute("""
+        UPDATE files SET status='pending', claimed_at=NULL WHERE status='uploading'
+        """).rowcount)
+
+    def flush(self):
+        """Wait until every write queued so far is committed."""
+        self._submit(lambda conn: None).result()
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()